@@ -12,7 +12,6 @@ import re
 from pathlib import Path
 from string import Formatter
 from bs4 import BeautifulSoup
-from kokoro_onnx import Kokoro
 from ebooklib import ITEM_DOCUMENT, epub
 from pydub import AudioSegment
 from pick import pick
@@ -23,7 +22,7 @@ from PySide6.QtWidgets import (
 )
 
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QFileDialog
-from PySide6.QtCore import Qt, QThread, Signal
+from PySide6.QtCore import Qt, QObject, QThread, Signal, Slot
 
 # Change working directory to the script's directory
 current_file_path = os.path.abspath(__file__)
@@ -34,8 +33,49 @@ from PySide6.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QLabel, QFileDialog,
     QComboBox, QLineEdit, QProgressBar, QVBoxLayout, QWidget, QHBoxLayout
 )
-from audiblez import main  # Ensure audiblez.py is importable
+from audiblez import main, load_kokoro, Cancelled, strfdelta  # Ensure audiblez.py is importable
 from pathlib import Path
+import threading
+
+
+class ConversionWorker(QObject):
+    """Runs main in a QThread, emitting its progress as signals that Qt delivers on the UI thread."""
+    progress = Signal(int)
+    status = Signal(str)
+    finished = Signal()
+    cancelled = Signal()
+    error = Signal(str)
+
+    def __init__(self, kokoro, file_path, lang, voice, speed):
+        super().__init__()
+        self.kokoro = kokoro
+        self.file_path = file_path
+        self.lang = lang
+        self.voice = voice
+        self.speed = speed
+        self.cancel = threading.Event()
+
+    @Slot()
+    def run(self):
+        try:
+            main(self.kokoro, self.file_path, self.lang, self.voice, False, self.speed,
+                 on_event=self.on_event, cancel=self.cancel)
+            self.finished.emit()
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+
+    def on_event(self, event):
+        if 'progress' in event:
+            self.progress.emit(int(event['progress'] * 100))
+        if event['event'] == 'chunk_done':
+            self.status.emit(f"Chapter {event['chapter']}: chunk {event['chunk']}/{event['chunks']}, "
+                             f"{strfdelta(event['eta_seconds'])} remaining")
+        elif event['event'] == 'chapter_done':
+            self.status.emit(f"Chapter {event['chapter']} written to {event['file']} "
+                             f"({event['bytes'] / 1024 / 1024:.1f} MB)")
+
 
 class AudiblezGUI(QMainWindow):
     def __init__(self):
@@ -46,8 +86,7 @@ class AudiblezGUI(QMainWindow):
         if not Path('kokoro-v0_19.onnx').exists() or not Path('voices.json').exists():
             QMessageBox.critical(self, "Error", "kokoro-v0_19.onnx and voices.json must be in the current directory.")
             sys.exit(1)
-        self.kokoro = Kokoro('kokoro-v0_19.onnx', 'voices.json')
-        self.kokoro.sess.set_providers(['CUDAExecutionProvider', 'CPUExecutionProvider'])
+        self.kokoro = load_kokoro('kokoro-v0_19.onnx', 'voices.json')
         
         # Get voices
         self.voices = list(self.kokoro.get_voices())
@@ -91,6 +130,9 @@ class AudiblezGUI(QMainWindow):
         # Conversion Button
         self.convert_button = QPushButton("Start Conversion")
         self.convert_button.clicked.connect(self.start_conversion)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_conversion)
+        self.cancel_button.setEnabled(False)
         
         # Progress Bar
         self.progress = QProgressBar()
@@ -101,12 +143,17 @@ class AudiblezGUI(QMainWindow):
         layout.addLayout(voice_layout)
         layout.addLayout(speed_layout)
         layout.addWidget(self.convert_button)
+        layout.addWidget(self.cancel_button)
         layout.addWidget(self.progress)
         
         # Set central widget
         container = QWidget()
         container.setLayout(layout)
         self.setCentralWidget(container)
+
+        # Set by start_conversion
+        self.conversion_thread = None
+        self.worker = None
     
     def browse_file(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select EPUB File", "", "EPUB Files (*.epub)")
@@ -127,12 +174,54 @@ class AudiblezGUI(QMainWindow):
             self.statusBar().showMessage("EPUB file does not exist.")
             return
         
-        try:
-            main(self.kokoro, file_path, lang, voice, False, speed)
-            self.progress.setValue(100)
-            self.statusBar().showMessage("Conversion completed successfully.")
-        except Exception as e:
-            self.statusBar().showMessage(f"Error: {str(e)}")
+        # main runs for as long as the book takes, so it runs in a thread to keep the window responsive
+        self.progress.setValue(0)
+        self.convert_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.conversion_thread = QThread()
+        self.worker = ConversionWorker(self.kokoro, file_path, lang, voice, speed)
+        self.worker.moveToThread(self.conversion_thread)
+        self.conversion_thread.started.connect(self.worker.run)
+        self.worker.progress.connect(self.progress.setValue)
+        self.worker.status.connect(self.statusBar().showMessage)
+        self.worker.finished.connect(self.on_finished)
+        self.worker.cancelled.connect(self.on_cancelled)
+        self.worker.error.connect(self.on_error)
+        for ended in (self.worker.finished, self.worker.cancelled, self.worker.error):
+            ended.connect(self.conversion_thread.quit)
+        self.conversion_thread.finished.connect(self.worker.deleteLater)
+        self.conversion_thread.start()
+
+    def cancel_conversion(self):
+        # the worker stops after the chunk being synthesized
+        if self.worker is not None:
+            self.worker.cancel.set()
+        self.cancel_button.setEnabled(False)
+        self.statusBar().showMessage("Cancelling after the current chunk...")
+
+    def on_finished(self):
+        self.progress.setValue(100)
+        self.statusBar().showMessage("Conversion completed successfully.")
+        self.on_ended()
+
+    def on_cancelled(self):
+        self.statusBar().showMessage("Conversion cancelled, starting it again resumes where it stopped.")
+        self.on_ended()
+
+    def on_error(self, message):
+        self.statusBar().showMessage(f"Error: {message}")
+        self.on_ended()
+
+    def on_ended(self):
+        self.convert_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def closeEvent(self, event):
+        if self.conversion_thread is not None and self.conversion_thread.isRunning():
+            self.worker.cancel.set()
+            self.conversion_thread.quit()
+            self.conversion_thread.wait()
+        event.accept()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -8,34 +8,165 @@ import sys
 import time
 import shutil
 import subprocess
-import soundfile as sf
 import ebooklib
-import warnings
 import re
+import math
+import os
+import csv
+import json
+import struct
+import hashlib
+import functools
+import sqlite3
+import threading
+import collections
+import contextlib
+import urllib.error
+import urllib.request
+import multiprocessing
+import concurrent.futures
+import posixpath
+import types
+import zipfile
 from pathlib import Path
 from string import Formatter
-from bs4 import BeautifulSoup
-from kokoro_onnx import Kokoro
+from urllib.parse import unquote
+from lxml import etree
 from ebooklib import epub
-from pydub import AudioSegment
-from pick import pick
 
+# numpy, soundfile, onnxruntime and kokoro_onnx (with the phonemizer stack) take most of a second to import,
+# so they are imported where they are used, like the server and package metadata modules:
+# --help, argument errors and --server do not need them.
 
-def main(kokoro, file_path, lang, voice, pick_manually, speed):
+DEFAULT_MODEL = 'kokoro-v0_19.onnx'
+SAMPLE_RATE = 24000
+MAX_CHUNK_CHARS = 300  # keeps each chunk's phonemes under Kokoro's 510 token context
+SENTENCE_PAUSE = 0.15  # seconds of silence between chunks of the same paragraph
+PARAGRAPH_PAUSE = 0.6  # seconds of silence after the last chunk of a paragraph
+# Abbreviations whose period does not end a sentence, lowercase and without the period
+ABBREVIATIONS = ('capt', 'col', 'dr', 'fr', 'gen', 'gov', 'hon', 'jr', 'lt', 'messrs', 'mlle', 'mme', 'mr', 'mrs', 'ms',
+                 'mt', 'mx', 'prof', 'rev', 'sen', 'sgt', 'sr', 'st', 'vs')
+INTERMEDIATE_FORMATS = ('wav', 'flac', 'ogg')  # of the chapter files, which soundfile picks by file extension
+DEFAULT_CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'audiblez'
+STREAM_FORMATS = ('wav', 'pcm', 'hls')
+STREAM_PREFETCH_SECONDS = 20  # audio synthesized ahead of playback when streaming
+STREAM_RAMP_SENTENCES = 4  # the first sentences of a stream are synthesized one at a time, to start playing sooner
+HLS_SEGMENT_SECONDS = 2  # short, as a player needs a segment or two before it starts
+PHONEME_CACHE_MAX_BYTES = 64 * 1024 * 1024
+AUDIO_CACHE_MAX_MB = 2048  # about 6 hours of 24 kHz float32 audio
+CACHE_EVICT_TO = 0.9  # fraction of the cache size kept after an eviction
+CACHE_EVICT_BATCH = 1024
+SERVER_PORT = 7850
+# Options of a local run that a job submitted with --server cannot honour, as (option, argparse dest)
+SERVER_IGNORED_OPTIONS = [
+    ('--pick', 'pick'), ('--report', 'report'), ('--workers', 'workers'), ('--share-model', 'share_model'),
+    ('--threads', 'threads'), ('--model', 'model'), ('--metrics', 'metrics'), ('--trace', 'trace'),
+    ('--cache-dir', 'cache_dir'), ('--no-cache', 'no_cache'), ('--cache-size', 'cache_size'),
+    ('--onnx-config', 'onnx_config'), ('--inter-op-threads', 'inter_op_threads'), ('--execution-mode', 'execution_mode'),
+    ('--graph-optimization', 'graph_optimization'), ('--no-memory-arena', 'memory_arena'),
+    ('--no-memory-pattern', 'memory_pattern'), ('--no-model-cache', 'optimized_model_cache'),
+]
+HTML_CONTENT_TAGS = ['title', 'p', 'h1', 'h2', 'h3', 'h4']
+PARALLEL_EXTRACTION_MIN_CHAPTERS = 8
+SESSION_DEFAULTS = dict(
+    intra_op_threads=None,  # ONNX Runtime default: one per physical core
+    inter_op_threads=None,
+    execution_mode='sequential',
+    graph_optimization='all',
+    memory_arena=True,
+    memory_pattern=True,
+    optimized_model_cache=True,
+)
+EXECUTION_MODES = {'sequential': 'ORT_SEQUENTIAL', 'parallel': 'ORT_PARALLEL'}  # onnxruntime.ExecutionMode
+GRAPH_OPTIMIZATION_LEVELS = {  # onnxruntime.GraphOptimizationLevel
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+# Dynamic quantization of these ops holds most of Kokoro's weights; Conv is left in float, ConvInteger kernels are
+# slower than float Conv on most CPUs.
+QUANTIZED_OP_TYPES = ['MatMul', 'LSTM', 'Attention']
+ETA_SMOOTHING_SECONDS = 600  # time constant of the smoothed throughput behind the ETA
+NARRATION_CHARS_PER_SECOND = 15  # characters of narrated audio per second at speed 1.0
+CALIBRATION_TEXT = ('It was the best of times, it was the worst of times, it was the age of wisdom, '
+                    'it was the age of foolishness, it was the epoch of belief, it was the epoch of incredulity.')
+DOCUMENT_KINDS = ('chapter', 'front', 'back', 'notes', 'index')
+# EPUB 3 structural semantics (epub:type) of landmarks and EPUB 2 guide types; 'matter' is front or back by position
+LANDMARK_KINDS = {
+    'bodymatter': 'chapter', 'text': 'chapter', 'chapter': 'chapter', 'part': 'chapter', 'prologue': 'chapter',
+    'epilogue': 'chapter', 'frontmatter': 'front', 'backmatter': 'back', 'appendix': 'back', 'index': 'index',
+    'endnotes': 'notes', 'footnotes': 'notes', 'rearnotes': 'notes', 'notes': 'notes',
+    'cover': 'matter', 'titlepage': 'matter', 'title-page': 'matter', 'halftitlepage': 'matter',
+    'copyright-page': 'matter', 'copyright': 'matter', 'dedication': 'matter', 'epigraph': 'matter',
+    'toc': 'matter', 'loi': 'matter', 'lot': 'matter', 'acknowledgments': 'matter', 'acknowledgements': 'matter',
+    'colophon': 'matter', 'bibliography': 'matter', 'glossary': 'matter',
+}
+TOC_LABEL_KINDS = [
+    ('notes', r'(end|foot)?notes?'),
+    ('index', r'index'),
+    ('matter', r'(table of )?contents|cover|title( page)?|half title|copyright.*|dedication|epigraph|'
+               r'acknowledge?ments?|about the (author|authors|publisher)|also by.*|(other )?books by.*|'
+               r'bibliography|glossary|colophon|references|further reading|praise for.*'),
+]
+FILE_NAME_KINDS = [
+    ('notes', {'note', 'notes', 'endnote', 'endnotes', 'footnote', 'footnotes', 'rearnotes'}),
+    ('index', {'index'}),
+    ('front', {'fm', 'frontmatter'}),
+    ('back', {'bm', 'backmatter'}),
+    ('matter', {'cover', 'title', 'titlepage', 'halftitle', 'titleverso', 'copyright', 'dedication', 'dedi',
+                'epigraph', 'contents', 'toc', 'nav', 'navigation', 'also', 'ack', 'acknowledgments',
+                'acknowledgements', 'glossary', 'bibliography', 'bibliographygroup', 'colophon', 'imprint'}),
+]
+
+
+def main(kokoro, file_path, lang, voice, pick_manually, speed, phoneme_cache=None, audio_cache=None,
+         workers=1, threads=None, include=(), report_only=False, metrics_path=None, share_model=False,
+         intermediate_format='wav', on_event=None, cancel=None):
+    """
+    Convert a book to chapter files and an .m4b, reporting progress to on_event(event) as event dicts:
+    book, chapter_started, chunk_done (with progress from 0 to 1 and eta_seconds), chapter_done (with the bytes
+    written), m4b, then done or cancelled. Events come from the calling thread, also when chapters run in worker
+    processes; print_event is the command line's. cancel, a threading.Event, is checked between chunks: once it
+    is set the chunk being synthesized is finished and Cancelled is raised, with the workers left healthy and the
+    chapters written so far kept for the next run to resume from.
+    """
+    import soundfile as sf
+    run_start = time.time()
+    metrics.reset()
     filename = Path(file_path).name
-    with warnings.catch_warnings():
-        book = epub.read_epub(file_path)
-    title = book.get_metadata('DC', 'title')[0][0]
-    creator = book.get_metadata('DC', 'creator')[0][0]
-    intro = f'{title} by {creator}'
-    print(intro)
-    print('Found Chapters:', [c.get_name() for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT])
-    if pick_manually:
-        chapters = pick_chapters(book)
-    else:
-        chapters = find_chapters(book)
-    print('Selected chapters:', [c.get_name() for c in chapters])
-    texts = extract_texts(chapters)
+    with metrics.time('parse'):
+        book, title, creator = read_book(file_path)
+    with book:  # the report reads the documents that are not narrated
+        intro = f'{title} by {creator}'
+        print(intro)
+        print('Found Chapters:', [c.get_name() for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT])
+        if pick_manually:
+            chapters = pick_chapters(book)
+        else:
+            with metrics.time('parse'):
+                chapters = find_chapters(book, include=include)
+        print('Selected chapters:', [c.get_name() for c in chapters])
+        with metrics.time('extract'):
+            texts = extract_texts(chapters)
+        if report_only:
+            if isinstance(kokoro, ModelFiles):
+                kokoro = kokoro.load()
+            with metrics.time('calibrate'):
+                chars_per_second = measure_chars_per_second(kokoro, voice, speed, lang) * max(workers, 1)
+            print_document_report(classify_documents(book), chapters, texts, chars_per_second, speed)
+            return
+        manifest = RunManifest(filename.replace('.epub', '.manifest.sqlite'))
+        chapter_mp3_files, jobs = plan_chapters(filename, texts, intro, voice, speed, lang, manifest, intermediate_format)
+        pooled = workers > 1 and len(jobs) > 1
+        if jobs and not pooled and isinstance(kokoro, ModelFiles):
+            kokoro = kokoro.load()
+        # Nothing to synthesize needs no estimate, and workers not sharing the model have no model here to measure
+        chars_per_second = None
+        if jobs and not isinstance(kokoro, ModelFiles):
+            with metrics.time('calibrate'):
+                chars_per_second = measure_chars_per_second(kokoro, voice, speed, lang) * (workers if pooled else 1)
+        print_document_report(classify_documents(book), chapters, texts, chars_per_second, speed)
     has_ffmpeg = shutil.which('ffmpeg') is not None
     if not has_ffmpeg:
         print('\033[91m' + 'ffmpeg not found. Please install ffmpeg to create mp3 and m4b audiobook files.' + '\033[0m')
@@ -44,55 +175,1215 @@ def main(kokoro, file_path, lang, voice, pick_manually, speed):
     print(f'Total characters: {total_chars:,}')
     print('Total words:', len(' '.join(texts).split(' ')))
 
+    encoder = ChapterEncoder() if has_ffmpeg else None
+
+    job_chars = sum(len(text) for _, _, text in jobs)
+    chapter_chars = {i: len(text) for i, _, text in jobs}
+    done_chars = {}
+    throughput = ThroughputEstimate()
+
+    def progress(event, chars):
+        """Add the progress of the book and its ETA to a chunk_done or chapter_done event."""
+        throughput.update(chars - done_chars.get(event['chapter'], 0))
+        done_chars[event['chapter']] = chars
+        done = sum(done_chars.values())
+        return dict(event, progress=round(done / job_chars, 4) if job_chars else 1.0,
+                    eta_seconds=round(throughput.eta(job_chars - done), 1))
+
+    def emit(event):
+        if event['event'] == 'chunk_done':
+            event = progress(event, chapter_chars[event['chapter']] * event['chunk'] // event['chunks'])
+        if on_event is not None:
+            on_event(event)
+
+    emit(dict(event='book', title=title, author=creator, chapters=len(jobs), total_chars=job_chars))
+    chapter_metrics = []
+    synthesis_start = time.time()
+    if pooled:
+        results = synthesize_in_pool(kokoro, jobs, voice, speed, lang, workers, threads, phoneme_cache, audio_cache,
+                                     manifest, share_model, emit, cancel)
+    else:
+        results = synthesize_serially(kokoro, jobs, voice, speed, lang, phoneme_cache, audio_cache, manifest,
+                                      emit, cancel)
+    try:
+        for i, chapter_filename, text, delta_seconds in results:
+            chapter_bytes = Path(chapter_filename).stat().st_size
+            emit(progress(dict(event='chapter_done', chapter=i, file=chapter_filename, chars=len(text),
+                               seconds=round(delta_seconds, 3), bytes=chapter_bytes), len(text)))
+            chapter_metrics.append(dict(chapter=i, file=chapter_filename, characters=len(text),
+                                        seconds=round(delta_seconds, 3),
+                                        audio_seconds=round(sf.info(chapter_filename).duration, 3),
+                                        bytes=chapter_bytes))
+            if encoder is not None:
+                encoder.submit(chapter_filename)
+    except Cancelled:
+        if encoder is not None:
+            encoder.executor.shutdown(cancel_futures=True)
+        emit(dict(event='cancelled'))
+        raise
+    synthesis_seconds = time.time() - synthesis_start
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f'Peak memory usage: {rss:,.0f} MB')
+    if phoneme_cache is not None:
+        print(f'Phoneme cache: {phoneme_cache.hits:,} hits, {phoneme_cache.misses:,} misses')
+    if audio_cache is not None:
+        print(f'Audio cache: {audio_cache.hits:,} hits, {audio_cache.misses:,} misses')
+    if has_ffmpeg:
+        create_m4b(chapter_mp3_files, filename, title, creator, encoder.encoded_files(chapter_mp3_files))
+        m4b_filename = filename.replace('.epub', '.m4b')
+        if Path(m4b_filename).exists():
+            emit(dict(event='m4b', file=m4b_filename, bytes=Path(m4b_filename).stat().st_size))
+
+    report = dict(book=str(file_path), title=title, author=creator, voice=voice, lang=lang, speed=speed,
+                  workers=workers, started_at=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run_start)),
+                  characters=job_chars, **metrics.report(time.time() - run_start, synthesis_seconds),
+                  chapters=chapter_metrics,
+                  caches={name: dict(hits=cache.hits, misses=cache.misses)
+                          for name, cache in (('phonemes', phoneme_cache), ('audio', audio_cache)) if cache is not None})
+    print_metrics(report)
+    if metrics_path is not None:
+        write_json_atomically(metrics_path, report)
+        print('Metrics written to', metrics_path)
+    emit(dict(event='done'))
+
+
+def print_event(event):
+    """The command line's event sink for main: prints the progress of the book, chunk by chunk on a terminal."""
+    name = event['event']
+    if name == 'chapter_started':
+        print(f'Reading chapter {event["chapter"]} ({event["chars"]:,} characters)...')
+    elif name == 'chunk_done' and sys.stdout.isatty():
+        print(f'Chapter {event["chapter"]}: chunk {event["chunk"]}/{event["chunks"]}, {event["progress"]:.0%}, '
+              f'{strfdelta(event["eta_seconds"])} remaining', end='\r')
+    elif name == 'chapter_done':
+        print(f'Estimated time remaining: {strfdelta(event["eta_seconds"])}'.ljust(60))
+        print('Chapter written to', event['file'])
+        print(f'Chapter {event["chapter"]} read in {event["seconds"]:.2f} seconds '
+              f'({event["chars"] / max(event["seconds"], 1e-3):.0f} characters per second)')
+        print('Progress:', f'{int(event["progress"] * 100)}%')
+
+
+class Cancelled(Exception):
+    """A job stopped between two chunks because its cancel event was set."""
+
+
+def read_book(file_path):
+    """Open the book with its title and author; the caller closes the book."""
+    book = LazyEpub(file_path)
+    try:
+        title = book.get_metadata('DC', 'title')[0][0]
+        creator = book.get_metadata('DC', 'creator')[0][0]
+    except IndexError:
+        book.close()
+        raise
+    return book, title, creator
+
+
+class LazyEpub:
+    """
+    Read-only EPUB backed by the zip archive. Only container.xml and the OPF package document
+    (metadata, manifest and spine) are parsed when the book is opened; a document is decompressed
+    when its content is asked for, and images, fonts and styles are never read at all.
+    Offers the subset of ebooklib's EpubBook API that audiblez uses.
+    The archive stays open until close() is called, or the book is used as a context manager.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.zip = zipfile.ZipFile(file_path)
+        try:
+            container = etree.fromstring(self.zip.read('META-INF/container.xml'))
+            rootfile = container.find(f'.//{{{epub.NAMESPACES["CONTAINERNS"]}}}rootfile[@full-path]')
+            self.opf_file = rootfile.get('full-path')
+            package = etree.fromstring(self.zip.read(self.opf_file))
+        except (KeyError, AttributeError, etree.XMLSyntaxError) as e:
+            self.zip.close()
+            raise epub.EpubException(-1, f'Not a valid EPUB: {e}') from e
+        self.opf_dir = posixpath.dirname(self.opf_file)
+        self.metadata = collections.defaultdict(lambda: collections.defaultdict(list))
+        for element in package.iterfind(f'{{{epub.NAMESPACES["OPF"]}}}metadata/*'):
+            if not isinstance(element.tag, str):  # comments
+                continue
+            tag = etree.QName(element)
+            self.metadata[tag.namespace][tag.localname].append((element.text, dict(element.attrib)))
+        self.items = [LazyEpubItem(self, item.get('id'), unquote(item.get('href', '')), item.get('media-type', ''),
+                                   item.get('properties', '').split())
+                      for item in package.iterfind(f'{{{epub.NAMESPACES["OPF"]}}}manifest/{{{epub.NAMESPACES["OPF"]}}}item')]
+        items_by_id = {item.id: item for item in self.items}
+        self.nav = next((item for item in self.items if 'nav' in item.properties), None)
+        self.guide = list(package.iterfind(f'{{{epub.NAMESPACES["OPF"]}}}guide/{{{epub.NAMESPACES["OPF"]}}}reference'))
+        spine = package.find(f'{{{epub.NAMESPACES["OPF"]}}}spine')
+        self.spine = [] if spine is None else [
+            items_by_id[itemref.get('idref')] for itemref in spine.iterfind(f'{{{epub.NAMESPACES["OPF"]}}}itemref')
+            if itemref.get('idref') in items_by_id]
+
+    def get_metadata(self, namespace, name):
+        return self.metadata[epub.NAMESPACES.get(namespace, namespace)].get(name, [])
+
+    def table_of_contents(self):
+        """
+        Return the (file name, label) entries of the table of contents in order, from the EPUB 3 nav
+        document or else from the EPUB 2 NCX. Fragments are dropped, so a file can appear several times.
+        """
+        if self.nav is not None:
+            entries = [(self.resolve_href(self.nav, a.get('href')), ' '.join(''.join(a.itertext()).split()))
+                       for a in self.nav_links('toc')]
+            if entries:
+                return entries
+        ncx = next((item for item in self.items if item.media_type == 'application/x-dtbncx+xml'), None)
+        if ncx is None:
+            return []
+        root = etree.fromstring(ncx.get_content(), etree.XMLParser(recover=True))
+        daisy = epub.NAMESPACES['DAISY']
+        return [(self.resolve_href(ncx, point.find(f'{{{daisy}}}content').get('src')),
+                 ' '.join(''.join(point.find(f'{{{daisy}}}navLabel').itertext()).split()))
+                for point in root.iter(f'{{{daisy}}}navPoint')
+                if point.find(f'{{{daisy}}}content') is not None and point.find(f'{{{daisy}}}navLabel') is not None]
+
+    def landmarks(self):
+        """Return {file name: type} from the nav document landmarks (EPUB 3) or the OPF guide (EPUB 2)."""
+        landmarks = {}
+        if self.nav is not None:
+            for a in self.nav_links('landmarks'):
+                landmarks.setdefault(self.resolve_href(self.nav, a.get('href')), a.get(f'{{{epub.NAMESPACES["EPUB"]}}}type', ''))
+        for reference in self.guide:
+            landmarks.setdefault(unquote(reference.get('href', '').split('#')[0]), reference.get('type', ''))
+        return landmarks
+
+    @functools.cached_property
+    def nav_root(self):
+        if self.nav is None:
+            return None
+        return etree.fromstring(self.nav.get_content(), etree.XMLParser(recover=True))
+
+    def nav_links(self, nav_type):
+        if self.nav_root is None:
+            return []
+        for element in self.nav_root.iter(f'{{{epub.NAMESPACES["XHTML"]}}}nav'):
+            if nav_type in element.get(f'{{{epub.NAMESPACES["EPUB"]}}}type', '').split():
+                return [a for a in element.iter(f'{{{epub.NAMESPACES["XHTML"]}}}a') if a.get('href')]
+        return []
+
+    @staticmethod
+    def resolve_href(item, href):
+        # hrefs in the nav document and the NCX are relative to that file, manifest hrefs to the OPF
+        return posixpath.normpath(posixpath.join(posixpath.dirname(item.file_name), unquote(href.split('#')[0])))
+
+    def get_items(self):
+        return iter(self.items)
+
+    def get_items_of_type(self, item_type):
+        return (item for item in self.items if item.get_type() == item_type)
+
+    def get_item_with_id(self, uid):
+        return next((item for item in self.items if item.id == uid), None)
+
+    def get_item_with_href(self, href):
+        return next((item for item in self.items if item.file_name == href), None)
+
+    def read_file(self, name):
+        return self.zip.read(posixpath.normpath(posixpath.join(self.opf_dir, name)))
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LazyEpubItem:
+    """A manifest entry of a LazyEpub. Its content is read from the archive on every call and not kept."""
+
+    def __init__(self, book, uid, file_name, media_type, properties):
+        self.book = book
+        self.id = uid
+        self.file_name = file_name
+        self.media_type = 'image/jpeg' if media_type == 'image/jpg' else media_type
+        self.properties = properties
+
+    def get_id(self):
+        return self.id
+
+    def get_name(self):
+        return self.file_name
+
+    def get_type(self):
+        # the same types ebooklib.epub.read_epub assigns to manifest items
+        if self.media_type == 'application/xhtml+xml':
+            return ebooklib.ITEM_DOCUMENT
+        if self.media_type in epub.IMAGE_MEDIA_TYPES:
+            return ebooklib.ITEM_COVER if 'cover-image' in self.properties else ebooklib.ITEM_IMAGE
+        if self.media_type == 'application/smil+xml':
+            return ebooklib.ITEM_SMIL
+        extension = posixpath.splitext(self.file_name)[1].lower()
+        return next((t for t, extensions in ebooklib.EXTENSIONS.items() if extension in extensions), ebooklib.ITEM_UNKNOWN)
+
+    def get_content(self):
+        return self.book.read_file(self.file_name)
+
+    def get_body_content(self):
+        return epub.EpubHtml(content=self.get_content()).get_body_content()
+
+    def __repr__(self):
+        return f'<LazyEpubItem:{self.id}:{self.file_name}>'
+
+
+def plan_chapters(filename, texts, intro, voice, speed, lang, manifest=None, audio_format='wav'):
+    """
+    Decide the chapter files of the book, in audio_format, and which of them still need to be synthesized.
+    Returns the list of all chapter files and a list of (chapter number, chapter file, text) jobs;
+    a chapter with too little text to narrate has no file, but keeps its number.
+    With a manifest, a chapter is only skipped if it was completed from the same text and settings.
+    """
     i = 1
-    chapter_mp3_files = []
+    chapter_files = []
+    jobs = []
     for text in texts:
         if len(text) == 0:
             continue
-        chapter_filename = filename.replace('.epub', f'_chapter_{i}.wav')
-        chapter_mp3_files.append(chapter_filename)
-        if Path(chapter_filename).exists():
-            print(f'File for chapter {i} already exists. Skipping')
-            i += 1
-            continue
+        chapter_filename = filename.replace('.epub', f'_chapter_{i}.{audio_format}')
         if len(text.strip()) < 10:
             print(f'Skipping empty chapter {i}')
             i += 1
             continue
-        print(f'Reading chapter {i} ({len(text):,} characters)...')
+        chapter_files.append(chapter_filename)
         if i == 1:
             text = intro + '.\n\n' + text
-        start_time = time.time()
-        samples, sample_rate = kokoro.create(text, voice=voice, speed=speed, lang=lang)
-        sf.write(f'{chapter_filename}', samples, sample_rate)
-        end_time = time.time()
-        delta_seconds = end_time - start_time
-        chars_per_sec = len(text) / delta_seconds
-        remaining_chars = sum([len(t) for t in texts[i - 1:]])
-        remaining_time = remaining_chars / chars_per_sec
-        print(f'Estimated time remaining: {strfdelta(remaining_time)}')
-        print('Chapter written to', chapter_filename)
-        print(f'Chapter {i} read in {delta_seconds:.2f} seconds ({chars_per_sec:.0f} characters per second)')
-        progress = int((total_chars - remaining_chars) / total_chars * 100)
-        print('Progress:', f'{progress}%')
+        if manifest is None:
+            done = Path(chapter_filename).exists()
+        else:
+            done = Path(chapter_filename).exists() and manifest.is_done(chapter_filename, chapter_hash(text, voice, speed, lang))
+        if done:
+            print(f'File for chapter {i} already exists. Skipping')
+            i += 1
+            continue
+        jobs.append((i, chapter_filename, text))
         i += 1
-    if has_ffmpeg:
-        create_m4b(chapter_mp3_files, filename, title, creator)
+    return chapter_files, jobs
 
 
 def extract_texts(chapters):
-    texts = []
-    for chapter in chapters:
-        xml = chapter.get_body_content()
-        soup = BeautifulSoup(xml, features='lxml')
-        chapter_text = ''
-        html_content_tags = ['title', 'p', 'h1', 'h2', 'h3', 'h4']
-        for child in soup.find_all(html_content_tags):
-            inner_text = child.text.strip() if child.text else ""
-            if inner_text:
-                chapter_text += inner_text + '\n'
-        texts.append(chapter_text)
-    return texts
+    """
+    Return the narrated text of each chapter: the text of its title, p and h1-h4 elements, one per line.
+    With many chapters the documents are parsed in a thread pool, since lxml releases the GIL while parsing.
+    """
+    contents = [chapter.get_body_content() for chapter in chapters]
+    if len(contents) < PARALLEL_EXTRACTION_MIN_CHAPTERS:
+        return [extract_text(content) for content in contents]
+    with concurrent.futures.ThreadPoolExecutor(min(len(contents), os.cpu_count() or 1)) as executor:
+        return list(executor.map(extract_text, contents))
+
+
+def extract_text(content):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    root = etree.fromstring(content, etree.HTMLParser(encoding='utf-8'))
+    if root is None:  # empty or comment-only document
+        return ''
+    # Like BeautifulSoup's .text, leave out what is inside script, style and template elements
+    etree.strip_elements(root, 'script', 'style', 'template', with_tail=False)
+    lines = []
+    for element in root.iter(HTML_CONTENT_TAGS):
+        inner_text = ''.join(element.itertext()).strip()
+        if inner_text:
+            lines.append(inner_text + '\n')
+    return ''.join(lines)
+
+
+def split_sentences(paragraph):
+    sentences = []
+    for piece in re.split(r'(?<=[.!?\u2026])\s+|(?<=[.!?\u2026]["\'\u201d\u2019)\]])\s+', paragraph.strip()):
+        if sentences and continues_sentence(sentences[-1], piece):
+            sentences[-1] += ' ' + piece
+        else:
+            sentences.append(piece)
+    return [s for s in sentences if re.search(r'\w', s)]  # drop punctuation-only fragments like '* * *'
+
+
+def continues_sentence(sentence, piece):
+    """
+    Whether the period that sentence ends with does not end it: after an honorific or an initial,
+    or before a lowercase word.
+    """
+    if not sentence.endswith('.'):
+        return False
+    last_word = sentence.rsplit(None, 1)[-1][:-1].lstrip('("\'\u201c\u2018')
+    return last_word.lower() in ABBREVIATIONS or re.fullmatch(r'[A-Z]', last_word) is not None or piece[:1].islower()
+
+
+def split_long_sentence(sentence, max_chars=MAX_CHUNK_CHARS):
+    # Prefer clause boundaries, fall back to word boundaries for run-on sentences.
+    parts = []
+    for clause in re.split(r'(?<=[,;:\u2014])\s+', sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            parts.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if parts and len(parts[-1]) + len(clause) + 1 <= max_chars:
+            parts[-1] += ' ' + clause
+        elif clause:
+            parts.append(clause)
+    return parts
+
+
+def chunk_text(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Split chapter text into chunks of whole sentences, at most max_chars long and never spanning paragraphs.
+    Returns a list of (sentences, pause) tuples, where pause is the silence in seconds to put after the chunk.
+    """
+    chunks = []
+    for paragraph in text.split('\n'):
+        sentences = []
+        for sentence in split_sentences(paragraph):
+            if len(sentence) > max_chars:
+                sentences.extend(split_long_sentence(sentence, max_chars))
+            else:
+                sentences.append(sentence)
+        current = []
+        for sentence in sentences:
+            if current and len(' '.join(current)) + len(sentence) + 1 > max_chars:
+                chunks.append((current, SENTENCE_PAUSE))
+                current = []
+            current.append(sentence)
+        if current:
+            chunks.append((current, PARAGRAPH_PAUSE))
+    return chunks
+
+
+def synthesize_chunks(kokoro, chunks, voice, speed, lang, phoneme_cache=None, audio_cache=None):
+    """Synthesize chunks one at a time, yielding each chunk's samples followed by its pause."""
+    import numpy as np
+    for sentences, pause in chunks:
+        with metrics.span('chunk', chars=sum(len(s) for s in sentences)):
+            samples = synthesize_chunk(kokoro, sentences, voice, speed, lang, phoneme_cache, audio_cache)
+        yield np.concatenate([samples, np.zeros(int(pause * SAMPLE_RATE), dtype=samples.dtype)])
+
+
+def synthesize_chunk(kokoro, sentences, voice, speed, lang, phoneme_cache=None, audio_cache=None):
+    import numpy as np
+    text = ' '.join(sentences)
+    key = None
+    if audio_cache is not None:
+        with metrics.time('cache'):
+            key = cache_key(model_hash(kokoro.config.model_path), voice, speed, lang, text)
+            cached = audio_cache.get(key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32)
+    # phonemize here rather than inside kokoro.create, so that the two stages are timed separately
+    with metrics.time('phonemize'):
+        if phoneme_cache is not None:
+            phonemes = ' '.join(phonemize(kokoro, sentence, lang, phoneme_cache) for sentence in sentences)
+        else:
+            phonemes = kokoro.tokenizer.phonemize(text, lang)
+    with metrics.time('inference', call='kokoro.create'):
+        samples, _ = kokoro.create(text, voice=voice, speed=speed, lang=lang, phonemes=phonemes)
+    samples = samples.astype(np.float32, copy=False)
+    if key is not None:
+        with metrics.time('cache'):
+            audio_cache.put(key, samples.tobytes())
+    return samples
+
+
+class ReusedEspeakPhonemizer:
+    """
+    Drop-in for the phonemizer module as used by kokoro_onnx's Tokenizer.
+    phonemizer.phonemize() builds a new espeak backend on every call, which leaks a few MB each time.
+    That was once per chapter, but chunked synthesis phonemizes thousands of times per book,
+    so keep one backend per language and options instead.
+    """
+
+    def __init__(self):
+        self.backends = {}
+
+    def phonemize(self, text, language='en-us', **kwargs):
+        key = (language, tuple(sorted(kwargs.items())))
+        if key not in self.backends:
+            from phonemizer.backend import EspeakBackend
+            self.backends[key] = EspeakBackend(language, **kwargs)
+        lines = [line for line in text.splitlines() if line.strip()]
+        return '\n'.join(self.backends[key].phonemize(lines))
+
+
+
+def phonemize(kokoro, sentence, lang, cache):
+    """Phonemize a sentence through the espeak tokenizer, reusing cached phonemes from previous runs."""
+    key = cache_key(phonemizer_version(), lang, ' '.join(sentence.split()))
+    phonemes = cache.get(key)
+    if phonemes is not None:
+        return phonemes.decode('utf-8')
+    phonemes = kokoro.tokenizer.phonemize(sentence, lang)
+    cache.put(key, phonemes.encode('utf-8'))
+    return phonemes
+
+
+@functools.lru_cache
+def phonemizer_version():
+    import importlib.metadata
+    versions = []
+    for package in ('kokoro-onnx', 'phonemizer-fork', 'espeakng-loader'):
+        try:
+            versions.append(importlib.metadata.version(package))
+        except importlib.metadata.PackageNotFoundError:
+            versions.append('unknown')
+    return '/'.join(versions)
+
+
+@functools.lru_cache
+def model_hash(model_path):
+    # The model is a few hundred MB, so hash it once per process rather than once per chunk.
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(*parts):
+    return hashlib.sha256('\0'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent key-value store in a single SQLite file.
+    Least recently used entries are evicted once the stored values exceed max_bytes,
+    down to CACHE_EVICT_TO of it. The total size is kept in the file by triggers, so that processes
+    sharing the cache all see the size that they add up to.
+    """
+
+    def __init__(self, path, max_bytes):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA recursive_triggers=ON')  # so that INSERT OR REPLACE fires the delete trigger
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)')
+        if self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'cache_size'").fetchone() is None:
+            self.db.execute('CREATE TABLE cache_size (bytes INTEGER)')
+            self.db.execute('INSERT INTO cache_size SELECT COALESCE(SUM(size), 0) FROM cache')
+            self.db.execute('CREATE TRIGGER cache_added AFTER INSERT ON cache '
+                            'BEGIN UPDATE cache_size SET bytes = bytes + NEW.size; END')
+            self.db.execute('CREATE TRIGGER cache_removed AFTER DELETE ON cache '
+                            'BEGIN UPDATE cache_size SET bytes = bytes - OLD.size; END')
+        self.db.commit()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self):
+        return self.db.execute('SELECT bytes FROM cache_size').fetchone()[0]
+
+    def get(self, key):
+        row = self.db.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE cache SET atime = ? WHERE key = ?', (time.time(), key))
+        self.db.commit()
+        return row[0]
+
+    def put(self, key, value):
+        # one write transaction, so that no other process adds to the cache between the size check and the eviction
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', (key, value, len(value), time.time()))
+        total_bytes = self.total_bytes
+        if total_bytes > self.max_bytes:
+            self.evict(total_bytes)
+        self.db.commit()
+
+    def evict(self, total_bytes):
+        # Evict down to a low-water mark so that the following puts do not each evict again,
+        # reading the oldest entries in batches from the atime index rather than the whole table.
+        target = self.max_bytes * CACHE_EVICT_TO
+        while total_bytes > target:
+            oldest = self.db.execute('SELECT key, size FROM cache ORDER BY atime LIMIT ?', (CACHE_EVICT_BATCH,))
+            rows = oldest.fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if total_bytes <= target:
+                    break
+                evicted.append((key,))
+                total_bytes -= size
+            self.db.executemany('DELETE FROM cache WHERE key = ?', evicted)
+
+    def close(self):
+        self.db.close()
+
+
+def synthesize_serially(kokoro, jobs, voice, speed, lang, phoneme_cache=None, audio_cache=None, manifest=None,
+                        on_event=None, cancel=None):
+    for i, chapter_filename, text in jobs:
+        if cancel is not None and cancel.is_set():
+            raise Cancelled(chapter_filename)
+        if on_event is not None:
+            on_event(dict(event='chapter_started', chapter=i, file=chapter_filename, chars=len(text)))
+        start_time = time.time()
+        synthesize_chapter(kokoro, chapter_filename, text, voice, speed, lang, phoneme_cache, audio_cache, manifest,
+                           chunk_events(on_event, i), cancel)
+        yield i, chapter_filename, text, time.time() - start_time
+
+
+def chunk_events(on_event, chapter):
+    """An on_chunk callback for synthesize_chapter sending chunk_done events of the chapter to on_event."""
+    if on_event is None:
+        return None
+    return lambda chunk, chunks: on_event(dict(event='chunk_done', chapter=chapter, chunk=chunk, chunks=chunks))
+
+
+def synthesize_in_pool(kokoro, jobs, voice, speed, lang, workers, threads=None, phoneme_cache=None, audio_cache=None,
+                       manifest=None, share_model=False, on_event=None, cancel=None):
+    """
+    Synthesize chapters in worker processes that each load the model once, yielding results in chapter order.
+    Longest chapters are submitted first so that no worker is left with a big chapter at the end.
+    With share_model the workers are forked after the model is loaded here instead, and share its weights
+    copy-on-write, so that memory no longer grows with a full model per worker.
+    The workers send their chapter_started and chunk_done events through a pipe, and they are passed to on_event
+    here, in this thread, while waiting for the results. Setting cancel is forwarded to the workers, which stop
+    after their current chunk; the Cancelled of the first chapter still to come is then raised here.
+    """
+    if share_model and 'fork' not in multiprocessing.get_all_start_methods():
+        print('Sharing the model needs fork, which is not available here: every worker loads its own.')
+        share_model = False
+    if share_model:
+        # ONNX Runtime's thread pools do not survive fork, so the shared session must run on the calling thread
+        settings = getattr(kokoro, 'session_settings', None) or {}
+        if (settings.get('intra_op_threads'), settings.get('inter_op_threads'), settings.get('execution_mode')) != \
+                (1, 1, 'sequential'):
+            kokoro = load_kokoro(kokoro.config.model_path, kokoro.config.voices_path, 1,
+                                 dict(settings, inter_op_threads=1, execution_mode='sequential'),
+                                 getattr(kokoro, 'model_cache_dir', DEFAULT_CACHE_DIR))
+        threads = 1
+        _worker['kokoro'] = kokoro
+    elif threads is None:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    cache_specs = [(c.path, c.max_bytes) if c is not None else None for c in (phoneme_cache, audio_cache)]
+    model_spec = (None, None) if share_model else (kokoro.config.model_path, kokoro.config.voices_path)
+    context = multiprocessing.get_context('fork' if share_model else 'spawn')
+    # a SimpleQueue writes to its pipe before put() returns, so a chapter's events all arrive before its result
+    events, worker_cancel = context.SimpleQueue(), context.Event()
+    initargs = (*model_spec, threads, *cache_specs,
+                metrics.trace_events is not None, getattr(kokoro, 'session_settings', None),
+                getattr(kokoro, 'model_cache_dir', DEFAULT_CACHE_DIR), events, worker_cancel)
+    print(f'Synthesizing {len(jobs)} chapters with {workers} workers, {threads} threads each'
+          + (', sharing one model...' if share_model else '...'))
+
+    def wait_for(future):
+        while True:
+            while not events.empty():
+                event = events.get()
+                if on_event is not None:
+                    on_event(event)
+            if cancel is not None and cancel.is_set():
+                worker_cancel.set()
+            if future.done():
+                return future.result()
+            concurrent.futures.wait([future], timeout=0.1)
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, context, init_worker, initargs) as pool:
+            futures = {}
+            for i, chapter_filename, text in sorted(jobs, key=lambda job: len(job[2]), reverse=True):
+                futures[i] = pool.submit(synthesize_chapter_job, chapter_filename, text, voice, speed, lang,
+                                         manifest.path if manifest is not None else None, i)
+            try:
+                for i, chapter_filename, text in jobs:
+                    delta_seconds, cache_stats, worker_metrics = wait_for(futures[i])
+                    for cache, (hits, misses) in zip((phoneme_cache, audio_cache), cache_stats):
+                        if cache is not None:
+                            cache.hits += hits
+                            cache.misses += misses
+                    metrics.merge(worker_metrics)
+                    yield i, chapter_filename, text, delta_seconds
+            finally:
+                worker_cancel.set()  # when stopping early, let the running chapters end within a chunk
+    finally:
+        _worker.pop('kokoro', None)
+
+
+_worker = {}
+
+
+def init_worker(model_path, voices_path, threads, phoneme_cache_spec=None, audio_cache_spec=None, trace=False,
+                session_settings=None, model_cache_dir=DEFAULT_CACHE_DIR, events=None, cancel=None):
+    if model_path is None:
+        # Forked with the parent's model already in _worker. A thread of the parent may have held the metrics
+        # lock at fork time, so start from fresh metrics.
+        metrics.__init__()
+    else:
+        _worker['kokoro'] = load_kokoro(model_path, voices_path, threads, session_settings, model_cache_dir)
+    if trace:
+        metrics.start_trace('audiblez worker')
+    _worker['phoneme_cache'] = DiskCache(*phoneme_cache_spec) if phoneme_cache_spec else None
+    _worker['audio_cache'] = DiskCache(*audio_cache_spec) if audio_cache_spec else None
+    _worker['events'] = events
+    _worker['cancel'] = cancel
+
+
+def synthesize_chapter_job(chapter_filename, text, voice, speed, lang, manifest_path=None, chapter=None):
+    events, cancel = _worker.get('events'), _worker.get('cancel')
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(chapter_filename)
+    if events is not None:
+        events.put(dict(event='chapter_started', chapter=chapter, file=chapter_filename, chars=len(text)))
+    caches = (_worker['phoneme_cache'], _worker['audio_cache'])
+    before = [(c.hits, c.misses) if c is not None else (0, 0) for c in caches]
+    metrics.reset()
+    start_time = time.time()
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    synthesize_chapter(_worker['kokoro'], chapter_filename, text, voice, speed, lang, *caches, manifest,
+                       chunk_events(events.put if events is not None else None, chapter), cancel)
+    delta_seconds = time.time() - start_time
+    after = [(c.hits, c.misses) if c is not None else (0, 0) for c in caches]
+    cache_stats = [(h1 - h0, m1 - m0) for (h0, m0), (h1, m1) in zip(before, after)]
+    worker_metrics = dict(stages=metrics.stages, counters=metrics.counters, peak_rss_mb=peak_rss_mb(),
+                          trace_events=metrics.take_trace_events())
+    return delta_seconds, cache_stats, worker_metrics
+
+
+class ModelFiles:
+    """
+    A Kokoro model that is not loaded yet, with what worker processes need to load it the way load_kokoro would:
+    the config paths, session settings and cache directory of a Kokoro from load_kokoro.
+    load() loads it in this process after all, e.g. for a book with a single chapter to synthesize.
+    """
+
+    def __init__(self, model_path, voices_path, threads=None, settings=None, cache_dir=DEFAULT_CACHE_DIR):
+        self.config = types.SimpleNamespace(model_path=model_path, voices_path=voices_path)
+        self.threads = threads
+        self.session_settings = settings
+        self.model_cache_dir = cache_dir
+
+    def get_voices(self):
+        return voice_names(self.config.voices_path)
+
+    def load(self):
+        return load_kokoro(self.config.model_path, self.config.voices_path, self.threads, self.session_settings,
+                           self.model_cache_dir)
+
+
+def load_kokoro(model_path, voices_path, threads=None, settings=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Create a Kokoro instance with an ONNX Runtime session configured by settings (see SESSION_DEFAULTS).
+    threads, when given, sets the intra-op threads and defaults the inter-op threads to 1.
+    Unless disabled, the graph-optimized model is saved in cache_dir the first time, and later sessions load it
+    with graph optimizations turned off, which makes loading faster.
+    The settings and cache_dir are kept on the instance, for worker processes to load the model the same way.
+    """
+    import onnxruntime
+    import kokoro_onnx.tokenizer
+    if not isinstance(kokoro_onnx.tokenizer.phonemizer, ReusedEspeakPhonemizer):
+        kokoro_onnx.tokenizer.phonemizer = ReusedEspeakPhonemizer()
+    settings = dict(SESSION_DEFAULTS, **(settings or {}))
+    if threads:
+        settings['intra_op_threads'] = threads
+        settings['inter_op_threads'] = settings['inter_op_threads'] or 1
+    options = session_options(settings)
+    providers = [p for p in ['CUDAExecutionProvider', 'CPUExecutionProvider']
+                 if p in onnxruntime.get_available_providers()]
+    session = None
+    cached_model = None
+    if settings['optimized_model_cache'] and settings['graph_optimization'] != 'disable':
+        cached_model = optimized_model_path(model_path, settings['graph_optimization'], providers, cache_dir)
+    if cached_model is not None and cached_model.exists():
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            session = onnxruntime.InferenceSession(str(cached_model), options, providers=providers)
+        except Exception as e:
+            print(f'Could not load the optimized model {cached_model}, optimizing again: {e}')
+            options = session_options(settings)
+    if session is None:
+        if cached_model is not None:
+            cached_model.parent.mkdir(parents=True, exist_ok=True)
+            options.optimized_model_filepath = str(cached_model) + f'.{os.getpid()}.tmp'
+            options.log_severity_level = 3  # the warning that it is hardware specific is moot for a local cache
+        session = onnxruntime.InferenceSession(model_path, options, providers=providers)
+        if cached_model is not None and Path(options.optimized_model_filepath).exists():
+            os.replace(options.optimized_model_filepath, cached_model)
+    # What Kokoro.from_session does, except that it parses the whole voices.json for the voice names,
+    # and once more for every voice used.
+    kokoro = kokoro_onnx.Kokoro.__new__(kokoro_onnx.Kokoro)
+    kokoro.sess = session
+    kokoro.config = kokoro_onnx.config.KoKoroConfig(model_path, voices_path)
+    kokoro.config.validate()
+    kokoro.tokenizer = kokoro_onnx.tokenizer.Tokenizer()
+    voice_store = VoiceStore(voices_path, cache_dir)
+    kokoro.voices = voice_store.names
+    kokoro.get_voice_style = voice_store.get
+    kokoro.session_settings = settings
+    kokoro.model_cache_dir = cache_dir
+    return kokoro
+
+
+class VoiceStore:
+    """
+    Voices converted once from voices.json to one .npy file per voice under cache_dir, keyed on the file's
+    path, size and modification time. A voice is memory-mapped when first requested, so a run only reads the
+    voice it uses and worker processes share its pages instead of each parsing and holding every voice.
+    """
+
+    def __init__(self, voices_path, cache_dir=DEFAULT_CACHE_DIR):
+        stat = Path(voices_path).stat()
+        key = cache_key(Path(voices_path).resolve(), stat.st_size, stat.st_mtime_ns)
+        self.dir = Path(cache_dir) / 'voices' / f'{Path(voices_path).stem}.{key[:16]}'
+        if not (self.dir / 'index.json').exists():
+            self.convert(voices_path)
+        with open(self.dir / 'index.json', encoding='utf-8') as f:
+            self.names = json.load(f)
+        self.styles = {}
+
+    def convert(self, voices_path):
+        import numpy as np
+        with open(voices_path, encoding='utf-8') as f:
+            voices = json.load(f)
+        tmp_dir = self.dir.with_name(f'{self.dir.name}.{os.getpid()}.tmp')
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        for n, (name, style) in enumerate(voices.items()):
+            np.save(tmp_dir / f'{n}.npy', np.array(style, dtype=np.float32))
+        with open(tmp_dir / 'index.json', 'w', encoding='utf-8') as f:
+            json.dump(list(voices), f)
+        try:
+            os.replace(tmp_dir, self.dir)
+        except OSError:  # another process converted the same voices first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get(self, name):
+        if name not in self.styles:
+            import numpy as np
+            self.styles[name] = np.load(self.dir / f'{self.names.index(name)}.npy', mmap_mode='r')
+        return self.styles[name]
+
+
+def session_options(settings):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if settings['intra_op_threads']:
+        options.intra_op_num_threads = settings['intra_op_threads']
+    if settings['inter_op_threads']:
+        options.inter_op_num_threads = settings['inter_op_threads']
+    options.execution_mode = getattr(onnxruntime.ExecutionMode, EXECUTION_MODES[settings['execution_mode']])
+    options.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel,
+                                               GRAPH_OPTIMIZATION_LEVELS[settings['graph_optimization']])
+    options.enable_cpu_mem_arena = settings['memory_arena']
+    options.enable_mem_pattern = settings['memory_pattern']
+    return options
+
+
+def optimized_model_path(model_path, graph_optimization, providers, cache_dir):
+    # Keyed on the file's size and modification time rather than its contents, hashing the model would cost
+    # more than the graph optimization it saves.
+    import onnxruntime
+    stat = Path(model_path).stat()
+    key = cache_key(Path(model_path).resolve(), stat.st_size, stat.st_mtime_ns, onnxruntime.__version__,
+                    graph_optimization, *providers)
+    return Path(cache_dir) / 'models' / f'{Path(model_path).stem}.{graph_optimization}.{key[:16]}.onnx'
+
+
+def read_session_settings(parser, args):
+    """
+    Session settings from the --onnx-config JSON file, overridden by the ONNX Runtime command line options.
+    --no-cache also turns off the optimized model cache.
+    """
+    settings = dict(SESSION_DEFAULTS)
+    if args.onnx_config:
+        with open(args.onnx_config, encoding='utf-8') as f:
+            config = json.load(f)
+        unknown = set(config) - set(SESSION_DEFAULTS)
+        if unknown:
+            parser.error(f'unknown settings in {args.onnx_config}: {", ".join(sorted(unknown))}')
+        settings.update(config)
+    for name in SESSION_DEFAULTS:
+        if getattr(args, name, None) is not None:
+            settings[name] = getattr(args, name)
+    if args.no_cache:
+        settings['optimized_model_cache'] = False
+    if settings['execution_mode'] not in EXECUTION_MODES:
+        parser.error(f'execution_mode must be one of {", ".join(EXECUTION_MODES)}')
+    if settings['graph_optimization'] not in GRAPH_OPTIMIZATION_LEVELS:
+        parser.error(f'graph_optimization must be one of {", ".join(GRAPH_OPTIMIZATION_LEVELS)}')
+    return settings
+
+
+def add_session_arguments(parser):
+    group = parser.add_argument_group('ONNX Runtime session', 'Also settable in a JSON file given with --onnx-config')
+    group.add_argument('--onnx-config', default=None, metavar='FILE.json',
+                       help=f'JSON object with any of: {", ".join(SESSION_DEFAULTS)}')
+    group.add_argument('--inter-op-threads', dest='inter_op_threads', default=None, type=int,
+                       help='Threads running independent graph nodes in parallel (only with --execution-mode parallel)')
+    group.add_argument('--execution-mode', dest='execution_mode', default=None, choices=list(EXECUTION_MODES),
+                       help=f'Run graph nodes one at a time or in parallel (default: {SESSION_DEFAULTS["execution_mode"]})')
+    group.add_argument('--graph-optimization', dest='graph_optimization', default=None,
+                       choices=list(GRAPH_OPTIMIZATION_LEVELS),
+                       help=f'Graph optimization level (default: {SESSION_DEFAULTS["graph_optimization"]})')
+    group.add_argument('--no-memory-arena', dest='memory_arena', default=None, action='store_false',
+                       help='Allocate tensors from the system allocator instead of a growing arena, using less memory')
+    group.add_argument('--no-memory-pattern', dest='memory_pattern', default=None, action='store_false',
+                       help='Do not preallocate memory from the shapes of previous runs')
+    group.add_argument('--no-model-cache', dest='optimized_model_cache', default=None, action='store_false',
+                       help='Optimize the model graph on every load instead of caching the optimized model')
+
+
+def synthesize_chapter(kokoro, chapter_filename, text, voice, speed, lang, phoneme_cache=None, audio_cache=None,
+                       manifest=None, on_chunk=None, cancel=None):
+    """
+    Synthesize a chapter file, calling on_chunk(chunks done, total chunks) after every chunk.
+    Once cancel is set Cancelled is raised after the current chunk; with a manifest the chapter resumes there.
+    """
+    with metrics.span('chapter', file=chapter_filename, chars=len(text)):
+        steps = synthesize_chapter_steps(kokoro, chapter_filename, text, voice, speed, lang, phoneme_cache,
+                                         audio_cache, manifest)
+        for n, total in steps:
+            if on_chunk is not None:
+                on_chunk(n, total)
+            if cancel is not None and cancel.is_set() and n < total:
+                steps.close()
+                raise Cancelled(chapter_filename)
+
+
+def synthesize_chapter_steps(kokoro, chapter_filename, text, voice, speed, lang, phoneme_cache=None,
+                             audio_cache=None, manifest=None):
+    """
+    Synthesize a chapter chunk by chunk, yielding (chunks done, total chunks) after each one.
+    Each chunk is appended to a .part file as soon as it is ready, so memory scales with chunk size,
+    and the file only gets its final name once complete, so a half-written chapter is never mistaken for a
+    finished one. With a manifest every chunk is checkpointed and an interrupted chapter resumes at its
+    first unfinished chunk. The format of the file (WAV, FLAC or Ogg Vorbis) follows its extension.
+    """
+    import soundfile as sf
+    chunks = chunk_text(text)
+    text_hash = chapter_hash(text, voice, speed, lang)
+    part_filename = str(Path(chapter_filename).with_suffix('.part' + Path(chapter_filename).suffix))
+    start_chunk, start_frame = manifest.resume_point(chapter_filename, text_hash) if manifest is not None else (0, 0)
+    f = None
+    if start_chunk and Path(part_filename).exists():
+        try:
+            if Path(part_filename).suffix.lower() == '.wav':
+                f = sf.SoundFile(part_filename, 'r+')
+                f.seek(start_frame)
+                f.truncate(start_frame)
+            else:
+                start_chunk, start_frame, f = reopen_compressed_part(part_filename,
+                                                                     manifest.chunk_ends(chapter_filename))
+            print(f'Resuming {chapter_filename} at chunk {start_chunk + 1}/{len(chunks)}')
+        except (RuntimeError, OSError, StopIteration):
+            f = None
+    if f is None:
+        start_chunk, start_frame = 0, 0
+        f = sf.SoundFile(part_filename, 'w', samplerate=SAMPLE_RATE, channels=1)
+        if manifest is not None:
+            manifest.start_chapter(chapter_filename, text_hash)
+    frame = start_frame  # compressed files cannot tell() their position
+    with f:
+        audio_chunks = synthesize_chunks(kokoro, chunks[start_chunk:], voice, speed, lang, phoneme_cache, audio_cache)
+        for n, samples in enumerate(audio_chunks, start_chunk + 1):
+            with metrics.time('write', call='sf.write', frames=len(samples)):
+                f.write(samples)
+                frame += len(samples)
+                if manifest is not None:
+                    f.flush()
+                    manifest.chunk_done(chapter_filename, n, frame)
+            metrics.count('chunks')
+            metrics.count('audio_seconds', len(samples) / SAMPLE_RATE)
+            yield n, len(chunks)
+    os.replace(part_filename, chapter_filename)
+    metrics.count('chapter_file_bytes', Path(chapter_filename).stat().st_size)
+    metrics.count('chapter_file_audio_seconds', frame / SAMPLE_RATE)
+    if manifest is not None:
+        manifest.chapter_done(chapter_filename)
+
+
+def readable_frames(filename, block_frames=4096):
+    """Frames that decode from an audio file, which may have been cut short when its writer was killed."""
+    import soundfile as sf
+    frames = 0
+    try:
+        with sf.SoundFile(filename) as f:
+            while True:
+                block = f.read(block_frames, dtype='float32')
+                if not len(block):
+                    return frames
+                frames += len(block)
+    except (RuntimeError, OSError):  # a truncated FLAC has no length and fails at its end
+        return frames
+
+
+def reopen_compressed_part(part_filename, chunk_ends):
+    """
+    Compressed files cannot be reopened for writing, so copy the audio of the finished chunks to a new part file,
+    and return the number of chunks and frames in it, and the file open for writing.
+    chunk_ends are the (chunk, end frame) checkpoints from the last: an encoder may not have flushed the last
+    chunks to disk when the run stopped, so the last checkpoint whose audio can all be decoded is used.
+    """
+    import soundfile as sf
+    readable = readable_frames(part_filename)
+    chunk, end_frame = next((chunk, end_frame) for chunk, end_frame in chunk_ends if end_frame <= readable)
+    old_filename = part_filename + '.old'
+    os.replace(part_filename, old_filename)
+    f = sf.SoundFile(part_filename, 'w', samplerate=SAMPLE_RATE, channels=1)
+    try:
+        with sf.SoundFile(old_filename) as old:
+            remaining = end_frame
+            while remaining:
+                block = old.read(min(remaining, 65536), dtype='float32')
+                f.write(block)
+                remaining -= len(block)
+    except Exception:
+        f.close()
+        raise
+    os.remove(old_filename)
+    return chunk, end_frame, f
+
+
+def chapter_hash(text, voice, speed, lang):
+    return cache_key(text, voice, speed, lang, MAX_CHUNK_CHARS, SENTENCE_PAUSE, PARAGRAPH_PAUSE, ABBREVIATIONS)
+
+
+class RunManifest:
+    """
+    Per-book record of the finished chapters and chunks, with the audio offset where each chunk ends,
+    used to resume an interrupted conversion exactly where it stopped.
+    It is a SQLite file so that every update is atomic and worker processes can update it concurrently.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS chapters (file TEXT PRIMARY KEY, hash TEXT, done INTEGER)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS chunks (file TEXT, chunk INTEGER, end_frame INTEGER, '
+                        'PRIMARY KEY (file, chunk))')
+        self.db.commit()
+
+    def is_done(self, chapter_filename, text_hash):
+        row = self.db.execute('SELECT done FROM chapters WHERE file = ? AND hash = ?',
+                              (chapter_filename, text_hash)).fetchone()
+        return bool(row and row[0])
+
+    def resume_point(self, chapter_filename, text_hash):
+        """Return how many chunks of the chapter are already in its .part file, and the frame where they end."""
+        if self.db.execute('SELECT 1 FROM chapters WHERE file = ? AND hash = ? AND NOT done',
+                           (chapter_filename, text_hash)).fetchone() is None:
+            return 0, 0
+        row = self.db.execute('SELECT chunk, end_frame FROM chunks WHERE file = ? ORDER BY chunk DESC LIMIT 1',
+                              (chapter_filename,)).fetchone()
+        return row if row is not None else (0, 0)
+
+    def start_chapter(self, chapter_filename, text_hash):
+        self.db.execute('DELETE FROM chunks WHERE file = ?', (chapter_filename,))
+        self.db.execute('INSERT OR REPLACE INTO chapters VALUES (?, ?, 0)', (chapter_filename, text_hash))
+        self.db.commit()
+
+    def chunk_ends(self, chapter_filename):
+        """Return the (chunk, end frame) checkpoints of the chapter's .part file, from the last."""
+        return self.db.execute('SELECT chunk, end_frame FROM chunks WHERE file = ? ORDER BY chunk DESC',
+                               (chapter_filename,)).fetchall()
+
+    def chunk_done(self, chapter_filename, chunk, end_frame):
+        self.db.execute('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)', (chapter_filename, chunk, end_frame))
+        self.db.commit()
+
+    def chapter_done(self, chapter_filename):
+        self.db.execute('UPDATE chapters SET done = 1 WHERE file = ?', (chapter_filename,))
+        self.db.commit()
+
+
+def peak_rss_mb():
+    try:
+        # Unlike ru_maxrss, VmHWM is reset by exec, so it is right for spawned processes too
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:')) / 1024
+    except (OSError, StopIteration):
+        pass
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class Metrics:
+    """
+    Wall-clock seconds and number of calls per pipeline stage, and run counters such as synthesized audio seconds.
+    Stages may be timed from several threads. Worker processes time their own stages and send them back to be
+    merged, so with several workers the stage seconds add up to more than the wall-clock time.
+    After start_trace() every stage, span and ffmpeg subprocess is also recorded as a Chrome Trace Event
+    (viewable in Perfetto or chrome://tracing); until then tracing costs a single check per span.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.trace_events = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+            self.worker_peak_rss_mb = None
+
+    @contextlib.contextmanager
+    def time(self, stage, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(stage, seconds)
+            if self.trace_events is not None:
+                self.trace(stage, 'stage', start, seconds, args)
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Trace a span that is not a stage, like a chapter or a chunk. Does nothing unless tracing."""
+        if self.trace_events is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.trace(name, 'span', start, time.perf_counter() - start, args)
+
+    def start_trace(self, process_name='audiblez'):
+        with self.lock:
+            # trace timestamps are in microseconds since the epoch, so that processes line up
+            self.clock_offset = time.time() - time.perf_counter()
+            self.traced_threads = set()
+            self.trace_events = [dict(name='process_name', ph='M', pid=os.getpid(), tid=0, args=dict(name=process_name))]
+
+    def trace(self, name, category, start, seconds, args, pid=None, tid=None):
+        pid = pid or os.getpid()
+        tid = tid or threading.get_native_id()
+        with self.lock:
+            if (pid, tid) not in self.traced_threads:
+                self.traced_threads.add((pid, tid))
+                thread_name = threading.current_thread().name if pid == os.getpid() else name
+                self.trace_events.append(dict(name='thread_name', ph='M', pid=pid, tid=tid, args=dict(name=thread_name)))
+            self.trace_events.append(dict(name=name, cat=category, ph='X', ts=round((start + self.clock_offset) * 1e6, 1),
+                                          dur=round(seconds * 1e6, 1), pid=pid, tid=tid, args=args))
+
+    def run(self, command, stage):
+        """Run a subprocess as a stage; when tracing it also gets a span of its own under its process ID."""
+        with self.time(stage):
+            start = time.perf_counter()
+            proc = subprocess.Popen(command)
+            proc.wait()
+        if self.trace_events is not None:
+            with self.lock:
+                self.trace_events.append(dict(name='process_name', ph='M', pid=proc.pid, tid=0,
+                                              args=dict(name=Path(command[0]).name)))
+            self.trace(Path(command[0]).name, 'subprocess', start, time.perf_counter() - start,
+                       dict(command=' '.join(command), returncode=proc.returncode), pid=proc.pid, tid=proc.pid)
+        return proc
+
+    def take_trace_events(self):
+        with self.lock:
+            events, self.trace_events = self.trace_events, ([] if self.trace_events is not None else None)
+        return events
+
+    def write_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(traceEvents=self.trace_events or [], displayTimeUnit='ms'), f)
+
+    def add(self, stage, seconds, calls=1):
+        with self.lock:
+            total, n = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, n + calls)
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def merge(self, worker_metrics):
+        if self.trace_events is not None and worker_metrics.get('trace_events'):
+            with self.lock:
+                self.trace_events.extend(worker_metrics['trace_events'])
+        for stage, (seconds, calls) in worker_metrics['stages'].items():
+            self.add(stage, seconds, calls)
+        for counter, value in worker_metrics['counters'].items():
+            self.count(counter, value)
+        if worker_metrics.get('peak_rss_mb') is not None:
+            self.worker_peak_rss_mb = max(self.worker_peak_rss_mb or 0, worker_metrics['peak_rss_mb'])
+
+    def report(self, wall_seconds, synthesis_seconds):
+        audio_seconds = self.counters.get('audio_seconds', 0)
+        chapter_file_bytes = self.counters.get('chapter_file_bytes', 0)
+        chapter_file_hours = self.counters.get('chapter_file_audio_seconds', 0) / 3600
+        return dict(
+            wall_seconds=round(wall_seconds, 3),
+            synthesis_seconds=round(synthesis_seconds, 3),
+            audio_seconds=round(audio_seconds, 3),
+            chunks=self.counters.get('chunks', 0),
+            # real-time factor: seconds of audio produced per second of synthesis
+            rtf=round(audio_seconds / synthesis_seconds, 3) if synthesis_seconds else None,
+            peak_rss_mb=peak_rss_mb(),
+            peak_worker_rss_mb=self.worker_peak_rss_mb,
+            chapter_file_bytes=chapter_file_bytes,
+            chapter_file_bytes_per_audio_hour=round(chapter_file_bytes / chapter_file_hours) if chapter_file_hours else None,
+            stages={stage: dict(seconds=round(seconds, 3), calls=calls) for stage, (seconds, calls) in self.stages.items()},
+        )
+
+
+metrics = Metrics()
+
+
+def print_metrics(report):
+    print(f'Synthesized {report["audio_seconds"] / 3600:.2f} hours of audio in {strfdelta(report["synthesis_seconds"])}'
+          + (f' ({report["rtf"]:.1f}x real time)' if report['rtf'] else ''))
+    if report.get('time_to_first_audio_seconds') is not None:
+        print(f'Time to first audio: {report["time_to_first_audio_seconds"]:.2f} s, '
+              f'{report["underruns"]} underruns ({report["underrun_seconds"]:.1f} s of playback waiting for synthesis)')
+    if report['chapter_file_bytes_per_audio_hour']:
+        print(f'Wrote {report["chapter_file_bytes"] / 1024 / 1024:,.1f} MB of chapter files, '
+              f'{report["chapter_file_bytes_per_audio_hour"] / 1024 / 1024:,.1f} MB per hour of audio')
+    for stage, stage_metrics in report['stages'].items():
+        print(f'  {stage:<12} {stage_metrics["seconds"]:>10.2f} s {stage_metrics["calls"]:>8,} calls')
+
+
+class ThroughputEstimate:
+    """
+    Characters per second for the ETA. The clock starts at the first finished chunk, so that loading the model and
+    starting workers are not counted as synthesis time. Until smoothing_seconds have passed the rate is the average
+    since then; after that it is an exponential moving average weighted by elapsed time, so that the ETA follows
+    changes in speed within minutes without jumping around on every short chapter.
+    """
+
+    def __init__(self, smoothing_seconds=ETA_SMOOTHING_SECONDS):
+        self.smoothing_seconds = smoothing_seconds
+        self.rate = None
+        self.start = None
+        self.last_update = None
+        self.chars = 0
+
+    def update(self, chars, now=None):
+        now = time.time() if now is None else now
+        if self.start is None:
+            self.start = self.last_update = now
+            return
+        elapsed = max(now - self.last_update, 1e-6)
+        self.last_update = now
+        self.chars += chars
+        if self.rate is None or now - self.start < self.smoothing_seconds:
+            self.rate = self.chars / max(now - self.start, 1e-6)
+        else:
+            weight = 1 - math.exp(-elapsed / self.smoothing_seconds)
+            self.rate = weight * (chars / elapsed) + (1 - weight) * self.rate
+
+    def eta(self, remaining_chars):
+        return remaining_chars / self.rate if self.rate else 0
 
 
 def is_chapter(c):
@@ -110,22 +1401,113 @@ def is_chapter(c):
         return True
 
 
-def find_chapters(book, verbose=False):
-    chapters = [c for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT and is_chapter(c)]
+def find_chapters(book, verbose=False, include=()):
+    """
+    Select the documents to narrate: those classified as chapters whose file name looks like a chapter,
+    else all of those classified as chapters, plus every document of the kinds in include;
+    if that leaves nothing, every document of the book.
+    """
+    documents = classify_documents(book)
+    named = [c for c, kind in documents if kind == 'chapter' and is_chapter(c)]
     if verbose:
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                print(f"'{item.get_name()}'" + ', #' + str(len(item.get_body_content())))
-                # print(f'{item.get_name()}'.ljust(60), str(len(item.get_body_content())).ljust(15), 'X' if item in chapters else '-')
+        for item, kind in documents:
+            print(f"'{item.get_name()}'" + ', #' + str(len(item.get_body_content())) + ', ' + kind)
+    if len(named) == 0:
+        named = [c for c, kind in documents if kind == 'chapter']
+        if named:
+            print('Not easy to find the chapters by name, using the narrative documents of the table of contents.')
+    chapters = [c for c, kind in documents if kind in include or any(c is n for n in named)]
     if len(chapters) == 0:
         print('Not easy to find the chapters, defaulting to all available documents.')
-        chapters = [c for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT]
+        chapters = [c for c, _ in documents]
     return chapters
 
 
+def classify_documents(book):
+    """
+    Return (document, kind) for every document of the book in reading order, where kind is one of
+    DOCUMENT_KINDS. The kind comes from the EPUB landmarks, then the table of contents label, then
+    words in the file name. Cover, title, contents and similar pages are front matter before the first
+    chapter and back matter after it. With a table of contents, unlisted documents before its first
+    chapter are front matter, after its last chapter back matter, and in between chapter continuations.
+    """
+    if isinstance(book, LazyEpub):
+        documents = [item for item in book.spine if item.get_type() == ebooklib.ITEM_DOCUMENT]
+        documents += [item for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT) if item not in documents]
+        toc, landmarks = book.table_of_contents(), book.landmarks()
+    else:  # an ebooklib EpubBook: manifest order and file names only
+        documents = [item for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+        toc, landmarks = [], {}
+    labels = {}
+    for name, label in toc:
+        labels.setdefault(name, label)
+
+    kinds = []
+    for item in documents:
+        name = item.get_name()
+        kind = (LANDMARK_KINDS.get(landmarks.get(name, '')) or
+                next((k for k, pattern in TOC_LABEL_KINDS if re.fullmatch(pattern, labels.get(name, ''), re.I)), None))
+        if kind is None:
+            words = set(re.findall('[a-z]+', name.lower()))
+            if 'nav' in getattr(item, 'properties', ()):
+                words.add('nav')
+            kind = next((k for k, k_words in FILE_NAME_KINDS if words & k_words), None)
+        kinds.append(kind)
+
+    listed = [n for n, item in enumerate(documents) if item.get_name() in labels and kinds[n] in (None, 'chapter')]
+    for n, item in enumerate(documents):
+        if kinds[n] is None and listed and item.get_name() not in labels:
+            kinds[n] = 'front' if n < listed[0] else 'back' if n > listed[-1] else 'chapter'
+    first_chapter = next((n for n, kind in enumerate(kinds) if kind in (None, 'chapter')), len(kinds))
+    kinds = ['chapter' if kind is None else ('front' if n < first_chapter else 'back') if kind == 'matter' else kind
+             for n, kind in enumerate(kinds)]
+    return list(zip(documents, kinds))
+
+
+def print_document_report(documents, chapters, texts, chars_per_second, speed):
+    """
+    Print every document with its kind, narrated characters, and estimated audio length and synthesis
+    time, marking the selected ones, so that expensive non-narrative documents are visible up front.
+    Without chars_per_second the synthesis time is left out.
+    """
+    def synthesis(chars):
+        return strfdelta(chars / chars_per_second, "{H}:{M:02}:{S:02}") if chars_per_second else '-'
+
+    selected = {chapter.get_name(): len(text) for chapter, text in zip(chapters, texts)}
+    print(f'   {"kind":<8} {"chars":>9} {"audio":>9} {"synthesis":>10}  document')
+    for item, kind in documents:
+        chars = selected.get(item.get_name())
+        if chars is None:
+            chars = len(extract_text(item.get_body_content()))
+        audio = chars / NARRATION_CHARS_PER_SECOND / speed
+        mark = '*' if item.get_name() in selected else ' '
+        print(f' {mark} {kind:<8} {chars:>9,} {strfdelta(audio, "{H}:{M:02}:{S:02}"):>9} '
+              f'{synthesis(chars):>10}  {item.get_name()}')
+    total = sum(selected.values())
+    print(f'   {"selected":<8} {total:>9,} {strfdelta(total / NARRATION_CHARS_PER_SECOND / speed, "{H}:{M:02}:{S:02}"):>9} '
+          f'{synthesis(total):>10}  (* = narrated)')
+
+
+def measure_chars_per_second(kokoro, voice, speed, lang):
+    """
+    Synthesize a short sample to estimate the synthesis throughput of this model and machine.
+    It is measured once per model instance, language and speed, and kept on the instance for the next books.
+    """
+    measured = getattr(kokoro, 'measured_chars_per_second', None)
+    if measured is None:
+        measured = kokoro.measured_chars_per_second = {}
+    if (lang, speed) not in measured:
+        kokoro.create(CALIBRATION_TEXT, voice=voice, speed=speed, lang=lang)  # warm up espeak and the ONNX session
+        start = time.time()
+        kokoro.create(CALIBRATION_TEXT, voice=voice, speed=speed, lang=lang)
+        measured[lang, speed] = len(CALIBRATION_TEXT) / max(time.time() - start, 1e-3)
+    return measured[lang, speed]
+
+
 def pick_chapters(book):
     all_chapters_names = [c.get_name() for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT]
     title = 'Select which chapters to read in the audiobook'
+    from pick import pick
     selected_chapters_names = pick(all_chapters_names, title, multiselect=True, min_selection_count=1)
     selected_chapters_names = [c[0] for c in selected_chapters_names]
     selected_chapters = [c for c in book.get_items() if c.get_name() in selected_chapters_names]
@@ -145,44 +1527,859 @@ def strfdelta(tdelta, fmt='{D:02}d {H:02}h {M:02}m {S:02}s'):
     return f.format(fmt, **values)
 
 
-def create_m4b(chapter_files, filename, title, author):
-    tmp_filename = filename.replace('.epub', '.tmp.m4a')
-    if not Path(tmp_filename).exists():
-        combined_audio = AudioSegment.empty()
-        for wav_file in chapter_files:
-            audio = AudioSegment.from_wav(wav_file)
-            combined_audio += audio
-        print('Converting to Mp4...')
-        combined_audio.export(tmp_filename, format="mp4", codec="aac", bitrate="64k")
+def create_m4b(chapter_files, filename, title, author, encoded_files=None):
+    """
+    Encode the chapter files into an .m4b in a single ffmpeg pass.
+    Chapters are streamed through the concat demuxer, so memory use does not depend on the length of the book,
+    and title, author and chapter markers come from an ffmetadata file built from the chapter durations.
+    If encoded_files has the chapters already encoded to AAC by a ChapterEncoder, they are only stream-copied,
+    and the markers follow the encoded durations, which the encoder's priming and padding make longer.
+    """
     final_filename = filename.replace('.epub', '.m4b')
+    concat_filename = filename.replace('.epub', '.concat.txt')
+    metadata_filename = filename.replace('.epub', '.ffmetadata.txt')
+    with open(concat_filename, 'w', encoding='utf-8') as f:
+        for chapter_file in encoded_files or chapter_files:
+            escaped_path = str(Path(chapter_file).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped_path}'\n")
+    with open(metadata_filename, 'w', encoding='utf-8') as f:
+        f.write(ffmetadata(chapter_files, title, author, encoded_files))
     print('Creating M4B file...')
-    proc = subprocess.run([
-        'ffmpeg', '-i', f'{tmp_filename}', '-c', 'copy', '-f', 'mp4',
-        '-metadata', f'title={title}',
-        '-metadata', f'author={author}',
-        f'{final_filename}'
-    ])
-    Path(tmp_filename).unlink()
+    proc = metrics.run([
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-stats',
+        '-f', 'concat', '-safe', '0', '-i', concat_filename,
+        '-i', metadata_filename, '-map', '0:a', '-map_metadata', '1', '-map_chapters', '1',
+        *(['-c', 'copy'] if encoded_files else ['-c:a', 'aac', '-b:a', '64k']), '-f', 'mp4', final_filename
+    ], 'mux')
+    Path(concat_filename).unlink()
+    Path(metadata_filename).unlink()
     if proc.returncode == 0:
+        for encoded_file in encoded_files or []:
+            Path(encoded_file).unlink()
         print(f'{final_filename} created. Enjoy your audiobook.')
-        print('Feel free to delete the intermediary .wav chapter files, the .m4b is all you need.')
+        print('Feel free to delete the intermediary chapter files, the .m4b is all you need.')
 
 
-def cli_main():
-    if not Path('kokoro-v0_19.onnx').exists() or not Path('voices.json').exists():
+class ChapterEncoder:
+    """
+    Encodes finished chapter files to AAC with ffmpeg in a background thread, while the next chapters are
+    being synthesized, so that building the .m4b at the end is only a stream copy.
+    """
+
+    def __init__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='encoder')
+        self.futures = {}
+
+    def submit(self, chapter_filename):
+        self.futures[chapter_filename] = self.executor.submit(encode_chapter, chapter_filename)
+
+    def encoded_files(self, chapter_files):
+        """Wait for the encodes and return the encoded files in chapter order, or None if any of them failed."""
+        for chapter_filename in chapter_files:
+            if chapter_filename not in self.futures:  # chapters kept from a previous run
+                self.submit(chapter_filename)
+        encoded_files = [self.futures[chapter_filename].result() for chapter_filename in chapter_files]
+        self.executor.shutdown()
+        return None if None in encoded_files else encoded_files
+
+
+def encode_chapter(chapter_filename):
+    encoded_filename = str(Path(chapter_filename).with_suffix('.m4a'))
+    encoded = Path(encoded_filename)
+    if encoded.exists() and encoded.stat().st_mtime >= Path(chapter_filename).stat().st_mtime:
+        return encoded_filename
+    proc = metrics.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', chapter_filename,
+                        '-c:a', 'aac', '-b:a', '64k', '-f', 'mp4', encoded_filename], 'encode')
+    return encoded_filename if proc.returncode == 0 else None
+
+
+def encoded_duration(encoded_filename):
+    """
+    Seconds that an AAC file takes once stream-copied after another one: all of its frames, including the
+    encoder's priming and the padding of the last frame, which its container duration leaves out.
+    """
+    proc = subprocess.run(['ffmpeg', '-v', 'error', '-i', encoded_filename, '-map', '0:a', '-c', 'copy', '-f', 'framecrc', '-'],
+                          capture_output=True, text=True, check=True)
+    time_base = re.search(r'^#tb 0: (\d+)/(\d+)$', proc.stdout, re.MULTILINE)
+    packets = [line.split(',') for line in proc.stdout.splitlines() if line and not line.startswith('#')]
+    first_pts, last_pts = int(packets[0][1]), int(packets[-1][1])
+    frame = max(int(packet[3]) for packet in packets)
+    return (last_pts + frame - first_pts) * int(time_base.group(1)) / int(time_base.group(2))
+
+
+def ffmetadata(chapter_files, title, author, encoded_files=None):
+    """
+    Build an ffmpeg metadata file with the book tags and one chapter marker per chapter file,
+    timed by the encoded files instead if the chapters are muxed from those.
+    """
+    def escape(value):
+        return re.sub(r'([=;#\\\n])', r'\\\1', str(value))
+
+    lines = [';FFMETADATA1', f'title={escape(title)}', f'album={escape(title)}',
+             f'artist={escape(author)}', f'author={escape(author)}', 'genre=Audiobook']
+    start = 0
+    import soundfile as sf
+    for n, chapter_file in enumerate(chapter_files):
+        if encoded_files:
+            with metrics.time('mux'):
+                end = start + round(encoded_duration(encoded_files[n]) * 1000)
+        else:
+            info = sf.info(chapter_file)
+            end = start + round(info.frames * 1000 / info.samplerate)
+        match = re.search(r'_chapter_(\d+)\.\w+$', str(chapter_file))
+        chapter_title = f'Chapter {match.group(1)}' if match else Path(chapter_file).stem
+        lines += ['[CHAPTER]', 'TIMEBASE=1/1000', f'START={start}', f'END={end}', f'title={escape(chapter_title)}']
+        start = end
+    return '\n'.join(lines) + '\n'
+
+
+def stream_main(kokoro, file_path, lang, voice, speed, destination, stream_format, prefetch_seconds=STREAM_PREFETCH_SECONDS,
+                phoneme_cache=None, audio_cache=None, include=(), pick_manually=False, metrics_path=None, start=None,
+                stdout=None):
+    """
+    Narrate the book as a stream instead of chapter files: 16-bit PCM, raw or as WAV, to stdout ('-', or the
+    binary file stdout) or a file, or HLS with fMP4 segments in a directory. A synthesis thread keeps up to prefetch_seconds of audio ahead of
+    the writer, and the first sentences are synthesized one at a time, so the first audio is out in seconds.
+    Time to first audio is measured from start (by default the call) to when a player could start playing.
+    """
+    start = time.perf_counter() if start is None else start
+    run_start = time.time()
+    metrics.reset()
+    with metrics.time('parse'):
+        book, title, creator = read_book(file_path)
+    with book:
+        if pick_manually:
+            chapters = pick_chapters(book)
+        else:
+            with metrics.time('parse'):
+                chapters = find_chapters(book, include=include)
+        with metrics.time('extract'):
+            texts = [text for text in extract_texts(chapters) if len(text.strip()) >= 10]
+    if texts:
+        texts[0] = f'{title} by {creator}.\n\n' + texts[0]
+    print(f'{title} by {creator}: streaming {len(texts)} chapters, {sum(len(t) for t in texts):,} characters')
+    if stream_format == 'hls':
+        stream = HlsStream(destination)
+    elif destination == '-':
+        stream = PcmStream(stdout or sys.stdout.buffer, wav=stream_format == 'wav')
+    else:
+        stream = PcmStream(open(destination, 'wb'), wav=stream_format == 'wav')
+    buffer = PrefetchBuffer(prefetch_seconds)
+    synthesis = threading.Thread(target=buffer.fill, name='synthesis', daemon=True,
+                                 args=(stream_audio(kokoro, texts, voice, speed, lang, phoneme_cache, audio_cache),))
+    synthesis_start = time.time()
+    synthesis.start()
+    playback = PlaybackClock()
+    try:
+        for samples in buffer:
+            playback.arrived(len(samples) / SAMPLE_RATE)
+            with metrics.time('write', frames=len(samples)):
+                stream.write(samples)
+    except BrokenPipeError:
+        print('The stream was closed by its reader, stopping.')
+    finally:
+        buffer.close()
+        stream.close()
+        synthesis.join()
+    synthesis_seconds = time.time() - synthesis_start
+
+    first_audio = stream.first_audio_at - start if stream.first_audio_at is not None else None
+    report = dict(book=str(file_path), title=title, author=creator, voice=voice, lang=lang, speed=speed,
+                  stream=destination, stream_format=stream_format, prefetch_seconds=prefetch_seconds,
+                  started_at=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run_start)),
+                  characters=sum(len(t) for t in texts),
+                  time_to_first_audio_seconds=round(first_audio, 3) if first_audio is not None else None,
+                  underruns=playback.underruns, underrun_seconds=round(playback.underrun_seconds, 3),
+                  **metrics.report(time.time() - run_start, synthesis_seconds))
+    print_metrics(report)
+    if metrics_path is not None:
+        write_json_atomically(metrics_path, report)
+        print('Metrics written to', metrics_path)
+
+
+def stream_audio(kokoro, texts, voice, speed, lang, phoneme_cache=None, audio_cache=None):
+    """Synthesize the chapters in order, yielding the samples of each chunk, the very first ones a sentence each."""
+    for i, text in enumerate(texts, 1):
+        chunks = chunk_text(text)
+        if i == 1:
+            chunks = ramp_up(chunks)
+        with metrics.span('chapter', chapter=i, chars=len(text)):
+            for samples in synthesize_chunks(kokoro, chunks, voice, speed, lang, phoneme_cache, audio_cache):
+                metrics.count('chunks')
+                metrics.count('audio_seconds', len(samples) / SAMPLE_RATE)
+                yield samples
+
+
+def ramp_up(chunks, sentences=STREAM_RAMP_SENTENCES):
+    """Give each of the first sentences of chunks a chunk of its own, so that the first audio takes less to synthesize."""
+    ramped = []
+    for chunk_sentences, pause in chunks:
+        while sentences > 0 and len(chunk_sentences) > 1:
+            ramped.append((chunk_sentences[:1], SENTENCE_PAUSE))
+            chunk_sentences = chunk_sentences[1:]
+            sentences -= 1
+        ramped.append((chunk_sentences, pause))
+        sentences -= 1
+    return ramped
+
+
+class PrefetchBuffer:
+    """
+    Chunks of audio synthesized ahead of the writer, up to max_seconds of them (and always at least one chunk).
+    fill() runs in a synthesis thread while the writer iterates over the buffer, so synthesis goes on while the
+    writer is blocked on a player reading at real-time speed. An exception in fill() is raised in the writer.
+    """
+
+    def __init__(self, max_seconds):
+        self.max_seconds = max_seconds
+        self.condition = threading.Condition()
+        self.chunks = collections.deque()
+        self.seconds = 0.0
+        self.done = False
+        self.closed = False
+        self.error = None
+
+    def fill(self, audio_chunks):
+        try:
+            for samples in audio_chunks:
+                seconds = len(samples) / SAMPLE_RATE
+                with self.condition:
+                    self.condition.wait_for(lambda: self.closed or not self.chunks
+                                            or self.seconds + seconds <= self.max_seconds)
+                    if self.closed:
+                        return
+                    self.chunks.append(samples)
+                    self.seconds += seconds
+                    self.condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def __iter__(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.chunks or self.done)
+                if not self.chunks:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                samples = self.chunks.popleft()
+                self.seconds -= len(samples) / SAMPLE_RATE
+                self.condition.notify_all()
+            yield samples
+
+    def close(self):
+        """Stop the synthesis thread after its current chunk, e.g. when the player has gone away."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class PlaybackClock:
+    """
+    Where a player started at the first chunk would be, to count the times it would have run out of audio
+    waiting for synthesis (underruns) and for how long: a player pauses when it runs dry, so each one delays the rest.
+    """
+
+    def __init__(self):
+        self.runs_out_at = None
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+
+    def arrived(self, audio_seconds, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.runs_out_at is None:
+            self.runs_out_at = now
+        elif now > self.runs_out_at:
+            self.underruns += 1
+            self.underrun_seconds += now - self.runs_out_at
+            self.runs_out_at = now
+        self.runs_out_at += audio_seconds
+
+
+def pcm16(samples):
+    import numpy as np
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def wav_header(data_bytes=0xFFFFFFFF):
+    """Header of a 16-bit mono WAV; the default unknown length is how a WAV of unknown length is streamed."""
+    riff_bytes = min(data_bytes + 36, 0xFFFFFFFF)
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', riff_bytes, b'WAVE', b'fmt ', 16, 1, 1,
+                       SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16, b'data', data_bytes)
+
+
+class PcmStream:
+    """
+    16-bit PCM written to a pipe or file and flushed chunk by chunk, raw or behind a WAV header.
+    A WAV file, unlike a pipe, gets the real length in its header when closed. Closing closes f.
+    """
+
+    def __init__(self, f, wav=True):
+        self.f = f
+        self.wav = wav
+        self.data_bytes = 0
+        self.first_audio_at = None
+        if wav:
+            f.write(wav_header())
+
+    def write(self, samples):
+        data = pcm16(samples)
+        self.f.write(data)
+        self.f.flush()
+        self.data_bytes += len(data)
+        if self.first_audio_at is None:
+            self.first_audio_at = time.perf_counter()
+
+    def close(self):
+        with contextlib.suppress(BrokenPipeError):
+            if self.wav and self.f.seekable():
+                self.f.seek(0)
+                self.f.write(wav_header(self.data_bytes))
+            self.f.close()
+
+
+class HlsStream:
+    """
+    HLS in a directory: ffmpeg encodes the PCM it is fed to AAC and writes fMP4 segments, adding each one to
+    index.m3u8 as soon as it is complete.
+    """
+
+    def __init__(self, directory, segment_seconds=HLS_SEGMENT_SECONDS):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.playlist = Path(directory) / 'index.m3u8'
+        self.playlist.unlink(missing_ok=True)  # left over from an earlier stream
+        self.first_audio_at = None
+        self.proc = subprocess.Popen([
+            'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', 'pipe:0', '-c:a', 'aac', '-b:a', '64k',
+            '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'event', '-hls_segment_type', 'fmp4',
+            '-hls_segment_filename', str(Path(directory) / 'segment_%05d.m4s'), str(self.playlist),
+        ], stdin=subprocess.PIPE)
+        self.watcher = threading.Thread(target=self.watch_playlist, name='hls-playlist', daemon=True)
+        self.watcher.start()
+
+    def has_segment(self):
+        with contextlib.suppress(OSError):
+            return '#EXTINF' in self.playlist.read_text(encoding='utf-8')
+        return False
+
+    def watch_playlist(self):
+        """The first audio is out when the playlist lists its first segment."""
+        while self.proc.poll() is None:
+            if self.has_segment():
+                self.first_audio_at = time.perf_counter()
+                return
+            time.sleep(0.02)
+
+    def write(self, samples):
+        self.proc.stdin.write(pcm16(samples))
+        self.proc.stdin.flush()
+
+    def close(self):
+        with contextlib.suppress(BrokenPipeError):
+            self.proc.stdin.close()
+        self.proc.wait()
+        self.watcher.join()
+        if self.first_audio_at is None and self.has_segment():
+            self.first_audio_at = time.perf_counter()
+        if self.proc.returncode == 0:
+            print(f'{self.playlist} complete.')
+
+
+def check_model_files(model_path=DEFAULT_MODEL):
+    if model_path != DEFAULT_MODEL and not Path(model_path).exists():
+        print(f'Error: model {model_path} not found.')
+        sys.exit(1)
+    if not Path(model_path).exists() or not Path('voices.json').exists():
         print('Error: kokoro-v0_19.onnx and voices.json must be in the current directory. Please download them with:')
         print('wget https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files/kokoro-v0_19.onnx')
         print('wget https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files/voices.json')
         sys.exit(1)
-    # kokoro = Kokoro('kokoro-v0_19.onnx', 'voices.json')
-    kokoro = Kokoro('kokoro-v0_19.onnx', 'voices.json')
-    kokoro.sess.set_providers(['CUDAExecutionProvider', 'CPUExecutionProvider'])
 
-    voices = list(kokoro.get_voices())
-    voices_str = ', '.join(voices)
+
+def voice_names(voices_path='voices.json'):
+    """
+    The voice names in voices.json, without parsing the style vectors that make up almost all of it:
+    they hold only numbers, so every quoted string followed by a colon is a voice name.
+    """
+    return [name.decode('utf-8') for name in re.findall(rb'"([^"]+)"\s*:', Path(voices_path).read_bytes())]
+
+
+def read_batch_manifest(source, lang, voice, speed):
+    """
+    Return the list of books to convert as dicts with path, lang, voice and speed.
+    source is either a directory of .epub files, converted with the given defaults, or a JSON/CSV manifest
+    where each book can override them. Relative paths in a manifest are relative to the manifest itself.
+    """
+    source = Path(source)
+    defaults = dict(lang=lang, voice=voice, speed=speed)
+    if source.is_dir():
+        return [dict(defaults, path=str(p)) for p in sorted(source.iterdir()) if p.suffix.lower() == '.epub']
+    if source.suffix.lower() == '.csv':
+        with open(source, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(source, encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows['books']
+    books = []
+    for row in rows:
+        if isinstance(row, str):
+            row = {'path': row}
+        book = dict(defaults, **{k: v for k, v in row.items() if v not in (None, '')})
+        book['path'] = str(source.parent / book['path'])
+        book['speed'] = float(book['speed'])
+        books.append(book)
+    return books
+
+
+def pending_books(books, status):
+    """
+    Books of the batch still to convert, in order: every book the status file does not record as done,
+    so that a book left running by an interrupted batch and the failed ones are converted again.
+    """
+    return [b for b in books if status.get(b['path'], {}).get('status') != 'done']
+
+
+def worker_threads(args):
+    """Threads of the model loaded by the main process: all of them with one worker, one for workers sharing it."""
+    return args.threads if args.workers <= 1 else 1
+
+
+def load_model(args, session_settings):
+    """
+    The model of a command line run. Workers that do not share the model each load their own, so it is not
+    loaded here, unless the book turns out to need it (see ModelFiles).
+    """
+    if args.workers > 1 and not args.share_model:
+        return ModelFiles(args.model, 'voices.json', args.threads, session_settings, args.cache_dir)
+    return load_kokoro(args.model, 'voices.json', worker_threads(args), session_settings, args.cache_dir)
+
+
+def write_json_atomically(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(prog='audiblez batch',
+                                     description='Convert a whole library of e-books, loading the model only once.')
+    parser.add_argument('source', help='Directory of .epub files, or a JSON/CSV manifest with path, voice, lang and speed per book')
+    parser.add_argument('-l', '--lang', default='en-gb', help='Default language code')
+    parser.add_argument('-v', '--voice', default='af_sky', help='Default narrating voice')
+    parser.add_argument('-s', '--speed', default=1.0, help='Default speed from 0.5 to 2.0', type=float)
+    parser.add_argument('--status', default=None,
+                        help='Status file used to resume an interrupted batch (default: audiblez-batch-status.json next to the source)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Where to keep caches between runs (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', default=False, help='Do not read or write any cache', action='store_true')
+    parser.add_argument('--cache-size', default=AUDIO_CACHE_MAX_MB, type=int, help='Maximum size in MB of the audio cache')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='Number of worker processes per book')
+    parser.add_argument('-t', '--threads', default=None, type=int, help='ONNX intra-op threads per worker')
+    parser.add_argument('--share-model', default=False, action='store_true',
+                        help='Load the model once and fork the workers, which share its memory (one thread each)')
+    parser.add_argument('--intermediate-format', default='wav', choices=INTERMEDIATE_FORMATS,
+                        help='Format of the chapter files the audiobook is assembled from (default: wav)')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f'Kokoro ONNX model, e.g. one made by audiblez quantize (default: {DEFAULT_MODEL})')
+    add_session_arguments(parser)
+    parser.add_argument('--metrics', default=False, action='store_true',
+                        help='Write the timings of each book to <book>.metrics.json next to its audiobook')
+    args = parser.parse_args(argv)
+    session_settings = read_session_settings(parser, args)
+    if args.share_model and args.threads not in (None, 1):
+        parser.error('workers sharing the model run on one thread each, --threads cannot be used with --share-model')
+
+    books = read_batch_manifest(args.source, args.lang, args.voice, args.speed)
+    source = Path(args.source)
+    status_path = Path(args.status or (source if source.is_dir() else source.parent) / 'audiblez-batch-status.json')
+    status = json.loads(status_path.read_text(encoding='utf-8')) if status_path.exists() else {}
+    pending = pending_books(books, status)
+    print(f'{len(books)} books in batch, {len(books) - len(pending)} already done.')
+    if not pending:
+        return
+
+    check_model_files(args.model)
+    kokoro = load_model(args, session_settings)
+    phoneme_cache, audio_cache = None, None
+    if not args.no_cache:
+        phoneme_cache = DiskCache(Path(args.cache_dir) / 'phonemes.sqlite', PHONEME_CACHE_MAX_BYTES)
+        audio_cache = DiskCache(Path(args.cache_dir) / 'audio.sqlite', args.cache_size * 1024 * 1024)
+    for n, book in enumerate(pending, 1):
+        print(f'[{n}/{len(pending)}] {book["path"]} (voice {book["voice"]}, lang {book["lang"]}, speed {book["speed"]})')
+        status[book['path']] = dict(book, status='running', started_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+        write_json_atomically(status_path, status)
+        try:
+            if book['voice'] not in kokoro.get_voices():
+                raise ValueError(f'Unknown voice {book["voice"]}')
+            metrics_path = Path(book['path']).with_suffix('.metrics.json').name if args.metrics else None
+            main(kokoro, book['path'], book['lang'], book['voice'], False, book['speed'],
+                 phoneme_cache=phoneme_cache, audio_cache=audio_cache, workers=args.workers, threads=args.threads,
+                 metrics_path=metrics_path, share_model=args.share_model,
+                 intermediate_format=args.intermediate_format, on_event=print_event)
+            status[book['path']].update(status='done', finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+        except Exception as e:
+            print(f'Failed to convert {book["path"]}: {e}')
+            status[book['path']].update(status='failed', error=str(e))
+        write_json_atomically(status_path, status)
+    failed = [path for path, s in status.items() if s['status'] == 'failed']
+    if failed:
+        print(f'{len(failed)} books failed, run the same command again to retry them:', failed)
+        sys.exit(1)
+
+
+class SynthesisServer:
+    """
+    Keeps one warm Kokoro session and runs submitted jobs round-robin, one chunk at a time,
+    so a short text job is never stuck behind a whole book. Every job keeps a list of progress events.
+    A cancelled job is dropped before its next chunk, while the session goes on with the other jobs.
+    A job step that is not synthesis, like parsing the book or encoding the .m4b, yields a future of it running
+    in a background thread instead, and the job is set aside until it is done.
+    """
+
+    def __init__(self, kokoro, phoneme_cache=None, audio_cache=None):
+        self.kokoro = kokoro
+        self.phoneme_cache = phoneme_cache
+        self.audio_cache = audio_cache
+        self.jobs = {}
+        self.active = collections.deque()
+        self.condition = threading.Condition()
+        self.background = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='server-background')
+
+    def submit(self, spec):
+        with self.condition:
+            job_id = len(self.jobs) + 1
+            job = dict(id=job_id, spec=spec, status='queued', events=[dict(event='queued', job=job_id)])
+            job['steps'] = self.job_steps(spec)
+            self.jobs[job_id] = job
+            self.active.append(job)
+            self.condition.notify_all()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it had already ended."""
+        with self.condition:
+            job = self.jobs[job_id]
+            if job['steps'] is None:
+                return False
+            job['cancelled'] = True
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.active:
+                    self.condition.wait()
+                job = self.active.popleft()
+                job['status'] = 'running'
+            finished = False
+            try:
+                if job.get('cancelled'):
+                    job['steps'].close()  # the chapter's .part file and manifest keep what was done
+                    raise Cancelled()
+                event = next(job['steps'])
+                if isinstance(event, concurrent.futures.Future):
+                    event.add_done_callback(lambda _, job=job: self.resume(job))
+                    continue
+            except Cancelled:
+                event, finished = dict(event='cancelled'), True
+            except StopIteration:
+                event, finished = dict(event='done'), True
+            except Exception as e:
+                event, finished = dict(event='error', error=str(e)), True
+            with self.condition:
+                job['events'].append(dict(event, job=job['id'], time=time.time()))
+                if finished:
+                    job['status'] = event['event']
+                    job['steps'] = None
+                else:
+                    self.active.append(job)
+                self.condition.notify_all()
+
+    def resume(self, job):
+        with self.condition:
+            self.active.append(job)
+            self.condition.notify_all()
+
+    def wait_events(self, job_id, start, timeout=30):
+        """Return the events of a job from index start, blocking until there is at least one or the job ended."""
+        job = self.jobs[job_id]
+        with self.condition:
+            self.condition.wait_for(lambda: len(job['events']) > start or job['steps'] is None, timeout)
+            return job['events'][start:], job['steps'] is None
+
+    def job_steps(self, spec):
+        voice, speed, lang = spec.get('voice', 'af_sky'), float(spec.get('speed', 1.0)), spec.get('lang', 'en-gb')
+        if voice not in self.kokoro.get_voices():
+            raise ValueError(f'Unknown voice {voice}')
+        if 'text' in spec:
+            output = spec.get('output') or str(Path(spec.get('output_dir', '.')) / 'audiblez_text.wav')
+            yield from self.chapter_steps(1, output, spec['text'], voice, speed, lang)
+            return
+        file_path = spec['epub']
+        filename = str(Path(spec.get('output_dir', '.')) / Path(file_path).name)
+        parsed = self.background.submit(self.read_book_texts, file_path, spec.get('include', ()))
+        yield parsed
+        title, creator, texts = parsed.result()
+        manifest = RunManifest(filename.replace('.epub', '.manifest.sqlite'))
+        chapter_files, jobs = plan_chapters(filename, texts, f'{title} by {creator}', voice, speed, lang, manifest,
+                                            spec.get('intermediate_format', 'wav'))
+        yield dict(event='book', title=title, author=creator, chapters=len(jobs),
+                   total_chars=sum(len(text) for _, _, text in jobs))
+        for i, chapter_filename, text in jobs:
+            yield from self.chapter_steps(i, chapter_filename, text, voice, speed, lang, manifest)
+        if shutil.which('ffmpeg') is not None:
+            muxed = self.background.submit(create_m4b, chapter_files, filename, title, creator)
+            yield muxed
+            muxed.result()
+            yield dict(event='m4b', file=filename.replace('.epub', '.m4b'))
+
+    @staticmethod
+    def read_book_texts(file_path, include=()):
+        book, title, creator = read_book(file_path)
+        with book:
+            return title, creator, extract_texts(find_chapters(book, include=include))
+
+    def chapter_steps(self, i, chapter_filename, text, voice, speed, lang, manifest=None):
+        yield dict(event='chapter_started', chapter=i, chars=len(text))
+        for n, total in synthesize_chapter_steps(self.kokoro, chapter_filename, text, voice, speed, lang,
+                                                 self.phoneme_cache, self.audio_cache, manifest):
+            yield dict(event='chunk_done', chapter=i, chunk=n, chunks=total)
+        yield dict(event='chapter_done', chapter=i, file=chapter_filename)
+
+
+def make_request_handler(server):
+    import http.server
+
+    class RequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/jobs':
+                return self.send_error(404)
+            try:
+                spec = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            except ValueError:
+                return self.send_error(400, 'The job is not valid JSON')
+            if not isinstance(spec, dict) or not ('text' in spec or 'epub' in spec):
+                return self.send_error(400, 'A job needs a text or an epub')
+            self.send_json(dict(id=server.submit(spec)))
+
+        def do_DELETE(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) != 2 or parts[0] != 'jobs' or not parts[1].isdigit() or int(parts[1]) not in server.jobs:
+                return self.send_error(404)
+            self.send_json(dict(cancelled=server.cancel(int(parts[1]))))
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts == ['jobs']:
+                return self.send_json([dict(id=j['id'], status=j['status'], spec=j['spec']) for j in server.jobs.values()])
+            if len(parts) != 3 or parts[0] != 'jobs' or parts[2] != 'events' or not parts[1].isdigit() \
+                    or int(parts[1]) not in server.jobs:
+                return self.send_error(404)
+            # Stream events as JSON lines until the job ends; the connection is closed at the end.
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            sent, finished = 0, False
+            while not finished:
+                events, finished = server.wait_events(int(parts[1]), sent)
+                for event in events:
+                    self.wfile.write((json.dumps(event) + '\n').encode('utf-8'))
+                self.wfile.flush()
+                sent += len(events)
+
+        def send_json(self, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RequestHandler
+
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(prog='audiblez serve',
+                                     description='Keep the model loaded and convert books submitted with audiblez --server.')
+    parser.add_argument('--port', default=SERVER_PORT, type=int, help=f'Port to listen on, on localhost only (default: {SERVER_PORT})')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Where to keep caches between runs (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', default=False, help='Do not read or write any cache', action='store_true')
+    parser.add_argument('--cache-size', default=AUDIO_CACHE_MAX_MB, type=int, help='Maximum size in MB of the audio cache')
+    parser.add_argument('-t', '--threads', default=None, type=int, help='ONNX intra-op threads')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f'Kokoro ONNX model, e.g. one made by audiblez quantize (default: {DEFAULT_MODEL})')
+    add_session_arguments(parser)
+    args = parser.parse_args(argv)
+    session_settings = read_session_settings(parser, args)
+    check_model_files(args.model)
+    kokoro = load_kokoro(args.model, 'voices.json', args.threads, session_settings, args.cache_dir)
+    phoneme_cache, audio_cache = None, None
+    if not args.no_cache:
+        phoneme_cache = DiskCache(Path(args.cache_dir) / 'phonemes.sqlite', PHONEME_CACHE_MAX_BYTES)
+        audio_cache = DiskCache(Path(args.cache_dir) / 'audio.sqlite', args.cache_size * 1024 * 1024)
+    server = SynthesisServer(kokoro, phoneme_cache, audio_cache)
+    threading.Thread(target=server.run, daemon=True).start()
+    import http.server
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', args.port), make_request_handler(server))
+    print(f'audiblez server listening on http://127.0.0.1:{args.port}, press Ctrl+C to stop.')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def submit_to_server(spec, port=SERVER_PORT):
+    """
+    Submit a job to a running audiblez server and print its progress events until it ends; Ctrl+C cancels the job.
+    Returns False without doing anything if no server is listening; exits if the server refuses the job.
+    """
+    url = f'http://127.0.0.1:{port}'
+    request = urllib.request.Request(f'{url}/jobs', json.dumps(spec).encode('utf-8'),
+                                     {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            job_id = json.load(response)['id']
+    except urllib.error.HTTPError as e:  # a server is running, but refused the job
+        print('\033[91m' + f'The audiblez server at {url} refused the job: {e.code} {e.reason}' + '\033[0m')
+        sys.exit(1)
+    except urllib.error.URLError:
+        return False
+    print(f'Submitted job {job_id} to the audiblez server at {url}')
+    try:
+        print_server_events(urllib.request.urlopen(f'{url}/jobs/{job_id}/events'))
+    except KeyboardInterrupt:
+        urllib.request.urlopen(urllib.request.Request(f'{url}/jobs/{job_id}', method='DELETE'), timeout=5).close()
+        print(f'\nCancelled job {job_id}, the server stops it after the current chunk.')
+        sys.exit(130)
+    return True
+
+
+def print_server_events(response):
+    with response:
+        for line in response:
+            event = json.loads(line)
+            name = event.pop('event')
+            if name == 'chunk_done':
+                print(f'Chapter {event["chapter"]}: chunk {event["chunk"]}/{event["chunks"]}', end='\r')
+            elif name == 'chapter_done':
+                print(f'Chapter written to {event["file"]}'.ljust(40))
+            elif name == 'error':
+                print('\033[91m' + f'Job failed: {event["error"]}' + '\033[0m')
+                sys.exit(1)
+            elif name in ('queued', 'book', 'chapter_started', 'm4b', 'done', 'cancelled'):
+                print(name.replace('_', ' ').capitalize() + ':', {k: v for k, v in event.items() if k not in ('job', 'time')})
+
+
+def quantize_model(model_path, output_path, op_types=QUANTIZED_OP_TYPES):
+    """Write a copy of the model with the weights of op_types quantized to INT8, activations quantized at run time."""
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError:  # onnxruntime.quantization needs the onnx package
+        print('Error: quantizing needs the onnx package, install it with: pip install onnx')
+        sys.exit(1)
+    quantize_dynamic(model_path, output_path, op_types_to_quantize=list(op_types), weight_type=QuantType.QUInt8)
+
+
+def compare_model_job(model_path, voices_path, text, voice, lang, runs):
+    # Runs in a fresh process, so that its peak RSS is the footprint of this model alone.
+    start = time.perf_counter()
+    kokoro = load_kokoro(model_path, voices_path, settings=dict(optimized_model_cache=False))
+    load_seconds = time.perf_counter() - start
+    phonemes = kokoro.tokenizer.phonemize(text, lang)
+    samples, sample_rate = kokoro.create(text, voice, lang=lang, phonemes=phonemes)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        samples, sample_rate = kokoro.create(text, voice, lang=lang, phonemes=phonemes)
+        timings.append(time.perf_counter() - start)
+    audio_seconds = len(samples) / sample_rate
+    return dict(model=str(model_path), model_mb=Path(model_path).stat().st_size / 1024 / 1024,
+                load_seconds=load_seconds, synthesis_seconds=min(timings), audio_seconds=audio_seconds,
+                real_time_factor=audio_seconds / min(timings), peak_rss_mb=peak_rss_mb(), samples=samples)
+
+
+def spectral_distance(a, b, n_fft=1024):
+    """
+    Log-spectral distance in dB between the long-term average spectra of two signals. It ignores timing,
+    which quantization changes slightly through the predicted durations, and measures changes of timbre and noise.
+    """
+    import numpy as np
+    spectra = []
+    for samples in (a, b):
+        frames = np.lib.stride_tricks.sliding_window_view(samples, n_fft)[::n_fft // 2] * np.hanning(n_fft)
+        spectra.append(10 * np.log10(np.mean(np.abs(np.fft.rfft(frames)) ** 2, axis=0) + 1e-10))
+    return float(np.sqrt(np.mean((spectra[0] - spectra[1]) ** 2)))
+
+
+def compare_models(model_paths, voices_path, text, voice, lang, runs=3):
+    results = []
+    for model_path in model_paths:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results.append(executor.submit(compare_model_job, model_path, voices_path, text, voice, lang, runs).result())
+    reference = results[0].pop('samples')
+    for result in results[1:]:
+        result['spectral_distance_db'] = spectral_distance(reference, result.pop('samples'))
+    return results
+
+
+def quantize_main(argv):
+    parser = argparse.ArgumentParser(prog='audiblez quantize',
+                                     description='Make a dynamically quantized INT8 copy of the model, '
+                                                 'faster on CPU, and compare it with the original.')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f'Model to quantize (default: {DEFAULT_MODEL})')
+    parser.add_argument('-o', '--output', default=None, help='Quantized model to write (default: <model>.int8.onnx)')
+    parser.add_argument('--op-types', nargs='+', default=QUANTIZED_OP_TYPES,
+                        help=f'Operators whose weights are quantized (default: {" ".join(QUANTIZED_OP_TYPES)})')
+    parser.add_argument('--compare', default=False, action='store_true',
+                        help='Synthesize a fixed passage with both models and report their real-time factor, memory '
+                             'and spectral distance; an existing quantized model is reused')
+    parser.add_argument('--text', default=CALIBRATION_TEXT, help='Passage to synthesize for --compare')
+    parser.add_argument('-v', '--voice', default='af_sky', help='Voice for --compare')
+    parser.add_argument('-l', '--lang', default='en-us', help='Language code for --compare')
+    parser.add_argument('--runs', default=3, type=int, help='Timed syntheses per model for --compare, the best counts')
+    args = parser.parse_args(argv)
+    check_model_files(args.model)
+    output = args.output or str(Path(args.model).with_suffix('.int8.onnx'))
+    if not (args.compare and Path(output).exists()):
+        print(f'Quantizing {args.model} to {output}...')
+        quantize_model(args.model, output, args.op_types)
+    print(f'{Path(args.model).stat().st_size / 1024 / 1024:.1f} MB -> {Path(output).stat().st_size / 1024 / 1024:.1f} MB, '
+          f'use it with: audiblez book.epub --model {output}')
+    if not args.compare:
+        return
+    results = compare_models([args.model, output], 'voices.json', args.text, args.voice, args.lang, args.runs)
+    print(f'{"model":<30} {"size MB":>8} {"load s":>7} {"RTF":>7} {"peak RSS MB":>12} {"spectral dist dB":>17}')
+    for r in results:
+        distance = f'{r["spectral_distance_db"]:.2f}' if 'spectral_distance_db' in r else '(reference)'
+        rss = f'{r["peak_rss_mb"]:.0f}' if r['peak_rss_mb'] is not None else '-'
+        print(f'{Path(r["model"]).name:<30} {r["model_mb"]:>8.1f} {r["load_seconds"]:>7.2f} '
+              f'{r["real_time_factor"]:>6.1f}x {rss:>12} {distance:>17}')
+
+
+def cli_main():
+    start = time.perf_counter()  # of the time to first audio of --stream
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        return batch_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        return serve_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'quantize':
+        return quantize_main(sys.argv[2:])
+    voices = voice_names() if Path('voices.json').exists() else []
+    voices_str = ', '.join(voices) or 'see voices.json'
     epilog = 'example:\n' + \
-             '  audiblez book.epub -l en-us -v af_sky'
-    default_voice = 'af_sky' if 'af_sky' in voices else voices[0]
+             '  audiblez book.epub -l en-us -v af_sky\n' + \
+             '  audiblez batch library/ -l en-gb -v af_sky   (see audiblez batch --help)\n' + \
+             '  audiblez serve                               (see audiblez serve --help)\n' + \
+             '  audiblez quantize --compare                  (see audiblez quantize --help)'
+    default_voice = 'af_sky' if 'af_sky' in voices or not voices else voices[0]
     parser = argparse.ArgumentParser(epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('epub_file_path', help='Path to the epub file')
     parser.add_argument('-l', '--lang', default='en-gb', help='Language code: en-gb, en-us, fr-fr, ja, ko, cmn')
@@ -191,11 +2388,113 @@ def cli_main():
     parser.add_argument('-p', '--pick', default=False, help=f'Interactively select which chapters to read in the audiobook',
                         action='store_true')
     parser.add_argument('-s', '--speed', default=1.0, help=f'Set speed from 0.5 to 2.0', type=float)
+    parser.add_argument('-i', '--include', default=[], action='append', choices=DOCUMENT_KINDS[1:],
+                        help='Also narrate this kind of document, which is skipped by default (repeatable)')
+    parser.add_argument('--report', default=False, action='store_true',
+                        help='Only print the characters and estimated time of every document, do not synthesize')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Where to keep caches between runs (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', default=False, help='Do not read or write any cache', action='store_true')
+    parser.add_argument('--cache-size', default=AUDIO_CACHE_MAX_MB, type=int,
+                        help=f'Maximum size in MB of the synthesized audio cache (default: {AUDIO_CACHE_MAX_MB})')
+    parser.add_argument('-w', '--workers', default=1, type=int,
+                        help='Number of worker processes synthesizing chapters in parallel, each loading the model once')
+    parser.add_argument('--metrics', default=None, metavar='OUT.json',
+                        help='Write per-stage timings, real-time factor and peak memory of the run to a JSON file')
+    parser.add_argument('--trace', default=None, metavar='TRACE.json',
+                        help='Record a timeline of every chapter, chunk and stage in Chrome Trace Event format, '
+                             'to open in https://ui.perfetto.dev')
+    parser.add_argument('-t', '--threads', default=None, type=int,
+                        help='ONNX intra-op threads per worker (default: CPU count divided by workers)')
+    parser.add_argument('--share-model', default=False, action='store_true',
+                        help='Load the model once and fork the workers, which share its memory instead of each '
+                             'loading a copy; every worker then runs on one thread')
+    parser.add_argument('--intermediate-format', default='wav', choices=INTERMEDIATE_FORMATS,
+                        help='Format of the chapter files the audiobook is assembled from: flac is lossless and '
+                             'about half the size of wav, ogg is lossy and much smaller (default: wav)')
+    parser.add_argument('--stream', default=None, metavar='DEST',
+                        help='Play as it is synthesized instead of making an audiobook: write audio to stdout (-) or '
+                             'a .wav or .pcm file, or HLS segments to a directory, as soon as every chunk is ready')
+    parser.add_argument('--stream-format', default=None, choices=STREAM_FORMATS,
+                        help='16-bit 24 kHz mono wav or raw pcm, or hls (fMP4 segments and index.m3u8, needs ffmpeg); '
+                             'by default wav for stdout and .wav files, pcm for .pcm files, hls for directories')
+    parser.add_argument('--prefetch', default=STREAM_PREFETCH_SECONDS, type=float, metavar='SECONDS',
+                        help=f'Seconds of audio synthesized ahead of playback when streaming (default: {STREAM_PREFETCH_SECONDS})')
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help=f'Kokoro ONNX model, e.g. the INT8 one made by audiblez quantize (default: {DEFAULT_MODEL})')
+    parser.add_argument('--server', default=False, action='store_true',
+                        help='Submit the book to a running "audiblez serve" instead of loading the model here')
+    parser.add_argument('--server-port', default=SERVER_PORT, type=int, help=f'Port of the audiblez server (default: {SERVER_PORT})')
+    add_session_arguments(parser)
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
         sys.exit(1)
     args = parser.parse_args()
-    main(kokoro, args.epub_file_path, args.lang, args.voice, args.pick, args.speed)
+    session_settings = read_session_settings(parser, args)
+    # Fail on bad arguments before paying for the imports and the model
+    if not Path(args.epub_file_path).is_file():
+        parser.error(f'{args.epub_file_path} not found')
+    if not 0.5 <= args.speed <= 2.0:
+        parser.error('speed must be between 0.5 and 2.0')
+    if args.workers < 1:
+        parser.error('workers must be at least 1')
+    if args.share_model and args.threads not in (None, 1):
+        parser.error('workers sharing the model run on one thread each, --threads cannot be used with --share-model')
+    if args.stream is not None:
+        if args.stream_format is None:
+            suffix = Path(args.stream).suffix.lower()
+            args.stream_format = 'pcm' if suffix in ('.pcm', '.raw') else 'wav' if args.stream == '-' or suffix == '.wav' else 'hls'
+        if args.stream_format == 'hls' and args.stream == '-':
+            parser.error('hls streams are written to a directory, not stdout')
+        if args.server or args.workers > 1 or args.report:
+            parser.error('--stream synthesizes here, in order, and cannot be used with --server, --workers or --report')
+        if args.pick and args.stream == '-':
+            parser.error('--pick needs the terminal, it cannot be used with --stream -')
+    elif args.stream_format is not None:
+        parser.error('--stream-format needs --stream')
+    if args.server:
+        ignored = [option for option, dest in SERVER_IGNORED_OPTIONS if getattr(args, dest) != parser.get_default(dest)]
+        if ignored:
+            parser.error('the server synthesizes with its own model, caches and settings, '
+                         f'--server cannot be used with {", ".join(ignored)}')
+        spec = dict(epub=str(Path(args.epub_file_path).resolve()), lang=args.lang, voice=args.voice,
+                    speed=args.speed, output_dir=os.getcwd(), intermediate_format=args.intermediate_format,
+                    include=args.include)
+        if submit_to_server(spec, args.server_port):
+            return
+        print(f'No audiblez server running on port {args.server_port}, converting here.')
+    check_model_files(args.model)
+    if args.voice not in voices:
+        parser.error(f'unknown voice {args.voice}, choose one of: {voices_str}')
+    stdout = None
+    if args.stream == '-':
+        # stdout is the audio's alone: whatever is printed, also by native libraries, goes to stderr instead
+        sys.stdout.flush()
+        stdout = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    if args.trace:
+        metrics.start_trace()
+    with metrics.span('load model'):
+        kokoro = load_model(args, session_settings)
+    phoneme_cache, audio_cache = None, None
+    if not args.no_cache:
+        phoneme_cache = DiskCache(Path(args.cache_dir) / 'phonemes.sqlite', PHONEME_CACHE_MAX_BYTES)
+        audio_cache = DiskCache(Path(args.cache_dir) / 'audio.sqlite', args.cache_size * 1024 * 1024)
+    try:
+        if args.stream is not None:
+            with metrics.span('stream', book=args.epub_file_path):
+                stream_main(kokoro, args.epub_file_path, args.lang, args.voice, args.speed, args.stream,
+                            args.stream_format, args.prefetch, phoneme_cache, audio_cache, args.include, args.pick,
+                            args.metrics, start, stdout)
+            return
+        with metrics.span('main', book=args.epub_file_path):
+            main(kokoro, args.epub_file_path, args.lang, args.voice, args.pick, args.speed,
+                 phoneme_cache=phoneme_cache, audio_cache=audio_cache, workers=args.workers, threads=args.threads,
+                 include=args.include, report_only=args.report, metrics_path=args.metrics,
+                 share_model=args.share_model, intermediate_format=args.intermediate_format, on_event=print_event)
+    finally:
+        if args.trace:
+            metrics.write_trace(args.trace)
+            print('Trace written to', args.trace)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,73 @@
+# Benchmark of opening an EPUB and extracting its chapter text: ebooklib's read_epub, which
+# decompresses every item of the archive, against audiblez's LazyEpub, which only reads the
+# OPF package document and the chapters. Uses a synthetic image-heavy book.
+#
+#   python bench/bench_epub_load.py [number of images] [image size in MB]
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+
+from ebooklib import epub
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from audiblez import LazyEpub, find_chapters, extract_texts
+
+
+def make_book(path, chapters, images, image_size):
+    book = epub.EpubBook()
+    book.set_title('Image heavy book')
+    book.add_author('Benchmark')
+    spine = []
+    for n in range(1, chapters + 1):
+        chapter = epub.EpubHtml(title=f'Chapter {n}', file_name=f'chapter_{n}.xhtml')
+        chapter.content = f'<h1>Chapter {n}</h1>' + '<p>Four score and seven years ago.</p>' * 200
+        book.add_item(chapter)
+        spine.append(chapter)
+    for n in range(images):
+        # random bytes do not compress, like real JPEG and PNG images
+        book.add_item(epub.EpubImage(uid=f'image_{n}', file_name=f'images/{n}.jpg', media_type='image/jpeg',
+                                     content=os.urandom(image_size)))
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = spine
+    epub.write_epub(path, book)
+
+
+def measure(open_book, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    texts = extract_texts(find_chapters(open_book(path)))
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, texts
+
+
+def read_epub(path):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return epub.read_epub(path)
+
+
+def main():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    image_size = int(float(sys.argv[2]) * 1024 * 1024) if len(sys.argv) > 2 else 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'book.epub')
+        make_book(path, 50, images, image_size)
+        print(f'{Path(path).stat().st_size / 1e6:.0f} MB epub, 50 chapters, {images} images')
+        print(f'{"reader":<12} {"seconds":>8} {"peak MB":>8}')
+        results = {}
+        for name, open_book in (('ebooklib', read_epub), ('LazyEpub', LazyEpub)):
+            seconds, peak, results[name] = measure(open_book, path)
+            print(f'{name:<12} {seconds:>8.3f} {peak / 1e6:>8.1f}')
+        assert results['ebooklib'] == results['LazyEpub'], 'extracted texts differ'
+
+
+if __name__ == '__main__':
+    main()
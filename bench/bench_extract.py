@@ -0,0 +1,76 @@
+# Micro-benchmark of chapter text extraction: the lxml implementation in audiblez.extract_texts
+# against the BeautifulSoup implementation it replaced, on the bundled Gettysburg EPUB and on
+# synthetic books made of its chapter repeated 10x, 100x and 1000x.
+#
+#   python bench/bench_extract.py
+
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import ebooklib
+from bs4 import BeautifulSoup
+from ebooklib import epub
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from audiblez import extract_texts
+
+GETTYSBURG = Path(__file__).parent.parent / 'GETTYSBURG ADDRESS - Abraham Lincoln.epub'
+
+
+class Document:
+    def __init__(self, content):
+        self.content = content
+
+    def get_body_content(self):
+        return self.content
+
+
+def extract_texts_bs4(chapters):
+    texts = []
+    for chapter in chapters:
+        soup = BeautifulSoup(chapter.get_body_content(), features='lxml')
+        chapter_text = ''
+        for child in soup.find_all(['title', 'p', 'h1', 'h2', 'h3', 'h4']):
+            inner_text = child.text.strip() if child.text else ""
+            if inner_text:
+                chapter_text += inner_text + '\n'
+        texts.append(chapter_text)
+    return texts
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run(name, documents, repeat=3):
+    size = sum(len(d.get_body_content()) for d in documents)
+    bs4_seconds, bs4_texts = best_of(lambda: extract_texts_bs4(documents), repeat)
+    lxml_seconds, lxml_texts = best_of(lambda: extract_texts(documents), repeat)
+    assert bs4_texts == lxml_texts, f'{name}: extracted texts differ'
+    print(f'{name:<28} {len(documents):>6} {size / 1e6:>9.2f} {bs4_seconds * 1000:>10.1f} '
+          f'{lxml_seconds * 1000:>10.1f} {bs4_seconds / lxml_seconds:>8.1f}x')
+
+
+def main():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        book = epub.read_epub(str(GETTYSBURG))
+    documents = [Document(d.get_body_content()) for d in book.get_items() if d.get_type() == ebooklib.ITEM_DOCUMENT]
+    chapter = max(documents, key=lambda d: len(d.get_body_content())).get_body_content()
+    print(f'{"book":<28} {"docs":>6} {"MB":>9} {"bs4 ms":>10} {"lxml ms":>10} {"speedup":>9}')
+    run('gettysburg', documents, repeat=20)
+    for scale in (10, 100, 1000):
+        # one long endnotes-like document, and the same text split into chapters
+        run(f'{scale}x, single document', [Document(chapter * scale)], repeat=3 if scale < 1000 else 1)
+        run(f'{scale}x, {scale} chapters', [Document(chapter) for _ in range(scale)], repeat=3 if scale < 1000 else 1)
+
+
+if __name__ == '__main__':
+    main()
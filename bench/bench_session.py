@@ -0,0 +1,75 @@
+# Latency benchmark of the ONNX Runtime session settings of load_kokoro: for each variant, the time to load the
+# model and the median and 90th percentile latency of synthesizing one sentence, with the phonemes computed once
+# beforehand so that only inference is measured. The optimized model cache is measured cold (empty) and warm.
+#
+#   python bench/bench_session.py --model kokoro-v0_19.onnx --voices voices.json
+#   python bench/bench_session.py --runs 50 --variants default threads=1 threads=4 graph=basic
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from audiblez import load_kokoro, CALIBRATION_TEXT
+
+CPUS = os.cpu_count() or 1
+VARIANTS = {
+    'default': {},
+    'threads=1': dict(intra_op_threads=1, inter_op_threads=1),
+    'threads=2': dict(intra_op_threads=2, inter_op_threads=1),
+    'threads=4': dict(intra_op_threads=4, inter_op_threads=1),
+    f'threads={CPUS}': dict(intra_op_threads=CPUS, inter_op_threads=1),
+    'parallel': dict(execution_mode='parallel', inter_op_threads=2),
+    'graph=disable': dict(graph_optimization='disable'),
+    'graph=basic': dict(graph_optimization='basic'),
+    'graph=extended': dict(graph_optimization='extended'),
+    'graph=all': dict(graph_optimization='all'),
+    'no-arena': dict(memory_arena=False),
+    'no-pattern': dict(memory_pattern=False),
+    'model-cache': dict(optimized_model_cache=True),
+}
+
+
+def bench_variant(model, voices, settings, runs, cache_dir):
+    start = time.perf_counter()
+    kokoro = load_kokoro(model, voices, settings=dict(settings), cache_dir=cache_dir)
+    load_seconds = time.perf_counter() - start
+    phonemes = kokoro.tokenizer.phonemize(CALIBRATION_TEXT, 'en-us')
+    voice = sorted(kokoro.get_voices())[0]
+    kokoro.create('', voice, phonemes=phonemes)  # warm-up
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        kokoro.create('', voice, phonemes=phonemes)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return load_seconds, statistics.median(latencies), latencies[int(0.9 * (len(latencies) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark of the ONNX Runtime session settings')
+    parser.add_argument('--model', default='kokoro-v0_19.onnx', help='Path of the Kokoro model')
+    parser.add_argument('--voices', default='voices.json', help='Path of the voices file')
+    parser.add_argument('--runs', type=int, default=20, help='Timed syntheses per variant')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=list(VARIANTS),
+                        help='Variants to measure (default: all)')
+    args = parser.parse_args()
+
+    print(f'{"variant":<20} {"load s":>8} {"median s":>9} {"p90 s":>8}')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name in args.variants:
+            settings = dict(dict(optimized_model_cache=False), **VARIANTS[name])
+            labels = [name]
+            if settings['optimized_model_cache']:
+                labels = [f'{name} (cold)', f'{name} (warm)']
+            for label in labels:
+                load_seconds, median, p90 = bench_variant(args.model, args.voices, settings, args.runs, cache_dir)
+                print(f'{label:<20} {load_seconds:>8.3f} {median:>9.4f} {p90:>8.4f}', flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Memory benchmark of parallel workers: every worker loading its own model (spawn, the default) against workers
+# forked after the model is loaded once and sharing it copy-on-write (--share-model). For 1, 4 and 16 workers,
+# all alive at once after synthesizing a passage, reports the average RSS of a worker, its PSS (shared pages
+# divided among the processes sharing them, so what a worker really adds) and its private memory, and the
+# total PSS of the workers and the main process.
+#
+#   python bench/bench_shared_model.py --model kokoro-v0_19.onnx --voices voices.json
+#   python bench/bench_shared_model.py --workers 1 4 16 32
+
+import argparse
+import multiprocessing
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import audiblez
+from audiblez import load_kokoro, init_worker, CALIBRATION_TEXT
+
+
+def memory_mb():
+    """Rss, Pss and private memory of this process, from /proc/self/smaps_rollup (Linux only)."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return dict(rss=fields['Rss'], pss=fields['Pss'], private=fields['Private_Clean'] + fields['Private_Dirty'])
+
+
+def worker(initargs, voice, barrier, results):
+    init_worker(*initargs)
+    kokoro = audiblez._worker['kokoro']
+    kokoro.create(CALIBRATION_TEXT, voice, phonemes=kokoro.tokenizer.phonemize(CALIBRATION_TEXT, 'en-us'))
+    barrier.wait()  # measure with every worker alive, so that shared pages are divided among all of them
+    results.put(memory_mb())
+    barrier.wait()
+
+
+def bench(model, voices, workers, shared, voice):
+    if shared:
+        audiblez._worker['kokoro'] = load_kokoro(model, voices, threads=1)
+        initargs, context = (None, None, 1), multiprocessing.get_context('fork')
+    else:
+        initargs, context = (model, voices, 1), multiprocessing.get_context('spawn')
+    barrier, results = context.Barrier(workers + 1), context.Queue()
+    processes = [context.Process(target=worker, args=(initargs, voice, barrier, results)) for _ in range(workers)]
+    for p in processes:
+        p.start()
+    barrier.wait()
+    main_process = memory_mb()
+    measures = [results.get() for _ in processes]
+    barrier.wait()
+    for p in processes:
+        p.join()
+    audiblez._worker.pop('kokoro', None)
+    average = {key: sum(m[key] for m in measures) / workers for key in measures[0]}
+    return average, sum(m['pss'] for m in measures) + main_process['pss']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory benchmark of workers with private or shared models')
+    parser.add_argument('--model', default='kokoro-v0_19.onnx', help='Path of the Kokoro model')
+    parser.add_argument('--voices', default='voices.json', help='Path of the voices file')
+    parser.add_argument('--voice', default='af_sky', help='Voice to synthesize with')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help='Numbers of workers to measure')
+    args = parser.parse_args()
+    print(f'{Path(args.model).stat().st_size / 1024 / 1024:.0f} MB model')
+    print(f'{"mode":<8} {"workers":>7} {"RSS MB":>8} {"PSS MB":>8} {"private MB":>11} {"total PSS MB":>13}')
+    for workers in args.workers:
+        for mode in ('private', 'shared'):
+            average, total = bench(args.model, args.voices, workers, mode == 'shared', args.voice)
+            print(f'{mode:<8} {workers:>7} {average["rss"]:>8.0f} {average["pss"]:>8.0f} {average["private"]:>11.0f} '
+                  f'{total:>13.0f}', flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Startup-time benchmark of the audiblez command line: wall time of `audiblez --help`, of an invocation with a bad
+# path and of `import audiblez`, against importing the heavy dependencies that are now loaded only when a book is
+# actually converted. Each command runs in a fresh interpreter; the median of --repeat runs is reported.
+#
+#   python bench/bench_startup.py
+#   python bench/bench_startup.py --repeat 20 --importtime
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+AUDIBLEZ = str(ROOT / 'audiblez.py')
+COMMANDS = [
+    ('audiblez --help', [AUDIBLEZ, '--help']),
+    ('audiblez missing.epub', [AUDIBLEZ, 'missing.epub']),
+    ('import audiblez', ['-c', 'import audiblez']),
+    ('heavy imports', ['-c', 'import numpy, soundfile, onnxruntime, kokoro_onnx']),
+]
+
+
+def median_seconds(argv, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], cwd=ROOT, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def print_slowest_imports(count=15):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import audiblez'], cwd=ROOT,
+                            capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        _, cumulative_us, name = line.split('|')
+        if cumulative_us.strip().isdigit():
+            rows.append((int(cumulative_us), name.rstrip()))
+    print('\nSlowest imports of audiblez (cumulative ms):')
+    for cumulative_us, name in sorted(rows, reverse=True)[:count]:
+        print(f'{cumulative_us / 1000:>8.1f}  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup-time benchmark of the audiblez command line')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per command, the median counts')
+    parser.add_argument('--importtime', default=False, action='store_true',
+                        help='Also list the slowest modules imported by audiblez')
+    args = parser.parse_args()
+    print(f'{"command":<24} {"median s":>9}')
+    for name, argv in COMMANDS:
+        print(f'{name:<24} {median_seconds(argv, args.repeat):>9.3f}', flush=True)
+    if args.importtime:
+        print_slowest_imports()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# Offline benchmark suite of the audiblez pipeline, runnable without the Kokoro model: synthesis is done by the
+# deterministic stub in stub_backend.py. Measures EPUB loading, chapter detection, text extraction, chunking,
+# audio assembly (chunked synthesis and writing of the chapter files) and create_m4b, on the bundled Gettysburg
+# EPUB and on generated books of its chapter repeated 10x, 100x and 1000x.
+#
+# Results are saved to bench/results/<time>-<commit>.json and compared with the previous results file,
+# or with the one given with --compare, to spot performance regressions between commits.
+#
+#   python bench/bench_suite.py
+#   python bench/bench_suite.py --scales 10 100 --audio-scales 1 --compare bench/results/20250101-120000-abc1234.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import soundfile as sf
+from ebooklib import epub
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from audiblez import read_book, find_chapters, extract_texts, chunk_text, synthesize_chapter, create_m4b
+from stub_backend import StubKokoro
+
+ROOT = Path(__file__).parent.parent
+GETTYSBURG = ROOT / 'GETTYSBURG ADDRESS - Abraham Lincoln.epub'
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def make_book(path, scale):
+    """Write a book of the Gettysburg chapter repeated scale times, with front and back matter and images."""
+    source, title, creator = read_book(str(GETTYSBURG))
+    chapter_content = extract_texts(find_chapters(source))[0]
+    paragraphs = ''.join(f'<p>{line}</p>' for line in chapter_content.splitlines())
+    book = epub.EpubBook()
+    book.set_title(f'{title} x{scale}')
+    book.add_author(creator)
+    cover = epub.EpubHtml(title='Cover', file_name='cover.xhtml', content='<p>Cover</p>')
+    notes = epub.EpubHtml(title='Notes', file_name='notes.xhtml',
+                          content=''.join(f'<p>{n}. A note.</p>' for n in range(1, scale + 1)))
+    chapters = [epub.EpubHtml(title=f'Chapter {n}', file_name=f'chapter_{n}.xhtml',
+                              content=f'<h1>Chapter {n}</h1>{paragraphs}') for n in range(1, scale + 1)]
+    for item in [cover, *chapters, notes]:
+        book.add_item(item)
+    for n in range(min(scale, 20)):
+        book.add_item(epub.EpubImage(uid=f'image_{n}', file_name=f'images/{n}.jpg', media_type='image/jpeg',
+                                     content=os.urandom(200 * 1024)))
+    book.toc = [epub.Link(c.file_name, c.title, c.file_name) for c in chapters + [notes]]
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = [cover, 'nav', *chapters, notes]
+    epub.write_epub(path, book)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def bench_book(name, path, scale, repeat, audio, workdir):
+    """Yield a result dict per stage for one book."""
+    book_repeat = repeat if scale < 1000 else 1
+
+    seconds, (book, title, creator) = best_of(lambda: read_book(path), book_repeat)
+    yield dict(stage='epub_load', seconds=seconds)
+    seconds, chapters = best_of(lambda: find_chapters(book), book_repeat)
+    yield dict(stage='find_chapters', seconds=seconds)
+    seconds, texts = best_of(lambda: extract_texts(chapters), book_repeat)
+    chars = sum(len(t) for t in texts)
+    yield dict(stage='extract_texts', seconds=seconds, chars=chars, throughput=chars / seconds, unit='chars/s')
+    seconds, chunks = best_of(lambda: [chunk_text(t) for t in texts], book_repeat)
+    yield dict(stage='chunk_text', seconds=seconds, chars=chars, throughput=chars / seconds, unit='chars/s')
+    if not audio:
+        return
+
+    kokoro = StubKokoro()
+    chapter_files = [str(workdir / f'{name}_chapter_{n}.wav') for n in range(1, len(texts) + 1)]
+
+    def assemble():
+        for chapter_file, text in zip(chapter_files, texts):
+            synthesize_chapter(kokoro, chapter_file, text, 'af_sky', 1.0, 'en-gb')
+
+    seconds, _ = best_of(assemble, 1)
+    audio_seconds = sum(sf.info(f).duration for f in chapter_files)
+    yield dict(stage='audio_assembly', seconds=seconds, audio_seconds=audio_seconds,
+               throughput=audio_seconds / seconds, unit='x realtime')
+    if shutil.which('ffmpeg') is None:
+        print('ffmpeg not found, skipping create_m4b')
+        return
+    seconds, _ = best_of(lambda: create_m4b(chapter_files, str(workdir / f'{name}.epub'), title, creator), 1)
+    yield dict(stage='create_m4b', seconds=seconds, audio_seconds=audio_seconds,
+               throughput=audio_seconds / seconds, unit='x realtime')
+    for f in chapter_files + [str(workdir / f'{name}.m4b')]:
+        Path(f).unlink(missing_ok=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_results(exclude=None):
+    files = sorted(p for p in RESULTS_DIR.glob('*.json') if p != exclude) if RESULTS_DIR.exists() else []
+    return files[-1] if files else None
+
+
+def print_results(results, baseline=None):
+    before = {(r['book'], r['stage']): r['seconds'] for r in baseline['results']} if baseline else {}
+    print(f'{"book":<12} {"stage":<16} {"seconds":>10} {"throughput":>22}' + (f' {"vs before":>10}' if before else ''))
+    for r in results:
+        throughput = f'{r["throughput"]:,.0f} {r["unit"]}' if 'throughput' in r else ''
+        line = f'{r["book"]:<12} {r["stage"]:<16} {r["seconds"]:>10.4f} {throughput:>22}'
+        if (r['book'], r['stage']) in before:
+            # >1 means slower than before
+            line += f' {r["seconds"] / before[(r["book"], r["stage"])]:>9.2f}x'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark suite of the audiblez pipeline')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Sizes of the generated books, in copies of the Gettysburg chapter')
+    parser.add_argument('--audio-scales', type=int, nargs='+', default=[1, 10],
+                        help='Books for which audio assembly and create_m4b are measured too (1 is Gettysburg); '
+                             'a 100x book is about 3 hours of audio')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions of the text stages, the best one counts')
+    parser.add_argument('--compare', default=None, help='Results file to compare with (default: the latest one)')
+    parser.add_argument('--no-save', default=False, action='store_true', help='Do not save the results')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        books = [('gettysburg', str(GETTYSBURG), 1)]
+        for scale in args.scales:
+            path = str(workdir / f'book_{scale}x.epub')
+            make_book(path, scale)
+            books.append((f'{scale}x', path, scale))
+        for name, path, scale in books:
+            print(f'Benchmarking {name}...', file=sys.stderr)
+            for result in bench_book(name, path, scale, args.repeat, scale in args.audio_scales, workdir):
+                results.append(dict(book=name, **result))
+
+    baseline_path = Path(args.compare) if args.compare else previous_results()
+    baseline = json.loads(baseline_path.read_text()) if baseline_path else None
+    if baseline:
+        print(f'Compared with {baseline_path} (commit {baseline["commit"]})')
+    print_results(results, baseline)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        commit = git_commit()
+        output = RESULTS_DIR / f'{time.strftime("%Y%m%d-%H%M%S")}-{commit}.json'
+        output.write_text(json.dumps(dict(commit=commit, date=time.strftime('%Y-%m-%d %H:%M:%S'),
+                                          python=platform.python_version(), platform=platform.platform(),
+                                          cpu_count=os.cpu_count(), results=results), indent=2))
+        print(f'Results saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Benchmark of voice loading: parsing voices.json, as Kokoro does for the voice names and again for the style of
+# the voice in use, against the memory-mapped VoiceStore of load_kokoro. Each way loads one voice in a fresh
+# process and reports the time and the memory it added to the process; the store is measured right after its
+# one-time conversion (cold) and once converted (warm).
+#
+#   python bench/bench_voices.py --voices voices.json --voice af_sky
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+LOAD_VOICE = '''
+import json, sys, time
+import numpy as np
+from audiblez import VoiceStore, peak_rss_mb
+
+voices_path, voice, method, cache_dir = sys.argv[1:]
+rss_before = peak_rss_mb()
+start = time.perf_counter()
+if method == 'json':
+    with open(voices_path) as f:
+        names = list(json.load(f).keys())
+    with open(voices_path) as f:
+        style = np.array(json.load(f)[voice], dtype=np.float32)
+else:
+    store = VoiceStore(voices_path, cache_dir)
+    names = store.names
+    style = store.get(voice)
+style[len(names)].sum()  # touch the row synthesis would use
+seconds = time.perf_counter() - start
+print(json.dumps(dict(seconds=seconds, rss_mb=peak_rss_mb() - rss_before)))
+'''
+
+
+def load_voice(voices_path, voice, method, cache_dir):
+    result = subprocess.run([sys.executable, '-c', LOAD_VOICE, voices_path, voice, method, cache_dir],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of voice loading')
+    parser.add_argument('--voices', default='voices.json', help='Path of the voices file')
+    parser.add_argument('--voice', default='af_sky', help='Voice to load')
+    args = parser.parse_args()
+    voices_path = str(Path(args.voices).resolve())
+    print(f'{Path(voices_path).stat().st_size / 1024 / 1024:.1f} MB voices file')
+    print(f'{"method":<22} {"seconds":>8} {"added peak RSS MB":>18}')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for label, method in [('json (Kokoro)', 'json'), ('store (cold)', 'store'), ('store (warm)', 'store')]:
+            result = load_voice(voices_path, args.voice, method, cache_dir)
+            print(f'{label:<22} {result["seconds"]:>8.3f} {result["rss_mb"]:>18.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# Deterministic stand-in for the Kokoro model, so that benchmarks run without the model files.
+# It has the parts of the kokoro_onnx.Kokoro API that audiblez uses and returns a quiet tone as long as
+# the narration of the text would be, so everything downstream of synthesis handles realistic amounts of audio.
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from audiblez import NARRATION_CHARS_PER_SECOND, SAMPLE_RATE
+
+
+class StubTokenizer:
+    def phonemize(self, text, lang='en-us'):
+        return text
+
+
+class StubConfig:
+    model_path = __file__  # hashed by the audio cache in place of the model
+    voices_path = None
+
+
+class StubKokoro:
+    tokenizer = StubTokenizer()
+    config = StubConfig()
+    tone = (np.sin(np.arange(SAMPLE_RATE) * 2 * np.pi * 220 / SAMPLE_RATE) * 0.1).astype(np.float32)
+
+    def create(self, text, voice, speed=1.0, lang='en-us', phonemes=None, trim=True):
+        frames = int(len(text) / NARRATION_CHARS_PER_SECOND / speed * SAMPLE_RATE)
+        return np.resize(self.tone, frames), SAMPLE_RATE
+
+    def get_voices(self):
+        return ['af_sky']
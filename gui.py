@@ -1,206 +1,30 @@
 # PySide6-based GUI for Audiblez with UI language switching and multi-threaded processing
-# pip install soundfile ebooklib beautifulsoup4 kokoro-onnx pydub pick PySide6
+# pip install soundfile ebooklib kokoro-onnx pick PySide6
 
-import argparse
 import sys
-import time
-import shutil
-import subprocess
-import soundfile as sf
-import ebooklib
-import warnings
-import re
+import tempfile
+import threading
 from pathlib import Path
-from string import Formatter
-from bs4 import BeautifulSoup
-from kokoro_onnx import Kokoro
-from ebooklib import ITEM_DOCUMENT, epub
-from pydub import AudioSegment
-from pick import pick
 import os
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton,
-    QFileDialog, QComboBox, QSpinBox, QMessageBox, QToolBar, QProgressBar
+    QFileDialog, QComboBox, QSpinBox, QMessageBox, QToolBar, QProgressBar, QSplitter, QTreeWidget, QTreeWidgetItem
 )
-from PySide6.QtCore import Qt, QObject, Signal, Slot, QThread
+from PySide6.QtCore import Qt, QObject, Signal, Slot, QThread, QSettings, QUrl
 from PySide6.QtWebEngineWidgets import QWebEngineView
-import concurrent.futures
 from multiprocessing import set_start_method
+from audiblez import (Cancelled, LazyEpub, NARRATION_CHARS_PER_SECOND, classify_documents, extract_text, load_kokoro,
+                      main, strfdelta, voice_names)
 
 # Change working directory to the script's directory
 current_file_path = os.path.abspath(__file__)
 current_directory = os.path.dirname(current_file_path)
 os.chdir(current_directory)
 
-
-def extract_texts(chapters):
-    texts = []
-    for chapter in chapters:
-        xml = chapter.get_body_content()
-        soup = BeautifulSoup(xml, features='lxml')
-        chapter_text = ''
-        html_content_tags = ['title', 'p', 'h1', 'h2', 'h3', 'h4']
-        for child in soup.find_all(html_content_tags):
-            inner_text = child.text.strip() if child.text else ""
-            if inner_text:
-                chapter_text += inner_text + '\n'
-        texts.append(chapter_text)
-    return texts
-
-
-def is_chapter(c):
-    name = c.get_name().lower()
-    part = r"part\d{1,3}"
-    if re.search(part, name):
-        return True
-    ch = r"ch\d{1,3}"
-    if re.search(ch, name):
-        return True
-    if 'chapter' in name:
-        return True
-
-
-def find_chapters(book, verbose=False):
-    chapters = [c for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT and is_chapter(c)]
-    if verbose:
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                print(f"'{item.get_name()}'" + ', #' + str(len(item.get_body_content())))
-    if len(chapters) == 0:
-        print('Not easy to find the chapters, defaulting to all available documents.')
-        chapters = [c for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT]
-    return chapters
-
-
-def pick_chapters(book):
-    all_chapters_names = [c.get_name() for c in book.get_items()]
-    title = 'Select which chapters to read in the audiobook'
-    selected_chapters = []
-    try:
-        selected_chapters_names = pick(all_chapters_names, title, multiselect=True, min_selection_count=1)
-        selected_chapters_names = [c[0] for c in selected_chapters_names]
-        selected_chapters = [c for c in book.get_items() if c.get_name() in selected_chapters_names]
-    except Exception as e:
-        print(f"Chapter selection cancelled or failed: {e}")
-    return selected_chapters
-
-
-def strfdelta(tdelta, fmt='{D:02}d {H:02}h {M:02}m {S:02}s'):
-    remainder = int(tdelta)
-    f = Formatter()
-    desired_fields = [field_tuple[1] for field_tuple in f.parse(fmt)]
-    possible_fields = ('W', 'D', 'H', 'M', 'S')
-    constants = {'W': 604800, 'D': 86400, 'H': 3600, 'M': 60, 'S': 1}
-    values = {}
-    for field in possible_fields:
-        if field in desired_fields and field in constants:
-            values[field], remainder = divmod(remainder, constants[field])
-    return f.format(fmt, **values)
-
-
-def create_m4b(chapter_files, filename, title, author):
-    tmp_filename = filename.replace('.epub', '.tmp.m4a')
-    if not Path(tmp_filename).exists():
-        combined_audio = AudioSegment.empty()
-        for wav_file in chapter_files:
-            audio = AudioSegment.from_wav(wav_file)
-            combined_audio += audio
-        print('Converting to Mp4...')
-        combined_audio.export(tmp_filename, format="mp4", codec="aac", bitrate="64k")
-    final_filename = filename.replace('.epub', '.m4b')
-    print('Creating M4B file...')
-    proc = subprocess.run([
-        'ffmpeg', '-i', f'{tmp_filename}', '-c', 'copy', '-f', 'mp4',
-        '-metadata', f'title={title}',
-        '-metadata', f'author={author}',
-        f'{final_filename}'
-    ])
-    Path(tmp_filename).unlink()
-    if proc.returncode == 0:
-        print(f'{final_filename} created. Enjoy your audiobook.')
-        print('Feel free to delete the intermediary .wav chapter files, the .m4b is all you need.')
-
-
-def process_chapter(args):
-    """
-    Processes a single chapter to generate its audio file.
-    
-    Args:
-        args (tuple): Contains all necessary parameters.
-        
-    Returns:
-        str: Filename of the generated audio file.
-    """
-    i, text, file_path, model_path, voices_path, voice, speed, lang = args
-    if len(text) == 0:
-        return None
-    try:
-        kokoro = Kokoro(model_path, voices_path)
-        samples, sample_rate = kokoro.create(text, voice=voice, speed=speed, lang=lang)
-        chapter_filename = file_path.replace('.epub', f'_chapter_{i}.wav')
-        sf.write(f'{chapter_filename}', samples, sample_rate)
-        return chapter_filename
-    except Exception as e:
-        print(f"Error processing chapter {i}: {e}")
-        return None
-
-
-def audiblez(kokoro, file_path, lang, voice, pick_manually, speed):
-    filename = Path(file_path).name
-    with warnings.catch_warnings():
-        book = epub.read_epub(file_path)
-    title = book.get_metadata('DC', 'title')[0][0]
-    creator = book.get_metadata('DC', 'creator')[0][0]
-    intro = f'{title} by {creator}'
-    print(intro)
-    print('Found Chapters:', [c.get_name() for c in book.get_items() if c.get_type() == ebooklib.ITEM_DOCUMENT])
-    if pick_manually:
-        chapters = pick_chapters(book)
-    else:
-        chapters = find_chapters(book)
-    print('Selected chapters:', [c.get_name() for c in chapters])
-    texts = extract_texts(chapters)
-    has_ffmpeg = shutil.which('ffmpeg') is not None
-    if not has_ffmpeg:
-        print('\033[91m' + 'ffmpeg not found. Please install ffmpeg to create mp3 and m4b audiobook files.' + '\033[0m')
-    total_chars = sum([len(t) for t in texts])
-    print('Started at:', time.strftime('%H:%M:%S'))
-    print(f'Total characters: {total_chars:,}')
-    print('Total words:', len(' '.join(texts).split(' ')))
-
-    i = 1
-    chapter_mp3_files = []
-    for text in texts:
-        if len(text) == 0:
-            continue
-        chapter_filename = filename.replace('.epub', f'_chapter_{i}.wav')
-        chapter_mp3_files.append(chapter_filename)
-        if Path(chapter_filename).exists():
-            print(f'File for chapter {i} already exists. Skipping')
-            i += 1
-            continue
-        print(f'Reading chapter {i} ({len(text):,} characters)...')
-        if i == 1:
-            text = intro + '.\n\n' + text
-        start_time = time.time()
-        
-        samples, sample_rate = kokoro.create(text, voice=voice, speed=speed, lang=lang)
-        sf.write(f'{chapter_filename}', samples, sample_rate)
-        end_time = time.time()
-        delta_seconds = end_time - start_time
-        chars_per_sec = len(text) / delta_seconds
-        remaining_chars = sum([len(t) for t in texts[i - 1:]])
-        remaining_time = remaining_chars / chars_per_sec
-        print(f'Estimated time remaining: {strfdelta(remaining_time)}')
-        print('Chapter written to', chapter_filename)
-        print(f'Chapter {i} read in {delta_seconds:.2f} seconds ({chars_per_sec:.0f} characters per second)')
-        progress = int((total_chars - remaining_chars) / total_chars * 100)
-        print('Progress:', f'{progress}%')
-        i += 1
-    # if has_ffmpeg:
-    #     create_m4b(chapter_mp3_files, filename, title, creator)
-
-
+# Synthesis speed assumed for the preview's time estimates until a conversion has measured it on this machine:
+# about what the README reports, the Gettysburg Address's 1,595 characters in some 2 seconds
+DEFAULT_CHARS_PER_SECOND = 800
+SET_HTML_MAX_BYTES = 2 * 1024 * 1024  # QWebEngineView.setHtml fails on larger content, which is loaded from a file
 
 
 # Define UI texts for English and Chinese
@@ -215,9 +39,16 @@ UI_TEXTS = {
         "label_voice": "Select voice:",
         "label_speed": "Speed (0.5~2.0, i.e. 50~200):",
         "generate": "Generate",
+        "cancel": "Cancel",
         "msg_no_epub": "Please select an EPUB file first",
         "msg_done": "Done, audio files have been generated!",
+        "msg_cancelled": "Cancelled, the next run resumes where this one stopped",
         "msg_error": "Error occurred",
+        "status_chunk": "Chapter {chapter}: chunk {chunk}/{chunks}, {eta} remaining",
+        "status_loading": "Loading preview: {documents} documents",
+        "status_loaded": "{chapters} chapters to narrate, {chars:,} characters, about {audio} of audio "
+                         "and {synthesis} of synthesis",
+        "preview_columns": ["Document", "Kind", "Characters", "Audio", "Synthesis"],
     },
     "zh": {
         "window_title": "Audiblez图形界面",
@@ -229,16 +60,27 @@ UI_TEXTS = {
         "label_voice": "选择声音:",
         "label_speed": "语速 (0.5~2.0，对应 50~200):",
         "generate": "开始生成",
+        "cancel": "取消",
         "msg_no_epub": "请先选择EPUB文件",
         "msg_done": "转换完成，音频文件已生成！",
+        "msg_cancelled": "已取消，下次运行将从中断处继续",
         "msg_error": "发生错误",
+        "status_chunk": "第 {chapter} 章：片段 {chunk}/{chunks}，剩余 {eta}",
+        "status_loading": "正在加载预览：{documents} 个文档",
+        "status_loaded": "待朗读 {chapters} 章，{chars:,} 个字符，约 {audio} 音频，合成约需 {synthesis}",
+        "preview_columns": ["文档", "类型", "字符数", "音频时长", "合成时间"],
     },
 }
 
 
 class Worker(QObject):
+    """
+    Runs audiblez.main in a QThread and turns its events into signals, which Qt delivers on the UI thread.
+    """
     progress = Signal(int)
+    status = Signal(dict)
     finished = Signal()
+    cancelled = Signal()
     error = Signal(str)
 
     def __init__(self, file_path, lang, voice, pick_manually, speed):
@@ -248,33 +90,63 @@ class Worker(QObject):
         self.voice = voice
         self.pick_manually = pick_manually
         self.speed = speed
+        self.cancel = threading.Event()  # set from the UI thread, checked by main between chunks
 
     @Slot()
     def run(self):
-        
-        kokoro = Kokoro('kokoro-v0_19.onnx', 'voices.json')
-        kokoro.sess.set_providers(['CUDAExecutionProvider', 'CPUExecutionProvider'])
-
-        voices = list(kokoro.get_voices())
-        voices_str = ', '.join(voices)
         try:
-            audiblez(
+            kokoro = load_kokoro('kokoro-v0_19.onnx', 'voices.json')
+            main(
                 kokoro,
                 file_path=self.file_path,
                 lang=self.lang,
                 voice=self.voice,
                 pick_manually=self.pick_manually,
-                speed=self.speed
+                speed=self.speed,
+                on_event=self.on_event,
+                cancel=self.cancel
             )
             self.finished.emit()
+        except Cancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(str(e))
 
-    def update_progress(self, value):
-        if value == -1:
-            self.error.emit("An error occurred during audiobook generation.")
-        else:
-            self.progress.emit(value)
+    def on_event(self, event):
+        """
+        Event sink of main, called on the worker thread.
+        """
+        if 'progress' in event:
+            self.progress.emit(int(event['progress'] * 100))
+        if event['event'] in ('chunk_done', 'chapter_done'):
+            self.status.emit(event)
+
+
+class PreviewLoader(QObject):
+    """
+    Reads the documents of an EPUB in a QThread, one at a time, and emits the kind and narrated characters of
+    each, so that the chapter list fills in while the window stays responsive. Nothing is rendered here.
+    """
+    document_loaded = Signal(str, str, int)
+    finished = Signal()
+    error = Signal(str)
+
+    def __init__(self, epub_file):
+        super().__init__()
+        self.epub_file = epub_file
+        self.stop = threading.Event()  # set when another book is selected
+
+    @Slot()
+    def run(self):
+        try:
+            with LazyEpub(self.epub_file) as book:
+                for item, kind in classify_documents(book):
+                    if self.stop.is_set():
+                        return
+                    self.document_loaded.emit(item.get_name(), kind, len(extract_text(item.get_body_content())))
+            self.finished.emit()
+        except Exception as e:
+            self.error.emit(str(e))
 
 
 class AudiblezGUI(QMainWindow):
@@ -293,19 +165,14 @@ class AudiblezGUI(QMainWindow):
             sys.exit(1)
 
         # Initialize Kokoro is no longer necessary here since multiprocessing handles it
-        # self.kokoro = Kokoro('kokoro-v0_19.onnx', 'voices.json')
-        # self.kokoro.sess.set_providers(['CUDAExecutionProvider', 'CPUExecutionProvider'])
         # self.voices = list(self.kokoro.get_voices())
 
-        # Fetch voices once to populate the combo box
+        # Read the voice names to populate the combo box, without loading the model
         try:
-            temp_kokoro = Kokoro('kokoro-v0_19.onnx', 'voices.json')
-            temp_kokoro.sess.set_providers(['CUDAExecutionProvider', 'CPUExecutionProvider'])
-            self.voices = list(temp_kokoro.get_voices())
+            self.voices = voice_names('voices.json')
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to initialize Kokoro: {e}")
+            QMessageBox.critical(self, "Error", f"Failed to read voices.json: {e}")
             sys.exit(1)
-        del temp_kokoro  # Clean up the temporary Kokoro instance
 
         # 创建并配置工具栏
         self.toolbar = QToolBar("Main Toolbar")
@@ -346,6 +213,7 @@ class AudiblezGUI(QMainWindow):
         self.speed_spin = QSpinBox()
         self.speed_spin.setRange(50, 200)  # Corresponding to 0.5~2.0
         self.speed_spin.setValue(100)      # Default 1.0x speed
+        self.speed_spin.valueChanged.connect(self.update_estimates)
         self.toolbar.addWidget(QLabel(UI_TEXTS[self.current_ui_lang]["label_speed"] + " "))
         self.toolbar.addWidget(self.speed_spin)
 
@@ -354,14 +222,29 @@ class AudiblezGUI(QMainWindow):
         self.run_button.clicked.connect(self.run_audiobook)
         self.toolbar.addWidget(self.run_button)
 
+        # 取消按钮
+        self.cancel_button = QPushButton(UI_TEXTS[self.current_ui_lang]["cancel"])
+        self.cancel_button.clicked.connect(self.cancel_audiobook)
+        self.cancel_button.setEnabled(False)
+        self.toolbar.addWidget(self.cancel_button)
+
         # 页面主体：EPUB文本显示 + 进度
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
 
+        # 左侧章节列表，右侧只显示选中的章节
+        splitter = QSplitter(Qt.Horizontal)
+        self.chapter_list = QTreeWidget()
+        self.chapter_list.setRootIsDecorated(False)
+        self.chapter_list.currentItemChanged.connect(self.show_document)
+        splitter.addWidget(self.chapter_list)
+
         # 使用 QWebEngineView 显示 EPUB 内容
         self.web_view = QWebEngineView()
-        main_layout.addWidget(self.web_view)
+        splitter.addWidget(self.web_view)
+        splitter.setSizes([400, 624])
+        main_layout.addWidget(splitter)
 
         # 进度条
         self.progress_bar = QProgressBar()
@@ -369,6 +252,11 @@ class AudiblezGUI(QMainWindow):
         main_layout.addWidget(self.progress_bar)
 
         self.epub_file_path = None
+        self.preview_book = None
+        self.preview_thread = None
+        self.preview_loader = None
+        self.preview_file = None
+        self.settings = QSettings("audiblez", "gui")
 
         # 多语言相关文本
         self.set_language(self.current_ui_lang)
@@ -395,10 +283,16 @@ class AudiblezGUI(QMainWindow):
         self.select_button.setText(texts["select_epub"])
         self.reset_button.setText(texts["rest_epub"])
         self.run_button.setText(texts["generate"])
+        self.cancel_button.setText(texts["cancel"])
 
         self.msg_no_epub = texts["msg_no_epub"]
         self.msg_done = texts["msg_done"]
+        self.msg_cancelled = texts["msg_cancelled"]
         self.msg_error = texts["msg_error"]
+        self.status_chunk = texts["status_chunk"]
+        self.status_loading = texts["status_loading"]
+        self.status_loaded = texts["status_loaded"]
+        self.chapter_list.setHeaderLabels(texts["preview_columns"])
 
         # Update tooltips
         self.ui_lang_combo.setToolTip(texts["label_interface_lang"])
@@ -433,37 +327,122 @@ class AudiblezGUI(QMainWindow):
         )
         if epub_file:
             self.epub_file_path = epub_file
-            full_text = self.extract_epub_text(epub_file)
-            self.web_view.setHtml(full_text)
+            self.load_preview(epub_file)
 
     def reset_selection(self):
         """
         Clear the current selection and stop background tasks.
         """        
+        self.stop_preview()
         no_file_html = f"<html><body><p>{UI_TEXTS[self.current_ui_lang]['no_file_selected']}</p></body></html>"
         self.web_view.setHtml(no_file_html)
         self.epub_file_path = None
         self.current_selection = None
 
-    def extract_epub_text(self, epub_file):
+    def load_preview(self, epub_file):
         """
-        Extracts text from an EPUB file and converts it to HTML for display.
+        Lists the documents of the EPUB as a background thread reads them, with their narrated characters and
+        estimated audio and synthesis time. Only the document selected in the list is rendered.
         """
+        self.stop_preview()
         try:
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", UserWarning)
-                book = epub.read_epub(epub_file)
-            html_buf = ['<html><head><meta charset="UTF-8"></head><body style="font-family: sans-serif;">']
-            for item in book.get_items():
-                if item.get_type() == ITEM_DOCUMENT:
-                    soup = BeautifulSoup(item.get_body_content(), 'lxml')
-                    html_buf.append(str(soup))
-            html_buf.append('</body></html>')
-            return '\n'.join(html_buf)
+            self.preview_book = LazyEpub(epub_file)  # only the package document is parsed here
         except Exception as e:
             print(f"Failed to parse EPUB: {e}")
-            error_html = f"<html><body><p>Failed to parse EPUB:<br>{e}</p></body></html>"
-            return error_html
+            self.web_view.setHtml(f"<html><body><p>Failed to parse EPUB:<br>{e}</p></body></html>")
+            return
+        self.preview_thread = QThread()
+        self.preview_loader = PreviewLoader(epub_file)
+        self.preview_loader.moveToThread(self.preview_thread)
+        self.preview_thread.started.connect(self.preview_loader.run)
+        self.preview_loader.document_loaded.connect(self.add_document)
+        self.preview_loader.finished.connect(self.on_preview_loaded)
+        self.preview_loader.error.connect(self.on_preview_error)
+        for ended in (self.preview_loader.finished, self.preview_loader.error):
+            ended.connect(self.preview_thread.quit)
+        self.preview_thread.finished.connect(self.preview_loader.deleteLater)
+        self.preview_thread.start()
+
+    def stop_preview(self):
+        """
+        Stops loading the preview of the previous book and clears the chapter list.
+        """
+        if self.preview_thread is not None and self.preview_thread.isRunning():
+            self.preview_loader.stop.set()
+            self.preview_thread.quit()
+            self.preview_thread.wait()
+        if self.preview_book is not None:
+            self.preview_book.close()
+            self.preview_book = None
+        self.chapter_list.clear()
+
+    @Slot(str, str, int)
+    def add_document(self, name, kind, chars):
+        if self.sender() is not self.preview_loader:
+            return  # queued by the loader of a book that is no longer selected
+        item = QTreeWidgetItem([name, kind, f"{chars:,}", "", ""])
+        item.setData(0, Qt.UserRole, chars)
+        item.setTextAlignment(2, Qt.AlignRight)
+        self.chapter_list.addTopLevelItem(item)
+        self.update_estimate(item)
+        if self.chapter_list.currentItem() is None and kind == 'chapter':
+            self.chapter_list.setCurrentItem(item)  # shows the first chapter as soon as it is listed
+        self.statusBar().showMessage(self.status_loading.format(documents=self.chapter_list.topLevelItemCount()))
+
+    @Slot()
+    def on_preview_loaded(self):
+        if self.sender() is not self.preview_loader:
+            return
+        if self.chapter_list.currentItem() is None and self.chapter_list.topLevelItemCount():
+            self.chapter_list.setCurrentItem(self.chapter_list.topLevelItem(0))
+        chapters = [self.chapter_list.topLevelItem(i) for i in range(self.chapter_list.topLevelItemCount())
+                    if self.chapter_list.topLevelItem(i).text(1) == 'chapter']
+        chars = sum(item.data(0, Qt.UserRole) for item in chapters)
+        audio, synthesis = self.estimates(chars)
+        self.statusBar().showMessage(self.status_loaded.format(
+            chapters=len(chapters), chars=chars, audio=strfdelta(audio, '{H}:{M:02}:{S:02}'),
+            synthesis=strfdelta(synthesis, '{H}:{M:02}:{S:02}')))
+
+    @Slot(str)
+    def on_preview_error(self, error_message):
+        if self.sender() is not self.preview_loader:
+            return
+        self.web_view.setHtml(f"<html><body><p>Failed to parse EPUB:<br>{error_message}</p></body></html>")
+
+    def estimates(self, chars):
+        """
+        Seconds of audio and of synthesis for chars narrated characters, at the selected speed.
+        """
+        speed = self.speed_spin.value() / 100.0
+        chars_per_second = float(self.settings.value("chars_per_second", DEFAULT_CHARS_PER_SECOND))
+        return chars / NARRATION_CHARS_PER_SECOND / speed, chars / chars_per_second
+
+    def update_estimate(self, item):
+        audio, synthesis = self.estimates(item.data(0, Qt.UserRole))
+        item.setText(3, strfdelta(audio, '{H}:{M:02}:{S:02}'))
+        item.setText(4, strfdelta(synthesis, '{H}:{M:02}:{S:02}'))
+
+    def update_estimates(self):
+        for i in range(self.chapter_list.topLevelItemCount()):
+            self.update_estimate(self.chapter_list.topLevelItem(i))
+
+    def show_document(self, item, previous=None):
+        """
+        Renders the selected document, the only one loaded in the web view.
+        """
+        if item is None or self.preview_book is None:
+            return
+        document = self.preview_book.get_item_with_href(item.text(0))
+        body = document.get_body_content().decode('utf-8', errors='replace')
+        html = f'<html><head><meta charset="UTF-8"></head><body style="font-family: sans-serif;">{body}</body></html>'
+        if len(html.encode('utf-8')) <= SET_HTML_MAX_BYTES:
+            self.web_view.setHtml(html)
+            return
+        if self.preview_file is None:
+            self.preview_file = tempfile.NamedTemporaryFile(suffix='.html', delete=False)
+            self.preview_file.close()
+        Path(self.preview_file.name).write_text(html, encoding='utf-8')
+        self.web_view.load(QUrl.fromLocalFile(self.preview_file.name))
 
     def run_audiobook(self):
         """
@@ -481,6 +460,7 @@ class AudiblezGUI(QMainWindow):
 
         # 禁用生成按钮以防止重复点击
         self.run_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
 
         # Set up worker and thread
         self.thread = QThread()
@@ -496,23 +476,42 @@ class AudiblezGUI(QMainWindow):
         # Connect signals and slots
         self.thread.started.connect(self.worker.run)
         self.worker.finished.connect(self.on_finished)
+        self.worker.cancelled.connect(self.on_cancelled)
         self.worker.progress.connect(self.update_progress)
+        self.worker.status.connect(self.update_status)
         self.worker.error.connect(self.on_error)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
+        for ended in (self.worker.finished, self.worker.cancelled, self.worker.error):
+            ended.connect(self.thread.quit)
+        self.thread.finished.connect(self.worker.deleteLater)
 
         # Start the thread
         self.thread.start()
 
+    def cancel_audiobook(self):
+        """
+        Asks the worker to stop; it does after the chunk being synthesized.
+        """
+        if self.worker is not None:
+            self.worker.cancel.set()
+        self.cancel_button.setEnabled(False)
+
     @Slot()
     def on_finished(self):
         """
         Slot to handle the completion of audiobook generation.
         """
         self.progress_bar.setValue(100)
+        self.statusBar().clearMessage()
         QMessageBox.information(self, "", self.msg_done)
-        self.run_button.setEnabled(True)
+        self.on_ended()
+
+    @Slot()
+    def on_cancelled(self):
+        """
+        Slot to handle a cancelled audiobook generation.
+        """
+        self.statusBar().showMessage(self.msg_cancelled)
+        self.on_ended()
 
     @Slot(str)
     def on_error(self, error_message):
@@ -520,7 +519,11 @@ class AudiblezGUI(QMainWindow):
         Slot to handle errors during audiobook generation.
         """
         QMessageBox.critical(self, "", f"{self.msg_error}: {error_message}")
+        self.on_ended()
+
+    def on_ended(self):
         self.run_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
 
     @Slot(int)
     def update_progress(self, value):
@@ -532,14 +535,31 @@ class AudiblezGUI(QMainWindow):
             return
         self.progress_bar.setValue(value)
 
+    @Slot(dict)
+    def update_status(self, event):
+        """
+        Shows the chunk being synthesized and the time remaining in the status bar.
+        """
+        if event['event'] == 'chapter_done':
+            # measured on this machine, for the estimates of the next books
+            self.settings.setValue("chars_per_second", event['chars'] / max(event['seconds'], 1e-3))
+            self.update_estimates()
+            return
+        self.statusBar().showMessage(self.status_chunk.format(
+            chapter=event['chapter'], chunk=event['chunk'], chunks=event['chunks'], eta=strfdelta(event['eta_seconds'])))
+
     def closeEvent(self, event):
         """
         Ensure that threads are properly terminated when the application is closed.
         """
         if self.thread:
             if self.thread.isRunning():
+                self.worker.cancel.set()  # main stops within a chunk
                 self.thread.quit()
                 self.thread.wait()
+        self.stop_preview()
+        if self.preview_file is not None:
+            Path(self.preview_file.name).unlink(missing_ok=True)
         event.accept()
 
 
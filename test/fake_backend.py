@@ -0,0 +1,39 @@
+# Stand-in for the Kokoro model shared by the tests. It has the parts of the kokoro_onnx.Kokoro API that
+# audiblez uses, and returns audio that depends only on the text, counting its calls.
+
+import os
+import time
+
+import numpy as np
+
+
+class FakeTokenizer:
+    def phonemize(self, text, lang):
+        return text
+
+
+class FakeConfig:
+    def __init__(self, model_path):
+        self.model_path = model_path  # hashed by the audio cache
+        self.voices_path = 'fake.json'
+
+
+class FakeKokoro:
+    # the settings that let a model be shared with forked workers as it is
+    session_settings = dict(intra_op_threads=1, inter_op_threads=1, execution_mode='sequential')
+
+    def __init__(self, delay=0.0, forbidden_pid=None, model_path=__file__):
+        self.config = FakeConfig(model_path)
+        self.tokenizer = FakeTokenizer()
+        self.delay = delay
+        self.forbidden_pid = forbidden_pid
+        self.calls = 0
+
+    def get_voices(self):
+        return ['af_sky']
+
+    def create(self, text, voice, speed=1.0, lang='en-us', phonemes=None):
+        assert os.getpid() != self.forbidden_pid
+        self.calls += 1
+        time.sleep(self.delay)
+        return np.full(len(text) * 10, len(text) / 1000, dtype=np.float32), 24000
@@ -0,0 +1,62 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from audiblez import pending_books, read_batch_manifest
+
+
+class ReadBatchManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_directory_lists_its_epubs_with_the_defaults(self):
+        for name in ('b.epub', 'a.EPUB', 'notes.txt'):
+            (self.dir / name).touch()
+        books = read_batch_manifest(self.dir, 'en-gb', 'af_sky', 1.0)
+        self.assertEqual(books, [dict(lang='en-gb', voice='af_sky', speed=1.0, path=str(self.dir / 'a.EPUB')),
+                                 dict(lang='en-gb', voice='af_sky', speed=1.0, path=str(self.dir / 'b.epub'))])
+
+    def test_json_books_override_the_defaults_relative_to_the_manifest(self):
+        (self.dir / 'library').mkdir()
+        manifest = self.dir / 'library' / 'books.json'
+        manifest.write_text(json.dumps({'books': [
+            'plain.epub',
+            {'path': 'sub/fr.epub', 'lang': 'fr-fr', 'voice': 'ff_siwis', 'speed': '1.2'},
+            {'path': '/abs/book.epub', 'voice': None},
+        ]}), encoding='utf-8')
+        books = read_batch_manifest(manifest, 'en-gb', 'af_sky', 1.0)
+        self.assertEqual([b['path'] for b in books],
+                         [str(self.dir / 'library' / 'plain.epub'), str(self.dir / 'library' / 'sub' / 'fr.epub'),
+                          '/abs/book.epub'])
+        self.assertEqual([(b['lang'], b['voice'], b['speed']) for b in books],
+                         [('en-gb', 'af_sky', 1.0), ('fr-fr', 'ff_siwis', 1.2), ('en-gb', 'af_sky', 1.0)])
+
+    def test_json_list_of_books(self):
+        manifest = self.dir / 'books.json'
+        manifest.write_text(json.dumps([{'path': 'a.epub', 'speed': 0.8}]), encoding='utf-8')
+        self.assertEqual(read_batch_manifest(manifest, 'en-us', 'am_adam', 1.0),
+                         [dict(lang='en-us', voice='am_adam', speed=0.8, path=str(self.dir / 'a.epub'))])
+
+    def test_empty_csv_cells_fall_back_to_the_defaults(self):
+        manifest = self.dir / 'books.csv'
+        manifest.write_text('path,voice,lang,speed\n'
+                            'a.epub,,,\n'
+                            'b.epub,bf_emma,en-gb,1.5\n', encoding='utf-8')
+        books = read_batch_manifest(manifest, 'en-us', 'af_sky', 1.0)
+        self.assertEqual(books, [dict(lang='en-us', voice='af_sky', speed=1.0, path=str(self.dir / 'a.epub')),
+                                 dict(lang='en-gb', voice='bf_emma', speed=1.5, path=str(self.dir / 'b.epub'))])
+
+
+class PendingBooksTest(unittest.TestCase):
+    def test_resumes_at_the_first_unfinished_book(self):
+        books = [dict(path=name) for name in ('a.epub', 'b.epub', 'c.epub', 'd.epub', 'e.epub')]
+        status = {'a.epub': dict(status='done'), 'b.epub': dict(status='done'),
+                  'c.epub': dict(status='running'), 'd.epub': dict(status='failed')}
+        self.assertEqual([b['path'] for b in pending_books(books, status)], ['c.epub', 'd.epub', 'e.epub'])
+        self.assertEqual(pending_books(books, {}), books)
+        self.assertEqual(pending_books(books, {b['path']: dict(status='done') for b in books}), [])
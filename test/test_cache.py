@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from audiblez import DiskCache, RunManifest, plan_chapters, synthesize_chapter
+from fake_backend import FakeKokoro
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'cache.sqlite'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_persists_between_instances(self):
+        cache = DiskCache(self.path, 1024)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', b'hello')
+        cache.close()
+        cache = DiskCache(self.path, 1024)
+        self.assertEqual(cache.get('a'), b'hello')
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_evicts_least_recently_used_down_to_the_low_water_mark(self):
+        cache = DiskCache(self.path, 100)
+        for key in range(10):
+            cache.put(str(key), b'x' * 10)
+        cache.get('0')
+        cache.put('10', b'x' * 10)
+        self.assertEqual(cache.total_bytes, 90)
+        self.assertIsNone(cache.get('1'))
+        self.assertIsNone(cache.get('2'))
+        for key in [0] + list(range(3, 11)):
+            self.assertIsNotNone(cache.get(str(key)))
+        cache.put('11', b'x' * 10)  # fits again without evicting
+        self.assertEqual(cache.total_bytes, 100)
+        self.assertIsNotNone(cache.get('3'))
+
+    def test_instances_sharing_the_file_stay_under_the_cap_together(self):
+        first, second = DiskCache(self.path, 100), DiskCache(self.path, 100)
+        for key in range(10):
+            (first if key % 2 else second).put(str(key), b'x' * 20)
+            self.assertLessEqual(first.total_bytes, 100)
+        self.assertEqual(second.total_bytes, first.total_bytes)
+        self.assertIsNotNone(first.get('9'))
+        self.assertIsNone(second.get('0'))
+        first.put('9', b'x' * 5)  # replacing a value counts only the new one
+        self.assertEqual(second.total_bytes, first.total_bytes)
+        first.close()
+        second.close()
+
+
+class AudioCacheTest(unittest.TestCase):
+    text = '\n'.join(f'Paragraph number {n}. It has two sentences.' for n in range(5))
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.cache = DiskCache(self.dir / 'audio.sqlite', 1024 * 1024)
+        self.models = []
+        for name in ('model.onnx', 'model.int8.onnx'):
+            (self.dir / name).write_bytes(name.encode())
+            self.models.append(str(self.dir / name))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def synthesize(self, voice='af_sky', speed=1.0, lang='en-gb', model=0):
+        kokoro = FakeKokoro(model_path=self.models[model])
+        hits, misses = self.cache.hits, self.cache.misses
+        synthesize_chapter(kokoro, str(self.dir / 'chapter.wav'), self.text, voice, speed, lang, audio_cache=self.cache)
+        return kokoro.calls, self.cache.hits - hits, self.cache.misses - misses
+
+    def test_key_changes_with_voice_speed_lang_and_model(self):
+        calls, hits, misses = self.synthesize()
+        self.assertEqual(hits, 0)
+        self.assertGreater(misses, 1)
+        self.assertEqual(calls, misses)
+        chunks = misses
+        self.assertEqual(self.synthesize(), (0, chunks, 0))
+        for changed in (dict(voice='af_bella'), dict(speed=1.2), dict(lang='en-us'), dict(model=1)):
+            self.assertEqual(self.synthesize(**changed), (chunks, 0, chunks), changed)
+            self.assertEqual(self.synthesize(**changed), (0, chunks, 0), changed)
+
+    def test_chapter_file_from_another_selection_is_not_reused(self):
+        filename = str(self.dir / 'book.epub')
+        manifest = RunManifest(self.dir / 'book.manifest.sqlite')
+        texts = ['The first chapter of the book.', 'The second chapter of the book.']
+        _, jobs = plan_chapters(filename, texts, 'Title by Author', 'af_sky', 1.0, 'en-gb', manifest)
+        for i, chapter_filename, text in jobs:
+            synthesize_chapter(FakeKokoro(), chapter_filename, text, 'af_sky', 1.0, 'en-gb', manifest=manifest)
+        _, jobs = plan_chapters(filename, texts, 'Title by Author', 'af_sky', 1.0, 'en-gb', manifest)
+        self.assertEqual(jobs, [])
+        # picking only the second chapter makes it chapter 1, whose file has the first chapter in it
+        _, jobs = plan_chapters(filename, texts[1:], 'Title by Author', 'af_sky', 1.0, 'en-gb', manifest)
+        self.assertEqual([(i, Path(chapter_filename).name) for i, chapter_filename, _ in jobs], [(1, 'book_chapter_1.wav')])
@@ -0,0 +1,36 @@
+import unittest
+
+from audiblez import chunk_text, split_sentences, MAX_CHUNK_CHARS, SENTENCE_PAUSE, PARAGRAPH_PAUSE
+
+
+class ChunkTextTest(unittest.TestCase):
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences('It is. Is it? "Yes!" she said. Fine… ok'),
+                         ['It is.', 'Is it?', '"Yes!"', 'she said.', 'Fine…', 'ok'])
+
+    def test_abbreviations_do_not_end_sentences(self):
+        self.assertEqual(split_sentences('Mr. Smith met Dr. Jones at 3 p.m. in St. Louis. They talked.'),
+                         ['Mr. Smith met Dr. Jones at 3 p.m. in St. Louis.', 'They talked.'])
+        self.assertEqual(split_sentences('It was written by J. R. R. Tolkien. He was a professor.'),
+                         ['It was written by J. R. R. Tolkien.', 'He was a professor.'])
+        self.assertEqual(split_sentences('Prices rose approx. ten percent. (Mrs. Hudson was not amused.) I agree.'),
+                         ['Prices rose approx. ten percent.', '(Mrs. Hudson was not amused.)', 'I agree.'])
+        self.assertEqual(split_sentences('We met at 5 p.m. Yesterday it rained.'), ['We met at 5 p.m.', 'Yesterday it rained.'])
+
+    def test_chunks_do_not_span_paragraphs(self):
+        chunks = chunk_text('One. Two.\nThree.\n\nFour.')
+        self.assertEqual(chunks, [
+            (['One.', 'Two.'], PARAGRAPH_PAUSE),
+            (['Three.'], PARAGRAPH_PAUSE),
+            (['Four.'], PARAGRAPH_PAUSE),
+        ])
+
+    def test_chunks_are_bounded(self):
+        sentence = 'Four score and seven years ago our fathers brought forth on this continent a new nation.'
+        text = ' '.join([sentence] * 50) + '\n' + 'word ' * 1000 + '\n' + 'x' * 1000
+        chunks = chunk_text(text)
+        for sentences, pause in chunks:
+            self.assertLessEqual(len(' '.join(sentences)), MAX_CHUNK_CHARS)
+        self.assertEqual(chunks[0][1], SENTENCE_PAUSE)
+        joined = ''.join(''.join(sentences) for sentences, _ in chunks)
+        self.assertEqual(joined.replace(' ', ''), text.replace(' ', '').replace('\n', ''))
@@ -0,0 +1,56 @@
+import unittest
+from pathlib import Path
+
+import ebooklib
+from bs4 import BeautifulSoup
+from ebooklib import epub
+
+from audiblez import extract_texts, extract_text
+
+GETTYSBURG = Path(__file__).parent.parent / 'GETTYSBURG ADDRESS - Abraham Lincoln.epub'
+
+
+def extract_text_bs4(content):
+    # The BeautifulSoup implementation extract_text replaced, kept as the reference for its output.
+    soup = BeautifulSoup(content, features='lxml')
+    chapter_text = ''
+    for child in soup.find_all(['title', 'p', 'h1', 'h2', 'h3', 'h4']):
+        inner_text = child.text.strip() if child.text else ""
+        if inner_text:
+            chapter_text += inner_text + '\n'
+    return chapter_text
+
+
+class FakeChapter:
+    def __init__(self, content):
+        self.content = content
+
+    def get_body_content(self):
+        return self.content
+
+
+class ExtractTextsTest(unittest.TestCase):
+    def test_same_text_as_beautifulsoup_on_gettysburg(self):
+        book = epub.read_epub(str(GETTYSBURG))
+        documents = [d for d in book.get_items() if d.get_type() == ebooklib.ITEM_DOCUMENT]
+        texts = extract_texts(documents)
+        self.assertIn('Four score and seven years ago', texts[0] + texts[-1])
+        self.assertEqual(texts, [extract_text_bs4(d.get_body_content()) for d in documents])
+
+    def test_same_text_as_beautifulsoup_on_tricky_markup(self):
+        documents = [
+            b'',
+            b'<!-- only a comment -->',
+            b'plain text without tags',
+            '<h1>Café <!-- note --> “quoted”</h1><p>a <b>bold</b>&amp;<i>it</i></p>'.encode('utf-8'),
+            b'<div><p>one</p><p>   </p><p>two<script>var x;</script><style>p {}</style> tail</p></div>',
+            b'<h2>Heading<p>paragraph inside heading</p></h2><h3><span>deep <em>er</em></span></h3>',
+            b'<p>line<br/>break</p><p><![CDATA[cdata]]>after</p><h4>\n  spaced \n</h4>',
+            b'<p><svg><title>svg title</title></svg> text</p><noscript><p>noscript</p></noscript>',
+        ]
+        for content in documents:
+            self.assertEqual(extract_text(content), extract_text_bs4(content), content)
+
+    def test_parallel_extraction_keeps_chapter_order(self):
+        chapters = [FakeChapter(f'<p>Chapter {n}</p>'.encode()) for n in range(50)]
+        self.assertEqual(extract_texts(chapters), [f'Chapter {n}\n' for n in range(50)])
@@ -1,7 +1,9 @@
+import os
+import tempfile
 import unittest
 from ebooklib import epub
 
-from audiblez import find_chapters
+from audiblez import find_chapters, classify_documents, read_book
 
 
 class FindChaptersTest(unittest.TestCase):
@@ -141,7 +143,7 @@ class FindChaptersTest(unittest.TestCase):
         ])
 
     def test_dracula_default_all_chapters(self):
-        # If it cannot detect chapters, default to all available documents.
+        # If it cannot detect chapters by name, default to all documents that are not front or back matter.
         self.base('../epub/dracula.epub', [
             '2903486949112998543_345-h-0.htm.xhtml',  # 2087
             '2903486949112998543_345-h-1.htm.xhtml',  # 3997
@@ -175,6 +177,91 @@ class FindChaptersTest(unittest.TestCase):
             '2903486949112998543_345-h-29.htm.xhtml',  # 40006
             '2903486949112998543_345-h-30.htm.xhtml',  # 4081
             '2903486949112998543_345-h-31.htm.xhtml',  # 19692
-            'toc.xhtml',  # 4900
+            # 'toc.xhtml',  # 4900, back matter
             'wrap0000.xhtml',  # 374
         ])
+
+
+class ClassifyDocumentsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'book.epub')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_book(self, documents, toc):
+        book = epub.EpubBook()
+        book.set_title('Title')
+        book.add_author('Author')
+        items = {}
+        for file_name, content in documents:
+            items[file_name] = epub.EpubHtml(title=file_name, file_name=file_name, content=f'<p>{content}</p>')
+            book.add_item(items[file_name])
+        book.toc = [epub.Link(file_name, label, file_name) for file_name, label in toc]
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = [items[file_name] for file_name, _ in documents]
+        epub.write_epub(self.path, book)
+        return read_book(self.path)[0]
+
+    def test_uses_table_of_contents_labels_and_spine_order(self):
+        book = self.write_book([
+            ('s000.xhtml', 'Cover'),
+            ('s001.xhtml', 'Contents'),
+            ('s002.xhtml', 'It was a dark and stormy night.'),
+            ('s003.xhtml', 'The night went on.'),
+            ('s004.xhtml', 'Continued.'),
+            ('s005.xhtml', 'Dawn.'),
+            ('s006.xhtml', '1. A note.'),
+            ('s007.xhtml', 'Night, 1, 2'),
+            ('s008.xhtml', 'Copyright'),
+        ], [
+            ('s001.xhtml', 'Contents'),
+            ('s002.xhtml', 'One'),
+            ('s003.xhtml', 'Two'),
+            ('s005.xhtml', 'Three'),
+            ('s006.xhtml', 'Notes'),
+            ('s007.xhtml', 'Index'),
+            ('s008.xhtml', 'Copyright'),
+        ])
+        kinds = [(item.get_name(), kind) for item, kind in classify_documents(book)]
+        self.assertEqual(kinds, [
+            ('s000.xhtml', 'front'),
+            ('s001.xhtml', 'front'),
+            ('s002.xhtml', 'chapter'),
+            ('s003.xhtml', 'chapter'),
+            ('s004.xhtml', 'chapter'),
+            ('s005.xhtml', 'chapter'),
+            ('s006.xhtml', 'notes'),
+            ('s007.xhtml', 'index'),
+            ('s008.xhtml', 'back'),
+            ('nav.xhtml', 'back'),
+        ])
+        self.assertEqual([c.get_name() for c in find_chapters(book)],
+                         ['s002.xhtml', 's003.xhtml', 's004.xhtml', 's005.xhtml'])
+        self.assertEqual([c.get_name() for c in find_chapters(book, include=['notes'])],
+                         ['s002.xhtml', 's003.xhtml', 's004.xhtml', 's005.xhtml', 's006.xhtml'])
+
+    def test_file_names_without_table_of_contents(self):
+        book = self.write_book([
+            ('002_FM_halftitle.xhtml', 'Title'),
+            ('010_chapter.xhtml', 'One'),
+            ('011_chapter.xhtml', 'Two'),
+            ('025_BM_endNotes.xhtml', 'Notes'),
+            ('025_BM_bibliographyGroup.xhtml', 'Books'),
+        ], [])
+        self.assertEqual([kind for _, kind in classify_documents(book)][:5],
+                         ['front', 'chapter', 'chapter', 'notes', 'back'])
+        self.assertEqual([c.get_name() for c in find_chapters(book)], ['010_chapter.xhtml', '011_chapter.xhtml'])
+
+    def test_included_kinds_are_kept_when_chapters_match_by_name(self):
+        book = self.write_book([
+            ('002_FM_halftitle.xhtml', 'Title'),
+            ('010_chapter.xhtml', 'One'),
+            ('011_chapter.xhtml', 'Two'),
+            ('025_BM_endNotes.xhtml', 'Notes'),
+        ], [])
+        self.assertEqual([c.get_name() for c in find_chapters(book)], ['010_chapter.xhtml', '011_chapter.xhtml'])
+        self.assertEqual([c.get_name() for c in find_chapters(book, include=['notes'])],
+                         ['010_chapter.xhtml', '011_chapter.xhtml', '025_BM_endNotes.xhtml'])
@@ -0,0 +1,158 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from audiblez import (Cancelled, RunManifest, SynthesisServer, make_request_handler, submit_to_server,
+                      synthesize_in_pool, synthesize_serially)
+from fake_backend import FakeKokoro
+
+
+def chapter_jobs(directory, chapters=3, paragraphs=10):
+    return [(n, str(Path(directory) / f'book_chapter_{n}.wav'),
+             '\n'.join(f'Chapter {n}, paragraph {p}.' for p in range(paragraphs))) for n in range(1, chapters + 1)]
+
+
+def wait_until_finished(server, job_id):
+    sent, finished = 0, False
+    while not finished:
+        events, finished = server.wait_events(job_id, sent)
+        sent += len(events)
+
+
+class SerialJobTest(unittest.TestCase):
+    def test_events_and_cancellation_within_one_chunk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = chapter_jobs(tmp)
+            manifest = RunManifest(Path(tmp) / 'book.manifest.sqlite')
+            kokoro, cancel, events = FakeKokoro(), threading.Event(), []
+
+            def on_event(event):
+                events.append(event)
+                if event['event'] == 'chunk_done' and event['chapter'] == 2 and event['chunk'] == 3:
+                    cancel.set()
+
+            with self.assertRaises(Cancelled):
+                for _ in synthesize_serially(kokoro, jobs, 'af_sky', 1.0, 'en-gb', manifest=manifest,
+                                             on_event=on_event, cancel=cancel):
+                    pass
+            self.assertEqual(kokoro.calls, 13)  # chapter 1 and 3 chunks of chapter 2
+            self.assertEqual([e['event'] for e in events[:2]], ['chapter_started', 'chunk_done'])
+            self.assertEqual(events[-1], dict(event='chunk_done', chapter=2, chunk=3, chunks=10))
+            self.assertTrue(Path(jobs[0][1]).exists())
+            self.assertFalse(Path(jobs[1][1]).exists())
+
+            kokoro = FakeKokoro()
+            list(synthesize_serially(kokoro, jobs[1:], 'af_sky', 1.0, 'en-gb', manifest=manifest))
+            self.assertEqual(kokoro.calls, 17)  # chapter 2 resumed at its 4th chunk, then chapter 3
+            self.assertTrue(Path(jobs[2][1]).exists())
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'sharing the model needs fork')
+class PoolJobTest(unittest.TestCase):
+    def test_worker_events_reach_the_calling_thread_and_cancel_stops_the_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = chapter_jobs(tmp, chapters=4)
+            cancel, events, threads = threading.Event(), [], set()
+
+            def on_event(event):
+                events.append(event)
+                threads.add(threading.get_ident())
+                if event['event'] == 'chunk_done' and event['chunk'] == 2:
+                    cancel.set()
+
+            start = time.time()
+            with self.assertRaises(Cancelled):
+                for _ in synthesize_in_pool(FakeKokoro(delay=0.3), jobs, 'af_sky', 1.0, 'en-gb', 2,
+                                            share_model=True, on_event=on_event, cancel=cancel):
+                    pass
+            self.assertEqual(threads, {threading.get_ident()})
+            self.assertEqual(sum(e['event'] == 'chapter_started' for e in events), 2)
+            self.assertLessEqual(sum(e['event'] == 'chunk_done' for e in events), 6)  # one more chunk per worker
+            self.assertLess(time.time() - start, 3)
+            self.assertFalse(any(Path(chapter_filename).exists() for _, chapter_filename, _ in jobs))
+
+
+class ServerCancelTest(unittest.TestCase):
+    def test_cancelled_job_stops_and_the_session_keeps_serving(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = SynthesisServer(FakeKokoro(delay=0.02))
+            text = '\n'.join(f'Paragraph {p}.' for p in range(50))
+            first = server.submit(dict(text=text, output=str(Path(tmp) / 'first.wav')))
+            threading.Thread(target=server.run, daemon=True).start()
+            events, _ = server.wait_events(first, 2)
+            self.assertTrue(server.cancel(first))
+            second = server.submit(dict(text='One more.\nAnd done.', output=str(Path(tmp) / 'second.wav')))
+            for job_id in (first, second):
+                wait_until_finished(server, job_id)
+            self.assertEqual(server.jobs[first]['status'], 'cancelled')
+            self.assertLess(sum(e['event'] == 'chunk_done' for e in server.jobs[first]['events']), 50)
+            self.assertEqual(server.jobs[second]['status'], 'done')
+            self.assertTrue((Path(tmp) / 'second.wav').exists())
+            self.assertFalse(server.cancel(second))
+
+
+class ServerBackgroundStepTest(unittest.TestCase):
+    def test_a_job_parsing_its_book_does_not_stall_the_others(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = SynthesisServer(FakeKokoro())
+            parsing = threading.Event()
+
+            def read_book_texts(file_path, include=()):
+                parsing.wait(10)
+                return 'Title', 'Author', ['Chapter one.\nIt begins.']
+
+            server.read_book_texts = read_book_texts
+            book = server.submit(dict(epub=str(Path(tmp) / 'book.epub'), output_dir=tmp))
+            text = server.submit(dict(text='One more.\nAnd done.', output=str(Path(tmp) / 'text.wav')))
+            threading.Thread(target=server.run, daemon=True).start()
+            wait_until_finished(server, text)
+            self.assertEqual(server.jobs[text]['status'], 'done')
+            self.assertEqual(server.jobs[book]['status'], 'running')
+            parsing.set()
+            wait_until_finished(server, book)
+            self.assertEqual(server.jobs[book]['status'], 'done')
+            self.assertIn('book', [e['event'] for e in server.jobs[book]['events']])
+
+
+class ServerHttpTest(unittest.TestCase):
+    def setUp(self):
+        import http.server
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), make_request_handler(SynthesisServer(FakeKokoro())))
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def status(self, path, method='GET', body=None):
+        request = urllib.request.Request(f'http://127.0.0.1:{self.port}{path}', body, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_bad_requests_get_an_error_status(self):
+        self.assertEqual(self.status('/jobs/abc/events'), 404)
+        self.assertEqual(self.status('/jobs/7/events'), 404)
+        self.assertEqual(self.status('/jobs/abc', method='DELETE'), 404)
+        self.assertEqual(self.status('/jobs', method='POST', body=b'not json'), 400)
+        self.assertEqual(self.status('/jobs', method='POST', body=b'{"voice": "af_sky"}'), 400)
+        self.assertEqual(self.status('/jobs'), 200)
+
+    def test_refused_job_is_an_error_not_a_local_conversion(self):
+        with self.assertRaises(SystemExit):
+            submit_to_server(dict(voice='af_sky'), self.port)
+
+    def test_no_server_falls_back_to_converting_here(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            port = unused.getsockname()[1]
+        self.assertFalse(submit_to_server(dict(text='Hello there.'), port))
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+import warnings
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import ebooklib
+from ebooklib import epub
+
+from audiblez import LazyEpub, SynthesisServer, read_book, find_chapters, extract_texts
+
+GETTYSBURG = Path(__file__).parent.parent / 'GETTYSBURG ADDRESS - Abraham Lincoln.epub'
+
+
+def read_epub(path):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return epub.read_epub(str(path))
+
+
+class LazyEpubTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'book.epub')
+        book = epub.EpubBook()
+        book.set_title('A Title')
+        book.add_author('An Author')
+        chapters = []
+        for n in (2, 1):
+            chapter = epub.EpubHtml(title=f'Chapter {n}', file_name=f'chapter_{n}.xhtml')
+            chapter.content = f'<h1>Chapter {n}</h1><p>Text of chapter {n}.</p>'
+            chapters.append(chapter)
+            book.add_item(chapter)
+        book.add_item(epub.EpubImage(uid='image', file_name='images/big image.png', media_type='image/png',
+                                     content=b'\x89PNG' + b'\0' * 100000))
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = ['nav', chapters[1], chapters[0]]
+        epub.write_epub(self.path, book)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_same_items_and_text_as_ebooklib(self):
+        for path in (GETTYSBURG, self.path):
+            expected, book = read_epub(path), LazyEpub(path)
+            self.assertEqual([(i.get_name(), i.get_type()) for i in book.get_items()],
+                             [(i.get_name(), i.get_type()) for i in expected.get_items()])
+            self.assertEqual(book.get_metadata('DC', 'title'), expected.get_metadata('DC', 'title'))
+            self.assertEqual(extract_texts(book.get_items_of_type(ebooklib.ITEM_DOCUMENT)),
+                             extract_texts(expected.get_items_of_type(ebooklib.ITEM_DOCUMENT)))
+
+    def test_reads_metadata_and_spine(self):
+        book, title, creator = read_book(self.path)
+        self.assertEqual((title, creator), ('A Title', 'An Author'))
+        self.assertEqual([i.get_name() for i in book.spine], ['nav.xhtml', 'chapter_1.xhtml', 'chapter_2.xhtml'])
+        self.assertEqual(book.get_item_with_href('images/big image.png').get_type(), ebooklib.ITEM_IMAGE)
+
+    def test_only_reads_the_documents_asked_for(self):
+        book = LazyEpub(self.path)
+        read = []
+        zip_read = book.zip.read
+        book.zip.read = lambda name: read.append(name) or zip_read(name)
+        texts = extract_texts(find_chapters(book))
+        self.assertEqual(texts, ['Chapter 1\nText of chapter 1.\n', 'Chapter 2\nText of chapter 2.\n'])
+        # the chapters, and the empty nav document then the NCX for the table of contents
+        self.assertEqual(sorted(read), ['EPUB/chapter_1.xhtml', 'EPUB/chapter_2.xhtml', 'EPUB/nav.xhtml', 'EPUB/toc.ncx'])
+
+    def test_closes_the_archive_as_a_context_manager(self):
+        with LazyEpub(self.path) as book:
+            self.assertEqual(len(extract_texts(find_chapters(book))), 2)
+        self.assertIsNone(book.zip.fp)
+        with mock.patch.object(LazyEpub, 'close', autospec=True, side_effect=LazyEpub.close) as close:
+            SynthesisServer.read_book_texts(self.path)
+        close.assert_called_once()
+
+    def test_rejects_files_that_are_not_epubs(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a zip')
+        with self.assertRaises(zipfile.BadZipFile):
+            LazyEpub(self.path)
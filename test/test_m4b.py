@@ -0,0 +1,79 @@
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from audiblez import create_m4b, encode_chapter, ffmetadata, plan_chapters
+
+
+class M4bTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.chapter_files = []
+        for n, seconds in ((1, 1.5), (2, 0.25)):
+            chapter_file = str(self.dir / f'book_chapter_{n}.wav')
+            sf.write(chapter_file, np.zeros(int(seconds * 24000), dtype=np.float32), 24000)
+            self.chapter_files.append(chapter_file)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ffmetadata_escapes_tags_and_marks_chapters_by_duration(self):
+        metadata = ffmetadata(self.chapter_files, 'Title = 1; #2', 'A\\B\nC')
+        self.assertEqual(metadata.splitlines(), [
+            ';FFMETADATA1', 'title=Title \\= 1\\; \\#2', 'album=Title \\= 1\\; \\#2',
+            'artist=A\\\\B\\', 'C', 'author=A\\\\B\\', 'C', 'genre=Audiobook',
+            '[CHAPTER]', 'TIMEBASE=1/1000', 'START=0', 'END=1500', 'title=Chapter 1',
+            '[CHAPTER]', 'TIMEBASE=1/1000', 'START=1500', 'END=1750', 'title=Chapter 2',
+        ])
+
+    def test_plan_chapters_lists_no_file_for_skipped_chapters(self):
+        filename = str(self.dir / 'other.epub')
+        texts = ['Part One', 'A chapter long enough to narrate.', '', 'Another chapter to narrate.']
+        chapter_files, jobs = plan_chapters(filename, texts, 'Title by Author', 'af_sky', 1.0, 'en-gb')
+        self.assertEqual(chapter_files, [str(self.dir / 'other_chapter_2.wav'), str(self.dir / 'other_chapter_3.wav')])
+        self.assertEqual([(i, chapter_file) for i, chapter_file, _ in jobs], list(zip((2, 3), chapter_files)))
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'needs ffmpeg')
+    def test_create_m4b_has_the_tags_and_chapters(self):
+        filename = str(self.dir / 'book.epub')
+        create_m4b(self.chapter_files, filename, 'Title', 'Author')
+        metadata = subprocess.run(['ffmpeg', '-v', 'error', '-i', filename.replace('.epub', '.m4b'), '-f', 'ffmetadata', '-'],
+                                  capture_output=True, text=True, check=True).stdout.splitlines()
+        self.assertIn('title=Title', metadata)
+        self.assertIn('artist=Author', metadata)
+        self.assertEqual(metadata[metadata.index('[CHAPTER]'):], [
+            '[CHAPTER]', 'TIMEBASE=1/1000', 'START=0', 'END=1500', 'title=Chapter 1',
+            '[CHAPTER]', 'TIMEBASE=1/1000', 'START=1500', 'END=1750', 'title=Chapter 2',
+        ])
+        self.assertFalse((self.dir / 'book.concat.txt').exists())
+        self.assertFalse((self.dir / 'book.ffmetadata.txt').exists())
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'needs ffmpeg')
+    def test_chapters_encoded_separately_start_at_their_markers(self):
+        chapter_files = []
+        for n, seconds in enumerate((1.5, 0.25, 2.3333, 0.77), start=1):
+            audio = np.zeros(int(seconds * 24000), dtype=np.float32)
+            audio[:240] = 0.8 * np.sin(np.arange(240) * 0.5)  # a click where the chapter starts
+            chapter_file = str(self.dir / f'book_chapter_{n}.wav')
+            sf.write(chapter_file, audio, 24000)
+            chapter_files.append(chapter_file)
+        filename = str(self.dir / 'book.epub')
+        create_m4b(chapter_files, filename, 'Title', 'Author', [encode_chapter(f) for f in chapter_files])
+        m4b = filename.replace('.epub', '.m4b')
+        metadata = subprocess.run(['ffmpeg', '-v', 'error', '-i', m4b, '-f', 'ffmetadata', '-'],
+                                  capture_output=True, text=True, check=True).stdout.splitlines()
+        markers = [int(line[len('START='):]) / 1000 for line in metadata if line.startswith('START=')]
+        decoded = np.frombuffer(subprocess.run(['ffmpeg', '-v', 'error', '-i', m4b, '-f', 's16le', '-'],
+                                               capture_output=True, check=True).stdout, dtype=np.int16)
+        loud = np.flatnonzero(np.abs(decoded) > 0.3 * 32768)
+        clicks = [loud[0]] + [b for a, b in zip(loud, loud[1:]) if b - a > 2400]
+        starts = [(click - clicks[0]) / 24000 for click in clicks]  # the decoder keeps the first priming
+        self.assertEqual(len(starts), 4)
+        for marker, start in zip(markers, starts):
+            self.assertAlmostEqual(marker, start, delta=0.005)
@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from audiblez import Metrics, ThroughputEstimate, measure_chars_per_second
+from fake_backend import FakeKokoro
+
+
+class MetricsTest(unittest.TestCase):
+    def test_stages_and_worker_metrics_add_up(self):
+        metrics = Metrics()
+        with metrics.time('inference'):
+            pass
+        metrics.count('audio_seconds', 2.5)
+        metrics.merge(dict(stages={'inference': (3.0, 2), 'write': (1.0, 2)}, counters={'audio_seconds': 7.5},
+                           peak_rss_mb=300))
+        report = metrics.report(wall_seconds=20, synthesis_seconds=5)
+        self.assertEqual(report['stages']['inference']['calls'], 3)
+        self.assertGreaterEqual(report['stages']['inference']['seconds'], 3.0)
+        self.assertEqual(report['stages']['write'], dict(seconds=1.0, calls=2))
+        self.assertEqual(report['audio_seconds'], 10)
+        self.assertEqual(report['rtf'], 2)
+        self.assertEqual(report['peak_worker_rss_mb'], 300)
+
+
+class TraceTest(unittest.TestCase):
+    def test_nothing_is_recorded_unless_tracing(self):
+        metrics = Metrics()
+        with metrics.span('chapter'), metrics.time('write'):
+            pass
+        self.assertIsNone(metrics.trace_events)
+
+    def test_spans_stages_and_subprocesses_in_chrome_trace_format(self):
+        metrics = Metrics()
+        metrics.start_trace()
+        with metrics.span('chapter', file='book_chapter_1.wav'):
+            with metrics.time('inference', call='kokoro.create'):
+                pass
+        proc = metrics.run([sys.executable, '-c', 'pass'], 'encode')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.json')
+            metrics.write_trace(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(set(spans), {'chapter', 'inference', 'encode', os.path.basename(sys.executable)})
+        chapter, inference = spans['chapter'], spans['inference']
+        self.assertEqual((inference['pid'], inference['tid']), (os.getpid(), chapter['tid']))
+        self.assertLessEqual(chapter['ts'], inference['ts'])
+        self.assertGreaterEqual(chapter['ts'] + chapter['dur'], inference['ts'] + inference['dur'])
+        self.assertEqual(inference['args'], dict(call='kokoro.create'))
+        self.assertEqual(spans[os.path.basename(sys.executable)]['pid'], proc.pid)
+        self.assertEqual(metrics.stages['encode'][1], 1)
+
+
+class ThroughputEstimateTest(unittest.TestCase):
+    def test_short_chapters_barely_move_the_estimate(self):
+        throughput = ThroughputEstimate(smoothing_seconds=600)
+        throughput.update(100, now=0)  # the first chunk starts the clock
+        throughput.update(60000, now=600)  # 100 characters per second
+        self.assertEqual(throughput.eta(1000), 10)
+        throughput.update(10, now=601)  # a short chapter at 10 characters per second
+        self.assertAlmostEqual(throughput.rate, 100, delta=1)
+        throughput.update(6000, now=1801)  # a long slow stretch at 5 characters per second
+        self.assertLess(throughput.rate, 20)
+
+    def test_slow_start_does_not_hold_the_estimate_back(self):
+        throughput = ThroughputEstimate(smoothing_seconds=600)
+        self.assertEqual(throughput.eta(1000), 0)
+        throughput.update(100, now=30)  # after loading the model, not counted
+        throughput.update(100, now=40)  # a slow warm-up chunk at 10 characters per second
+        for second in range(41, 101):  # then steadily 100 characters per second
+            throughput.update(100, now=second)
+        self.assertAlmostEqual(throughput.rate, 6100 / 70)
+        for second in range(101, 1001):
+            throughput.update(100, now=second)
+        self.assertAlmostEqual(throughput.rate, 100, delta=1)
+
+
+class CalibrationTest(unittest.TestCase):
+    def test_measured_once_per_model_language_and_speed(self):
+        kokoro = FakeKokoro()
+        rate = measure_chars_per_second(kokoro, 'af_sky', 1.0, 'en-gb')
+        self.assertEqual(kokoro.calls, 2)  # warm-up and measurement
+        self.assertEqual(measure_chars_per_second(kokoro, 'af_sky', 1.0, 'en-gb'), rate)
+        self.assertEqual(kokoro.calls, 2)
+        measure_chars_per_second(kokoro, 'af_sky', 1.0, 'fr-fr')
+        self.assertEqual(kokoro.calls, 4)
+        other = FakeKokoro()
+        measure_chars_per_second(other, 'af_sky', 1.0, 'en-gb')
+        self.assertEqual(other.calls, 2)
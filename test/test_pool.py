@@ -0,0 +1,24 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from audiblez import synthesize_in_pool, synthesize_chapter
+from fake_backend import FakeKokoro
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'sharing the model needs fork')
+class SharedModelPoolTest(unittest.TestCase):
+    def test_forked_workers_use_the_parent_model(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = [(n, str(Path(tmp) / f'book_chapter_{n}.wav'), f'Chapter {n}. ' * n * 10) for n in range(1, 5)]
+            kokoro = FakeKokoro(forbidden_pid=os.getpid())  # only used from the forked workers
+            results = list(synthesize_in_pool(kokoro, jobs, 'af_sky', 1.0, 'en-gb', 2, share_model=True))
+            self.assertEqual([r[0] for r in results], [1, 2, 3, 4])
+            for n, chapter_filename, text in jobs:
+                expected = str(Path(tmp) / 'expected.wav')
+                synthesize_chapter(FakeKokoro(), expected, text, 'af_sky', 1.0, 'en-gb')
+                np.testing.assert_array_equal(sf.read(chapter_filename)[0], sf.read(expected)[0])
@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import onnxruntime
+
+from audiblez import quantize_model, spectral_distance
+
+try:
+    import onnx
+    from onnx import helper, numpy_helper
+except ImportError:
+    onnx = None
+
+
+class SpectralDistanceTest(unittest.TestCase):
+    def test_ignores_timing_but_not_noise(self):
+        t = np.arange(24000) / 24000
+        tone = np.sin(2 * np.pi * 220 * t).astype(np.float32)
+        self.assertAlmostEqual(spectral_distance(tone, tone), 0)
+        self.assertLess(spectral_distance(tone, np.concatenate([tone, tone[:2400]])), 1)
+        noisy = tone + np.random.default_rng(0).normal(0, 0.05, len(tone)).astype(np.float32)
+        self.assertGreater(spectral_distance(tone, noisy), 5)
+
+
+@unittest.skipIf(onnx is None, 'quantization needs the onnx package')
+class QuantizeModelTest(unittest.TestCase):
+    def test_quantized_matmul_is_smaller_and_close(self):
+        weights = np.random.default_rng(0).normal(0, 1, (256, 256)).astype(np.float32)
+        graph = helper.make_graph(
+            [helper.make_node('MatMul', ['x', 'w'], ['y'])], 'matmul',
+            [helper.make_tensor_value_info('x', onnx.TensorProto.FLOAT, [1, 256])],
+            [helper.make_tensor_value_info('y', onnx.TensorProto.FLOAT, [1, 256])],
+            [numpy_helper.from_array(weights, 'w')])
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path, quantized_path = Path(tmp) / 'model.onnx', Path(tmp) / 'model.int8.onnx'
+            onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=8), model_path)
+            quantize_model(str(model_path), str(quantized_path))
+            self.assertLess(quantized_path.stat().st_size, model_path.stat().st_size / 3)
+            x = np.random.default_rng(1).normal(0, 1, (1, 256)).astype(np.float32)
+            y = onnxruntime.InferenceSession(str(quantized_path)).run(None, {'x': x})[0]
+            np.testing.assert_allclose(y, x @ weights, atol=1.5)
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from audiblez import RunManifest, synthesize_chapter, synthesize_chapter_steps, chapter_hash, readable_frames
+from fake_backend import FakeKokoro
+
+
+class ResumeTest(unittest.TestCase):
+    text = '\n'.join(f'Paragraph number {n}. It has two sentences.' for n in range(10))
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def synthesize(self, name, interrupt_after=None):
+        manifest = RunManifest(self.dir / 'book.manifest.sqlite')
+        chapter_filename = str(self.dir / name)
+        kokoro = FakeKokoro()
+        steps = synthesize_chapter_steps(kokoro, chapter_filename, self.text, 'af_sky', 1.0, 'en-gb', manifest=manifest)
+        for n, total in steps:
+            if n == interrupt_after:
+                steps.close()
+                break
+        return kokoro, manifest, chapter_filename
+
+    def test_resumes_at_first_unfinished_chunk(self):
+        kokoro, manifest, chapter_filename = self.synthesize('book_chapter_1.wav', interrupt_after=4)
+        self.assertFalse(os.path.exists(chapter_filename))
+        self.assertTrue((self.dir / 'book_chapter_1.part.wav').exists())
+        self.assertEqual(manifest.resume_point(chapter_filename, chapter_hash(self.text, 'af_sky', 1.0, 'en-gb'))[0], 4)
+
+        kokoro, manifest, chapter_filename = self.synthesize('book_chapter_1.wav')
+        self.assertEqual(kokoro.calls, 6)
+        self.assertTrue(manifest.is_done(chapter_filename, chapter_hash(self.text, 'af_sky', 1.0, 'en-gb')))
+        self.assertFalse((self.dir / 'book_chapter_1.part.wav').exists())
+
+        expected = str(self.dir / 'expected.wav')
+        synthesize_chapter(FakeKokoro(), expected, self.text, 'af_sky', 1.0, 'en-gb')
+        np.testing.assert_array_equal(sf.read(chapter_filename)[0], sf.read(expected)[0])
+
+    def test_changed_text_starts_over(self):
+        _, manifest, chapter_filename = self.synthesize('book_chapter_1.wav', interrupt_after=4)
+        self.assertEqual(manifest.resume_point(chapter_filename, chapter_hash(self.text + '!', 'af_sky', 1.0, 'en-gb')),
+                         (0, 0))
+
+    def test_resumes_compressed_chapter_files(self):
+        for extension in ('flac', 'ogg'):
+            chapter_name = f'book_chapter_1.{extension}'
+            self.synthesize(chapter_name, interrupt_after=4)
+            self.assertTrue((self.dir / f'book_chapter_1.part.{extension}').exists())
+            kokoro, manifest, chapter_filename = self.synthesize(chapter_name)
+            self.assertEqual(kokoro.calls, 6)
+            self.assertEqual(sf.info(chapter_filename).format, extension.upper())
+
+            expected = str(self.dir / f'expected.{extension}')
+            synthesize_chapter(FakeKokoro(), expected, self.text, 'af_sky', 1.0, 'en-gb')
+            if extension == 'flac':
+                np.testing.assert_array_equal(sf.read(chapter_filename)[0], sf.read(expected)[0])
+            else:
+                self.assertEqual(sf.info(chapter_filename).frames, sf.info(expected).frames)
+
+    def test_resume_skips_chunks_missing_from_a_cut_file(self):
+        _, manifest, chapter_filename = self.synthesize('book_chapter_1.flac', interrupt_after=8)
+        part = self.dir / 'book_chapter_1.part.flac'
+        # as if the process had been killed before the encoder wrote the last chunks
+        part.write_bytes(part.read_bytes()[:part.stat().st_size // 2])
+        readable = readable_frames(part)
+        chunk_ends = manifest.chunk_ends(chapter_filename)
+        self.assertLess(readable, chunk_ends[0][1])
+        kokoro, manifest, chapter_filename = self.synthesize('book_chapter_1.flac')
+        resumed_at = next(chunk for chunk, end_frame in chunk_ends if end_frame <= readable)
+        self.assertGreater(resumed_at, 0)
+        self.assertEqual(kokoro.calls, 10 - resumed_at)
+        expected = str(self.dir / 'expected.flac')
+        synthesize_chapter(FakeKokoro(), expected, self.text, 'af_sky', 1.0, 'en-gb')
+        np.testing.assert_array_equal(sf.read(chapter_filename)[0], sf.read(expected)[0])
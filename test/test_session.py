@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import onnxruntime
+
+from audiblez import add_session_arguments, read_session_settings, session_options, optimized_model_path
+
+
+class SessionSettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.parser = argparse.ArgumentParser()
+        self.parser.add_argument('--no-cache', default=False, action='store_true')
+        add_session_arguments(self.parser)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def settings(self, *argv):
+        return read_session_settings(self.parser, self.parser.parse_args(argv))
+
+    def test_command_line_overrides_config_file(self):
+        config = self.dir / 'onnx.json'
+        config.write_text(json.dumps(dict(inter_op_threads=3, execution_mode='parallel', memory_arena=False)))
+        settings = self.settings('--onnx-config', str(config), '--inter-op-threads', '2')
+        self.assertEqual((settings['inter_op_threads'], settings['execution_mode']), (2, 'parallel'))
+        self.assertFalse(settings['memory_arena'])
+        self.assertTrue(settings['optimized_model_cache'])
+        self.assertFalse(self.settings('--no-cache')['optimized_model_cache'])
+
+        options = session_options(settings)
+        self.assertEqual(options.inter_op_num_threads, 2)
+        self.assertEqual(options.execution_mode, onnxruntime.ExecutionMode.ORT_PARALLEL)
+        self.assertFalse(options.enable_cpu_mem_arena)
+
+    def test_rejects_unknown_and_invalid_settings(self):
+        config = self.dir / 'onnx.json'
+        for content in [dict(threads=2), dict(graph_optimization='maximum')]:
+            config.write_text(json.dumps(content))
+            with self.assertRaises(SystemExit):
+                self.settings('--onnx-config', str(config))
+
+    def test_optimized_model_path_changes_with_model_and_level(self):
+        model = self.dir / 'model.onnx'
+        model.write_bytes(b'model')
+        path = optimized_model_path(model, 'all', ['CPUExecutionProvider'], self.dir)
+        self.assertEqual(path, optimized_model_path(model, 'all', ['CPUExecutionProvider'], self.dir))
+        self.assertNotEqual(path, optimized_model_path(model, 'basic', ['CPUExecutionProvider'], self.dir))
+        os.utime(model, ns=(0, 0))
+        self.assertNotEqual(path, optimized_model_path(model, 'all', ['CPUExecutionProvider'], self.dir))
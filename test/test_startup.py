@@ -0,0 +1,21 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+HEAVY_MODULES = ['numpy', 'soundfile', 'onnxruntime', 'kokoro_onnx', 'phonemizer', 'pick']
+
+
+class StartupTest(unittest.TestCase):
+    def test_import_and_help_skip_heavy_modules(self):
+        # --help and argument errors must stay fast, see bench/bench_startup.py
+        code = ('import sys, audiblez\n'
+                'sys.argv = ["audiblez", "--help"]\n'
+                'try:\n'
+                '    audiblez.cli_main()\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                f'print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+        result = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).parent.parent,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.splitlines()[-1], '')
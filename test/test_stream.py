@@ -0,0 +1,100 @@
+import io
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from audiblez import PcmStream, PlaybackClock, PrefetchBuffer, chunk_text, ramp_up, SAMPLE_RATE
+
+
+class RampUpTest(unittest.TestCase):
+    def test_first_sentences_get_chunks_of_their_own(self):
+        text = 'Title by Author.\n\nOne. Two. Three. Four. Five. Six.\nSeven. Eight.'
+        ramped = ramp_up(chunk_text(text), sentences=4)
+        self.assertEqual([sentences for sentences, _ in ramped],
+                         [['Title by Author.'], ['One.'], ['Two.'], ['Three.'], ['Four.', 'Five.', 'Six.'],
+                          ['Seven.', 'Eight.']])
+        self.assertEqual(sum(pause for _, pause in ramped), sum(pause for _, pause in chunk_text(text)) + 3 * 0.15)
+
+
+class PrefetchBufferTest(unittest.TestCase):
+    def test_synthesis_stays_at_most_max_seconds_ahead(self):
+        produced = []
+
+        def chunks():
+            for n in range(10):
+                produced.append(n)
+                yield np.full(SAMPLE_RATE, n, dtype=np.float32)  # one second each
+
+        buffer = PrefetchBuffer(max_seconds=3)
+        thread = threading.Thread(target=buffer.fill, args=(chunks(),))
+        thread.start()
+        received = []
+        for samples in buffer:
+            with buffer.condition:
+                self.assertLessEqual(buffer.seconds, 3)
+            received.append(int(samples[0]))
+        thread.join()
+        self.assertEqual(received, list(range(10)))
+
+    def test_synthesis_errors_are_raised_in_the_writer(self):
+        def chunks():
+            yield np.zeros(10, dtype=np.float32)
+            raise RuntimeError('inference failed')
+
+        buffer = PrefetchBuffer(max_seconds=3)
+        threading.Thread(target=buffer.fill, args=(chunks(),)).start()
+        with self.assertRaisesRegex(RuntimeError, 'inference failed'):
+            list(buffer)
+
+    def test_close_stops_synthesis(self):
+        produced = []
+
+        def chunks():
+            for n in range(100):
+                produced.append(n)
+                yield np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+        buffer = PrefetchBuffer(max_seconds=2)
+        thread = threading.Thread(target=buffer.fill, args=(chunks(),))
+        thread.start()
+        next(iter(buffer))
+        buffer.close()
+        thread.join()
+        self.assertLess(len(produced), 5)
+
+
+class PlaybackClockTest(unittest.TestCase):
+    def test_counts_when_playback_would_run_dry(self):
+        clock = PlaybackClock()
+        clock.arrived(2.0, now=10.0)  # plays until 12
+        clock.arrived(2.0, now=11.0)  # in time, plays until 14
+        clock.arrived(1.0, now=14.5)  # half a second late
+        clock.arrived(1.0, now=15.0)
+        self.assertEqual(clock.underruns, 1)
+        self.assertAlmostEqual(clock.underrun_seconds, 0.5)
+
+
+class PcmStreamTest(unittest.TestCase):
+    def test_wav_file_gets_its_length_when_closed(self):
+        samples = np.sin(np.arange(SAMPLE_RATE) / 10).astype(np.float32) * 0.5
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'stream.wav'
+            stream = PcmStream(open(path, 'wb'))
+            stream.write(samples)
+            stream.write(samples)
+            stream.close()
+            audio, samplerate = sf.read(path)
+        self.assertEqual(samplerate, SAMPLE_RATE)
+        self.assertEqual(len(audio), 2 * SAMPLE_RATE)
+        np.testing.assert_allclose(audio[:SAMPLE_RATE], samples, atol=1e-4)
+        self.assertIsNotNone(stream.first_audio_at)
+
+    def test_raw_pcm_is_16_bit_samples(self):
+        f = io.BytesIO()
+        stream = PcmStream(f, wav=False)
+        stream.write(np.array([0, 0.5, -1, 2], dtype=np.float32))
+        self.assertEqual(np.frombuffer(f.getvalue(), '<i2').tolist(), [0, 16383, -32767, 32767])
@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from audiblez import VoiceStore, voice_names
+
+
+class VoiceStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        rng = np.random.default_rng(0)
+        self.voices = {name: rng.normal(0, 1, (511, 1, 256)).astype(np.float32) for name in ['af_sky', 'bm_george']}
+        self.voices_path = self.dir / 'voices.json'
+        self.voices_path.write_text(json.dumps({name: style.tolist() for name, style in self.voices.items()}))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_converts_once_and_maps_voices(self):
+        store = VoiceStore(self.voices_path, self.dir / 'cache')
+        self.assertEqual(store.names, ['af_sky', 'bm_george'])
+        self.assertEqual(voice_names(self.voices_path), store.names)
+        style = store.get('bm_george')
+        self.assertIsInstance(style, np.memmap)
+        np.testing.assert_array_equal(style, self.voices['bm_george'])
+
+        index_mtime = (store.dir / 'index.json').stat().st_mtime_ns
+        self.assertEqual(VoiceStore(self.voices_path, self.dir / 'cache').dir, store.dir)
+        self.assertEqual((store.dir / 'index.json').stat().st_mtime_ns, index_mtime)
+
+    def test_changed_voices_file_is_converted_again(self):
+        store = VoiceStore(self.voices_path, self.dir / 'cache')
+        self.voices_path.write_text(json.dumps({'af_bella': self.voices['af_sky'].tolist()}))
+        os.utime(self.voices_path, ns=(0, 0))
+        changed = VoiceStore(self.voices_path, self.dir / 'cache')
+        self.assertNotEqual(changed.dir, store.dir)
+        self.assertEqual(changed.names, ['af_bella'])
+        np.testing.assert_array_equal(changed.get('af_bella'), self.voices['af_sky'])